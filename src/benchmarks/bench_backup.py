@@ -0,0 +1,120 @@
+# benchmarks/bench_backup.py
+"""
+Full versus incremental backups over a simulated day of hourly backups: a
+Traveller table is filled once, then every "hour" a few travellers are
+edited and added and a backup is taken both ways from the same snapshot.
+Reports the backup disk usage and the time spent storing the backups
+(snapshotting is the same for both and reported separately).
+
+Run from src/:  python -m benchmarks.bench_backup [rows] [hours] [edits per hour]
+Needs secret.key in the current directory; uses temporary files.
+"""
+import os
+import sys
+import tempfile
+import time
+import zipfile
+from dbcontext import chunk_store
+from dbcontext.connection import get_connection, close_all_connections, snapshot
+from dbcontext.migrations import migrate
+from utils.crypto_utils import encrypt_many
+
+ROWS = 50_000
+HOURS = 24
+EDITS_PER_HOUR = 20
+FIELDS = ("Jane", "Doe", "1990-05-17", "female", "Main Street", "12", "3011AB",
+          "Rotterdam", "jane.doe@example.com", "+31-6-12345678", "AB1234567")
+
+_COLUMNS = ("first_name", "last_name", "birthday", "gender", "street_name", "house_number",
+            "zip_code", "city", "email", "mobile_phone", "driving_license_no")
+
+
+def _insert(conn, n: int) -> None:
+    values, errors = encrypt_many([v for _ in range(n) for v in FIELDS])
+    assert not errors
+    width = len(FIELDS)
+    conn.executemany(
+        f'INSERT INTO Traveller ({", ".join(_COLUMNS)}, registration_date) '
+        f'VALUES ({", ".join("?" * width)}, datetime(\'now\'))',
+        (values[i:i + width] for i in range(0, len(values), width))
+    )
+    conn.commit()
+
+
+def _hour_of_changes(conn, hour: int, edits: int, rows: int) -> None:
+    """Edit `edits` travellers spread over the table and add a few new ones."""
+    emails, _errors = encrypt_many([f"moved{hour}.{i}@example.com" for i in range(edits)])
+    step = max(rows // edits, 1)
+    conn.executemany('UPDATE Traveller SET email = ? WHERE traveller_id = ?',
+                     [(email, 1 + (hour * 7 + i * step) % rows) for i, email in enumerate(emails)])
+    conn.commit()
+    _insert(conn, max(edits // 10, 1))
+
+
+def _dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _dirs, names in os.walk(path) for name in names)
+
+
+def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else ROWS
+    hours = int(sys.argv[2]) if len(sys.argv) > 2 else HOURS
+    edits = int(sys.argv[3]) if len(sys.argv) > 3 else EDITS_PER_HOUR
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "live.db")
+        full_dir = os.path.join(tmp, "full")
+        os.makedirs(full_dir)
+        # Point the chunk store at the temporary directory
+        chunk_store.CHUNK_DIR = os.path.join(tmp, "chunks")
+        chunk_store.INDEX_FILE = os.path.join(chunk_store.CHUNK_DIR, "index.db")
+        manifests = os.path.join(tmp, "manifests")
+        os.makedirs(manifests)
+
+        conn = get_connection(db_path)
+        migrate(conn, progress=lambda _: None)
+        _insert(conn, rows)
+        conn.close()
+
+        snapshot_time = full_time = incremental_time = 0.0
+        new_chunks, incremental_times = [], []
+        for hour in range(hours):
+            if hour:
+                conn = get_connection(db_path)
+                _hour_of_changes(conn, hour, edits, rows)
+                conn.close()
+            snapshot_path = os.path.join(tmp, "snapshot.db")
+            _pages, seconds = snapshot(snapshot_path, db_path)
+            snapshot_time += seconds
+
+            start = time.perf_counter()
+            with zipfile.ZipFile(os.path.join(full_dir, f"{hour}.zip"), 'w', zipfile.ZIP_DEFLATED) as zipf:
+                zipf.write(snapshot_path, arcname="urban_mobility.db")
+            full_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            stats = chunk_store.store_file(snapshot_path, os.path.join(manifests, f"{hour}.manifest"))
+            incremental_times.append(time.perf_counter() - start)
+            new_chunks.append(stats["new_chunks"])
+            os.remove(snapshot_path)
+
+        incremental_time = sum(incremental_times)
+        full_bytes = _dir_size(full_dir)
+        incremental_bytes = _dir_size(chunk_store.CHUNK_DIR) + _dir_size(manifests)
+        close_all_connections(db_path)
+        close_all_connections(chunk_store.INDEX_FILE)
+
+    print(f"{rows} travellers, {hours} hourly backups, {edits} edits per hour; "
+          f"snapshots took {snapshot_time:.2f}s in total")
+    later = max(hours - 1, 1)
+    print(f"chunks written per backup: first {new_chunks[0]}, then on average "
+          f"{sum(new_chunks[1:]) / later:.1f} of {stats['chunks']}; "
+          f"an incremental backup after the first takes {sum(incremental_times[1:]) / later:.3f}s")
+    print(f"{'mode':<12} {'disk bytes':>12} {'store s':>8}")
+    print(f"{'full':<12} {full_bytes:>12} {full_time:>8.2f}")
+    print(f"{'incremental':<12} {incremental_bytes:>12} {incremental_time:>8.2f}")
+    print(f"incremental vs full: {full_bytes / incremental_bytes:.1f}x less disk, "
+          f"{full_time / incremental_time:.1f}x less time")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# benchmarks/bench_codecs.py
+"""
+Backup compression: the single-threaded zip used before versus the chunked
+archive of dbcontext/archive.py, per codec and thread count, on a
+generated database. Reports compression and extraction time and the archive
+size. Encrypted columns hardly compress, so the ratios mostly come from the
+indexes, page headers and free space.
+
+Run from src/:  python -m benchmarks.bench_codecs [rows] [thread counts, e.g. 1,2,4]
+Needs secret.key in the current directory; uses a temporary database.
+"""
+import os
+import sys
+import tempfile
+import time
+import zipfile
+from config import BACKUP_CODEC_LEVELS
+from dbcontext import archive
+from dbcontext.connection import get_connection, close_all_connections, checkpoint
+from dbcontext.migrations import migrate
+from utils.crypto_utils import encrypt_many
+
+ROWS = 100_000
+THREADS = (1, 2, 4)
+FIELDS = ("Jane", "Doe", "1990-05-17", "female", "Main Street", "12", "3011AB",
+          "Rotterdam", "jane.doe@example.com", "+31-6-12345678", "AB1234567")
+
+_COLUMNS = ("first_name", "last_name", "birthday", "gender", "street_name", "house_number",
+            "zip_code", "city", "email", "mobile_phone", "driving_license_no")
+
+
+def _setup(db_path: str, n: int) -> None:
+    """Travellers, written in batches (their search tokens are not part of the database)."""
+    conn = get_connection(db_path)
+    migrate(conn, progress=lambda _: None)
+    width = len(FIELDS)
+    batch = 5000
+    for start in range(0, n, batch):
+        count = min(batch, n - start)
+        values, errors = encrypt_many([v for _ in range(count) for v in FIELDS])
+        assert not errors
+        c = conn.cursor()
+        for i in range(0, len(values), width):
+            c.execute(f'INSERT INTO Traveller ({", ".join(_COLUMNS)}, registration_date) '
+                      f'VALUES ({", ".join("?" * width)}, datetime(\'now\'))', values[i:i + width])
+        conn.commit()
+    conn.close()
+    checkpoint(db_path)
+    close_all_connections(db_path)
+
+
+def _timed(fn, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else ROWS
+    threads = tuple(int(t) for t in sys.argv[2].split(",")) if len(sys.argv) > 2 else THREADS
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "source.db")
+        _setup(db_path, n)
+        size = os.path.getsize(db_path)
+        print(f"{n} travellers, database {size / 2**20:.1f} MiB, {os.cpu_count()} CPUs")
+        print(f"{'format':<22} {'threads':>7} {'compress s':>10} {'MiB/s':>7} {'extract s':>9} {'size %':>7}")
+
+        zip_path = os.path.join(tmp, "backup.zip")
+
+        def _zip():
+            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+                zipf.write(db_path, arcname="urban_mobility.db")
+
+        def _unzip():
+            with zipfile.ZipFile(zip_path) as zipf:
+                zipf.extractall(os.path.join(tmp, "unzipped"))
+
+        seconds = _timed(_zip)
+        print(f"{'zip (before)':<22} {1:>7} {seconds:>10.2f} {size / 2**20 / seconds:>7.0f} "
+              f"{_timed(_unzip):>9.2f} {100 * os.path.getsize(zip_path) / size:>7.1f}")
+
+        archive_path = os.path.join(tmp, "backup.umbak")
+        restored = os.path.join(tmp, "restored.db")
+        for codec in ("zlib", "lzma", "bz2"):
+            for count in threads:
+                seconds = _timed(archive.create_archive, db_path, archive_path, codec=codec, threads=count)
+                extract = _timed(archive.extract_archive, archive_path, restored, threads=count)
+                label = f"{codec} level {BACKUP_CODEC_LEVELS[codec]}"
+                print(f"{label:<22} {count:>7} {seconds:>10.2f} {size / 2**20 / seconds:>7.0f} "
+                      f"{extract:>9.2f} {100 * os.path.getsize(archive_path) / size:>7.1f}")
+        with open(db_path, "rb") as a, open(restored, "rb") as b:
+            assert a.read() == b.read(), "extracted database differs from the source"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# benchmarks/bench_connections.py
+"""
+Per-operation latency of a typical service call (open, one indexed SELECT,
+close) with a fresh sqlite3 connection per call versus the pooled manager.
+
+Run from src/:  python -m benchmarks.bench_connections
+"""
+import os
+import sqlite3
+import tempfile
+import time
+from dbcontext.connection import get_connection, close_all_connections
+
+ITERATIONS = 5000
+
+
+def _setup(db_path: str) -> None:
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE User (user_id INTEGER PRIMARY KEY, username TEXT, role TEXT)')
+    conn.executemany('INSERT INTO User (username, role) VALUES (?, ?)',
+                     [(f"user{i}", "service_engineer") for i in range(1000)])
+    conn.commit()
+    conn.close()
+
+
+def _fresh(db_path: str, user_id: int):
+    conn = sqlite3.connect(db_path)
+    row = conn.execute('SELECT role FROM User WHERE user_id = ?', (user_id,)).fetchone()
+    conn.close()
+    return row
+
+
+def _pooled(db_path: str, user_id: int):
+    conn = get_connection(db_path)
+    row = conn.execute('SELECT role FROM User WHERE user_id = ?', (user_id,)).fetchone()
+    conn.close()
+    return row
+
+
+def _measure(label: str, op, db_path: str) -> float:
+    start = time.perf_counter()
+    for i in range(ITERATIONS):
+        op(db_path, i % 1000 + 1)
+    per_op_us = (time.perf_counter() - start) / ITERATIONS * 1e6
+    print(f"{label:<28} {per_op_us:8.1f} µs/op")
+    return per_op_us
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        _setup(db_path)
+        before = _measure("fresh connection per call", _fresh, db_path)
+        after = _measure("pooled connection", _pooled, db_path)
+        close_all_connections(db_path)
+        print(f"speed-up: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
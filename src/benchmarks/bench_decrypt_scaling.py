@@ -0,0 +1,77 @@
+# benchmarks/bench_decrypt_scaling.py
+"""
+Scaling of the batch decryption API on a full column scan: a 200k-row
+Scooter table is searched for a two-letter term (too short for the trigram
+index, so every brand is decrypted) with 1/2/4/8 workers, for both the
+process and the thread pool.
+
+Run from src/:  python -m benchmarks.bench_decrypt_scaling [rows]
+Needs secret.key in the current directory; uses a temporary database.
+"""
+import os
+import sys
+import tempfile
+import time
+from utils.crypto_utils import encrypt_many, decrypt_many, shutdown_crypto_workers
+from utils.search_index import iter_candidate_batches
+from dbcontext.connection import get_connection, close_all_connections
+from dbcontext.migrations import migrate
+
+ROWS = 200_000
+WORKERS = (1, 2, 4, 8)
+BRANDS = ("Segway", "Ninebot", "Gogoro", "Niu", "Xiaomi")
+
+
+def _setup(db_path: str, n: int) -> None:
+    conn = get_connection(db_path)
+    migrate(conn, progress=lambda _: None)
+    brands, errors = encrypt_many([BRANDS[i % len(BRANDS)] for i in range(n)], workers=1)
+    assert not errors
+    conn.executemany(
+        'INSERT INTO Scooter (brand, model, serial_number) VALUES (?, ?, ?)',
+        ((brand, b"", f"SN{i:08d}") for i, brand in enumerate(brands))
+    )
+    conn.commit()
+    conn.close()
+
+
+def _scan(db_path: str, workers: int, executor: str) -> int:
+    """Full scan of Scooter.brand for a term that never matches; returns rows decrypted."""
+    conn = get_connection(db_path)
+    decrypted = 0
+    try:
+        cursor = conn.cursor()
+        for rows in iter_candidate_batches(cursor, "Scooter", "brand", "Zq", batch_size=10_000):
+            values, errors = decrypt_many([row[1] for row in rows], workers=workers, executor=executor)
+            decrypted += len(values) - len(errors)
+            assert not any(value and "Zq" in value for value in values)
+    finally:
+        conn.close()
+    return decrypted
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else ROWS
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "scaling.db")
+        start = time.perf_counter()
+        _setup(db_path, n)
+        print(f"{n} rows inserted in {time.perf_counter() - start:.1f}s, {os.cpu_count()} CPU(s)")
+
+        baseline = None
+        print(f"{'executor':<8} {'workers':>7} {'seconds':>8} {'rows/s':>9} {'speed-up':>9}")
+        for executor in ("process", "thread"):
+            for workers in WORKERS:
+                if workers > 1:
+                    _scan(db_path, workers, executor)   # warm-up: start the pool
+                start = time.perf_counter()
+                rows = _scan(db_path, workers, executor)
+                seconds = time.perf_counter() - start
+                baseline = baseline or seconds
+                print(f"{executor:<8} {workers:>7} {seconds:>8.2f} {rows / seconds:>9.0f} {baseline / seconds:>8.2f}x")
+        shutdown_crypto_workers()
+        close_all_connections(db_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# benchmarks/bench_hydration.py
+"""
+Cost of turning stored rows into model objects: the old path (decrypt every
+column, then the validating constructor re-encrypts everything) versus
+Model.from_row, which keeps the ciphertext and decrypts on access.
+
+Both "hydrate" (objects only, e.g. counting or passing ids around) and
+"hydrate + read" (every *_plain field read once, e.g. a full listing) are timed.
+
+Run from src/:  python -m benchmarks.bench_hydration [rows]
+"""
+import sys
+import time
+from models.scooter import Scooter
+from models.traveller import Traveller
+from models.user import User
+from utils.crypto_utils import encrypt, decrypt, hash_password
+
+ROWS = 10_000
+
+
+def _scooter_rows(n: int) -> list[tuple]:
+    brand, model = encrypt("Segway"), encrypt("Ninebot Max")
+    return [
+        (i, brand, model, encrypt(f"SN{i:08d}"), 25.0, 500.0, 80.0, 20.0, 90.0,
+         51.92, 4.48, 0, 120.0, "2024-01-15", "2024-01-01")
+        for i in range(n)
+    ]
+
+
+def _user_rows(n: int) -> list[tuple]:
+    password_hash = hash_password("Secret_123!")
+    first, last, role = encrypt("Jane"), encrypt("Doe"), encrypt("service_engineer")
+    return [
+        (i, encrypt(f"user_{i:05d}"), first, last, role, "2024-01-01T10:00:00", password_hash)
+        for i in range(n)
+    ]
+
+
+def _traveller_rows(n: int) -> list[tuple]:
+    values = [encrypt(v) for v in (
+        "Jane", "Doe", "1990-05-17", "female", "Main Street", "12", "3011AB",
+        "Rotterdam", "jane@example.com", "+31-6-12345678", "AB1234567",
+    )]
+    return [(i, *values, "2024-01-01T10:00:00") for i in range(n)]
+
+
+def _old_scooter(row):
+    return Scooter(
+        scooter_id=row[0], brand=decrypt(row[1]), model=decrypt(row[2]),
+        serial_number=decrypt(row[3]), top_speed=row[4], battery_capacity=row[5],
+        state_of_charge=row[6], target_soc_min=row[7], target_soc_max=row[8],
+        location_lat=row[9], location_lon=row[10], out_of_service=bool(row[11]),
+        mileage=row[12], last_maint_date=row[13],
+    )
+
+
+def _old_user(row):
+    user = User(
+        user_id=row[0], username=decrypt(row[1]), first_name=decrypt(row[2]),
+        last_name=decrypt(row[3]), role=decrypt(row[4]), password_hash=row[6],
+    )
+    user.registration_date = row[5]
+    return user
+
+
+def _old_traveller(row):
+    return Traveller(*(decrypt(v) for v in row[1:12]), traveller_id=row[0])
+
+
+def _read_scooter(s):
+    return s.brand_plain, s.model_plain, s.serial_number_plain
+
+
+def _read_user(u):
+    return u.username_plain, u.first_name_plain, u.last_name_plain, u.role_plain
+
+
+def _read_traveller(t):
+    return (t.first_name_plain, t.last_name_plain, t.birthday_plain, t.gender_plain,
+            t.street_name_plain, t.house_number_plain, t.zip_code_plain, t.city_plain,
+            t.email_plain, t.mobile_phone_plain, t.driving_license_no_plain)
+
+
+def _time(fn, rows) -> float:
+    start = time.perf_counter()
+    for row in rows:
+        fn(row)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else ROWS
+    cases = [
+        ("Scooter", _scooter_rows(n), _old_scooter, Scooter.from_row, _read_scooter),
+        ("User", _user_rows(n), _old_user, User.from_row, _read_user),
+        ("Traveller", _traveller_rows(n), _old_traveller, Traveller.from_row, _read_traveller),
+    ]
+    print(f"{n} rows per model")
+    print(f"{'model':<10} {'constructor':>12} {'from_row':>10} {'from_row+read':>14} {'speed-up':>9}")
+    for name, rows, old, new, read in cases:
+        old_s = _time(old, rows)
+        new_s = _time(new, rows)
+        read_s = _time(lambda row: read(new(row)), rows)
+        print(f"{name:<10} {old_s:>11.3f}s {new_s:>9.3f}s {read_s:>13.3f}s {old_s / read_s:>8.1f}x")
+    print("speed-up: constructor path vs from_row with every field read once")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# benchmarks/bench_storage.py
+"""
+Storage cost of text (base64url) versus binary ciphertext: a Traveller table
+is filled in the text form, then converted by migration 7. Reports the
+database size, the size of a zipped backup of it (as backup_service makes)
+and the pages (and time) of a full column scan, before and after. Deflate
+already squeezes most of the base64 overhead out of a backup, so the gain
+there is much smaller than on disk.
+
+Run from src/:  python -m benchmarks.bench_storage [rows]
+Needs secret.key in the current directory; uses a temporary database.
+"""
+import os
+import sys
+import tempfile
+import time
+import zipfile
+from utils import crypto_utils
+from utils.crypto_utils import encrypt_many
+from dbcontext.connection import get_connection, close_all_connections, checkpoint
+from dbcontext.migrations import migrate
+
+ROWS = 50_000
+FIELDS = ("Jane", "Doe", "1990-05-17", "female", "Main Street", "12", "3011AB",
+          "Rotterdam", "jane.doe@example.com", "+31-6-12345678", "AB1234567")
+
+_COLUMNS = ("first_name", "last_name", "birthday", "gender", "street_name", "house_number",
+            "zip_code", "city", "email", "mobile_phone", "driving_license_no")
+
+
+def _setup(db_path: str, n: int) -> None:
+    conn = get_connection(db_path)
+    migrate(conn, progress=lambda _: None)
+    crypto_utils.CIPHERTEXT_STORAGE = "text"
+    try:
+        values, errors = encrypt_many([v for _ in range(n) for v in FIELDS])
+    finally:
+        crypto_utils.CIPHERTEXT_STORAGE = "binary"
+    assert not errors
+    width = len(FIELDS)
+    conn.executemany(
+        f'INSERT INTO Traveller ({", ".join(_COLUMNS)}, registration_date) '
+        f'VALUES ({", ".join("?" * width)}, datetime(\'now\'))',
+        (values[i:i + width] for i in range(0, len(values), width))
+    )
+    conn.commit()
+    conn.close()
+
+
+def _measure(db_path: str, tmp: str) -> tuple[int, int, int, float]:
+    """(database bytes, zipped backup bytes, pages, seconds for a full scan of every encrypted column)."""
+    checkpoint(db_path)
+    zip_path = os.path.join(tmp, "backup.zip")
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        zipf.write(db_path, arcname="data.db")
+    conn = get_connection(db_path)
+    try:
+        pages = conn.execute('PRAGMA page_count').fetchone()[0]
+        start = time.perf_counter()
+        for _row in conn.execute(f'SELECT {", ".join(_COLUMNS)} FROM Traveller'):
+            pass
+        scan = time.perf_counter() - start
+    finally:
+        conn.close()
+    return os.path.getsize(db_path), os.path.getsize(zip_path), pages, scan
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else ROWS
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "storage.db")
+        _setup(db_path, n)
+        text = _measure(db_path, tmp)
+
+        conn = get_connection(db_path)
+        conn.execute('PRAGMA user_version = 6')     # re-run the conversion migration
+        start = time.perf_counter()
+        migrate(conn, progress=lambda _: None)
+        migration = time.perf_counter() - start
+        conn.close()
+        binary = _measure(db_path, tmp)
+        close_all_connections(db_path)
+
+    print(f"{n} travellers, {len(_COLUMNS)} encrypted columns; migration took {migration:.1f}s")
+    print(f"{'storage':<8} {'db bytes':>12} {'backup bytes':>13} {'pages':>8} {'scan s':>8}")
+    for name, (db, backup, pages, scan) in (("text", text), ("binary", binary)):
+        print(f"{name:<8} {db:>12} {backup:>13} {pages:>8} {scan:>8.3f}")
+    print(f"binary vs text: database {100 * (1 - binary[0] / text[0]):.0f}% smaller, "
+          f"backup {100 * (1 - binary[1] / text[1]):.0f}% smaller, "
+          f"{100 * (1 - binary[2] / text[2]):.0f}% fewer pages per full scan")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# benchmarks/check_query_plans.py
+"""
+Guards the hot non-encrypted queries against regressing to full table scans.
+
+Builds a fresh database with the migrations, runs EXPLAIN QUERY PLAN for each
+query below and fails (exit code 1) if any step scans a whole table or index.
+Full listings may only scan an index that already delivers their ORDER BY.
+Keep the queries in sync with the services when changing them.
+
+Run from src/:  python -m benchmarks.check_query_plans
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+from dbcontext.migrations import migrate
+
+# (label, query, parameters, full listing) – copied from the services
+HOT_QUERIES = [
+    ("pending request of an admin for a backup",
+     "SELECT code_id FROM RestoreCode WHERE backup_id = ? AND system_admin_user_id = ? AND status = ?",
+     (1, 1, 'pending'), False),
+    ("unused codes of an admin",
+     "SELECT code_id, code, backup_id FROM RestoreCode WHERE system_admin_user_id = ? AND status = ?",
+     (1, 'issued'), False),
+    ("codes of a backup",
+     "SELECT code_id FROM RestoreCode WHERE backup_id = ?",
+     (1,), False),
+    ("all pending requests",
+     """SELECT rc.code_id, b.backup_date, u.first_name
+        FROM RestoreCode rc
+        JOIN Backup b ON rc.backup_id = b.backup_id
+        JOIN User u ON rc.system_admin_user_id = u.user_id
+        WHERE rc.status = ?
+        ORDER BY rc.generated_date ASC""",
+     ('pending',), False),
+    ("pending requests of an admin",
+     """SELECT rc.code_id, b.backup_date
+        FROM RestoreCode rc
+        JOIN Backup b ON rc.backup_id = b.backup_id
+        WHERE rc.system_admin_user_id = ? AND rc.status = ?
+        ORDER BY rc.generated_date ASC""",
+     (1, 'pending'), False),
+    ("backup list, newest first",
+     """SELECT b.backup_id, u.first_name
+        FROM Backup b
+        LEFT JOIN User u ON b.created_by_user_id = u.user_id
+        ORDER BY b.backup_date DESC""",
+     (), True),
+    ("reset code of a user",
+     "SELECT code, created_at FROM TempCodes WHERE user_id = ?",
+     (1,), False),
+    ("scooters below a charge level",
+     "SELECT scooter_id FROM Scooter WHERE state_of_charge < ?",
+     (20,), False),
+    ("out-of-service scooters by charge",
+     "SELECT scooter_id FROM Scooter WHERE out_of_service = ? ORDER BY state_of_charge",
+     (1,), False),
+    ("username lookup",
+     "SELECT user_id FROM User WHERE username_bidx = ?",
+     ('0' * 64,), False),
+    ("users with a role",
+     "SELECT user_id FROM User WHERE role IN (?, ?)",
+     (b'\x90', b'\x91'), False),
+    ("travellers in a city",
+     "SELECT traveller_id FROM Traveller WHERE city IN (?, ?) ORDER BY traveller_id",
+     (b'\x90', b'\x91'), False),
+    ("travellers per city",
+     "SELECT city, COUNT(*) FROM Traveller GROUP BY city",
+     (), True),
+]
+
+
+def full_scans(conn, query: str, params, full_listing: bool = False) -> list[str]:
+    """Plan steps that read a whole table or index (or sort) instead of seeking."""
+    plan = conn.execute(f'EXPLAIN QUERY PLAN {query}', params).fetchall()
+    bad = []
+    for row in plan:
+        detail = row[-1]
+        if full_listing:
+            uses_index = 'USING INDEX' in detail or 'USING COVERING INDEX' in detail
+            if (detail.startswith('SCAN') and not uses_index) or 'TEMP B-TREE' in detail:
+                bad.append(detail)
+        elif detail.startswith('SCAN'):
+            bad.append(detail)
+    return bad
+
+
+def main() -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'plans.db'))
+        migrate(conn, progress=lambda _: None)
+        failures = 0
+        for label, query, params, full_listing in HOT_QUERIES:
+            bad = full_scans(conn, query, params, full_listing)
+            print(f"{'FAIL' if bad else 'ok  '}  {label}" + (f": {'; '.join(bad)}" if bad else ""))
+            failures += bool(bad)
+        conn.close()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -13,8 +13,107 @@ PROJECT_ROOT = os.path.abspath(os.path.join(SRC_FOLDER, '..'))
 # Database file path
 DB_FILE = os.path.join(SRC_FOLDER, 'urban_mobility.db')
 
+# Connection pool (dbcontext/connection.py): max open connections per database
+# file, and how long (seconds) to wait for a free one
+DB_POOL_SIZE = 8
+DB_POOL_TIMEOUT = 30
+
+# SQLite performance profile applied to every connection (see PERFORMANCE_PROFILES
+# in dbcontext/connection.py): "safe" (WAL, fsync on every commit) or
+# "throughput" (WAL, fewer fsyncs, larger cache and memory-mapped I/O)
+DB_PERFORMANCE_PROFILE = "safe"
+# Optional per-pragma overrides on top of the profile, e.g. {"cache_size": -32000}
+DB_PRAGMA_OVERRIDES = {}
+
 # Log file path
 LOG_FILE = os.path.join(SRC_FOLDER, 'activity.log')
 
+# Log head record (last id, byte offset, last suspicious id) kept next to the log
+LOG_HEAD_FILE = os.path.join(SRC_FOLDER, 'activity.log.head')
+
+# Audit log writer: "sync" appends on the caller's thread, "background" queues
+# entries for a writer thread that appends them in batches (group commit)
+LOG_WRITER_MODE = "sync"
+
+# Durability of background writes: "entry" (fsync as soon as an entry is queued),
+# "interval" (fsync at most every LOG_FLUSH_INTERVAL_MS) or "shutdown" (fsync on flush/exit only)
+LOG_DURABILITY = "interval"
+LOG_FLUSH_INTERVAL_MS = 200
+
 # Backup directory
 BACKUP_DIR = os.path.join(SRC_FOLDER, 'backups')
+
+# Online backup (dbcontext.connection.snapshot): database pages copied per step, and
+# the pause between steps that lets concurrent writers in
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_PAUSE_MS = 5
+
+# Backup format: "incremental" (the snapshot is cut into BACKUP_CHUNK_SIZE chunks kept once in
+# a content-addressed store, see dbcontext/chunk_store.py; a backup is a manifest of chunk
+# hashes) or "full" (one archive per backup). Every kind can always be restored.
+BACKUP_MODE = "incremental"
+# Chunk size: a multiple of the page size (4 KiB by default). Smaller chunks share more
+# between backups, larger ones mean fewer files in the store.
+BACKUP_CHUNK_SIZE = 16 * 1024
+
+# Full backups (BACKUP_MODE = "full") are written as a seekable chunked archive
+# (dbcontext/archive.py): codec "zlib", "lzma", "bz2" or "none", the level of each
+# codec, the threads compressing (and on restore decompressing) chunks, and the chunk size
+BACKUP_CODEC = "zlib"
+BACKUP_CODEC_LEVELS = {"zlib": 6, "lzma": 6, "bz2": 9}
+BACKUP_COMPRESSION_THREADS = min(4, os.cpu_count() or 1)
+BACKUP_ARCHIVE_CHUNK_SIZE = 1024 * 1024
+
+# Opt-in LRU cache of decrypted values in crypto_utils.decrypt, bounded by entry
+# count and by approximate memory; cleared on logout and when the key changes
+DECRYPT_CACHE_ENABLED = False
+DECRYPT_CACHE_MAX_ENTRIES = 10_000
+DECRYPT_CACHE_MAX_BYTES = 8 * 1024 * 1024
+
+# Cipher for newly written encrypted values (see utils/ciphers.py): "aesgcm" (AES-256-GCM,
+# compact, versioned) or "fernet" (the original format). Both are always readable.
+FIELD_CIPHER = "aesgcm"
+
+# How ciphertext is stored in the database: "binary" (raw bytes in BLOB columns, a
+# third smaller) or "text" (base64url, as Fernet tokens are). Both are always readable;
+# the activity log is line based and always uses the text form.
+CIPHERTEXT_STORAGE = "binary"
+
+# Columns encrypted deterministically (AES-SIV, see utils/ciphers.py): equal values give
+# equal ciphertext, so SQLite can filter (=, IN), GROUP BY and index them without
+# decrypting. That also reveals which rows share a value, so only list columns whose
+# values come from a small public whitelist. After changing this, run
+# `python -m dbcontext.reencrypt` to convert the stored values.
+DETERMINISTIC_COLUMNS = {
+    "Traveller": ("gender", "city"),      # GENDER_CHOICES, CITY_CHOICES
+    "User": ("role",),                    # the three roles
+}
+
+# Key ring of the AES-GCM field cipher (key id -> key, plus the active id), written
+# by crypto_utils.rotate_key(). Key id 0 is derived from secret.key and needs no entry.
+KEYRING_FILE = os.path.join(SRC_FOLDER, 'keyring.key')
+
+# Per-traveller data keys (envelope encryption, dbcontext/data_keys.py), wrapped with the
+# key ring. Kept out of the database file, so backups never contain them: deleting a key
+# makes that traveller unreadable in every backup too, except for the columns listed in
+# DETERMINISTIC_COLUMNS, which use the key ring. Back this file up separately.
+DATA_KEYS_FILE = os.path.join(SRC_FOLDER, 'data_keys.db')
+
+# Search tokens of the travellers (dbcontext/traveller_index.py), also kept out of the
+# database file and so out of backups: they are keyed hashes of trigrams, from which the
+# indexed fields could be recovered. Rebuilt from the travellers when missing.
+TRAVELLER_INDEX_FILE = os.path.join(SRC_FOLDER, 'traveller_index.db')
+
+# Background key rotation (dbcontext/key_rotation.py): rows re-encrypted per
+# committed batch, and the pause between batches that leaves room for interactive use
+KEY_ROTATION_BATCH_SIZE = 200
+KEY_ROTATION_PAUSE_MS = 20
+
+# Batch crypto (crypto_utils.decrypt_many / encrypt_many) used by the scan paths:
+# number of workers (1 = inline), "process" or "thread" pool, items per task
+CRYPTO_WORKERS = 1
+CRYPTO_EXECUTOR = "process"
+CRYPTO_CHUNK_SIZE = 1000
+
+# Key used for blind indexes (HMAC lookups over encrypted columns)
+BLIND_INDEX_KEY_FILE = os.path.join(SRC_FOLDER, 'blind_index.key')
@@ -21,6 +21,12 @@ class BackupController:
         """Get a list of all backups."""
         return backup_service.get_backup_list()
     
+    @staticmethod
+    @require_role("system_admin", "super")
+    def is_backup_current(user_id: int) -> Tuple[bool, str]:
+        """Check whether the latest backup holds the current data."""
+        return backup_service.is_backup_current()
+
     @staticmethod
     @log_action("Create restore request -> {msg}")
     @require_role("system_admin")
@@ -76,4 +82,17 @@ class BackupController:
     @require_role("system_admin")
     def get_user_pending_requests(system_admin_user_id: int) -> List[Dict[str, Any]]:
         """Get pending restore requests for a specific system admin."""
-        return backup_service.get_user_pending_requests(system_admin_user_id) 
\ No newline at end of file
+        return backup_service.get_user_pending_requests(system_admin_user_id)
+
+    @staticmethod
+    @log_action("Start key rotation -> {msg}")
+    @require_role("super")
+    def start_key_rotation(user_id: int) -> Tuple[bool, str]:
+        """Rotate the field encryption key (super admin only)."""
+        return backup_service.start_key_rotation()
+
+    @staticmethod
+    @require_role("super")
+    def get_key_rotation_status(user_id: int) -> Optional[Dict[str, Any]]:
+        """Progress of the current or last key rotation (super admin only)."""
+        return backup_service.get_key_rotation_status()
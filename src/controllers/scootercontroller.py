@@ -53,8 +53,8 @@ class ScooterController:
     @log_action("Service scooter -> {msg}") 
     @require_role("service_engineer")
     def service_scooter(user_id: int, scooter_id: int, update_data: Scooter) -> tuple[bool, str]:
-        user = user_service.get_user_by_id(user_id)
-        if user.role_plain != "service_engineer":
+        user = user_service.get_principal(user_id)
+        if not user or user.role != "service_engineer":
             return False, "Unauthorized: Only service engineer can use this function"
 
         allowed_fields = {
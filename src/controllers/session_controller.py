@@ -3,7 +3,7 @@
 from services.session_service import SessionService
 from services.userservice import user_service
 from typing import Tuple
-from models.user import User
+from models.principal import Principal
 
 class SessionController:
     """Controller layer for session operations."""
@@ -19,12 +19,16 @@ class SessionController:
         """Logout current user."""
         self._session_service.logout()
     
+    def refresh_current_user(self) -> bool:
+        """Reload the current user's session details after an account edit."""
+        return self._session_service.refresh_current_user()
+    
     def is_authenticated(self) -> bool:
         """Check if user is currently authenticated."""
         return self._session_service.is_authenticated()
     
-    def get_current_user(self) -> User:
-        """Get current user object."""
+    def get_current_user(self) -> Principal:
+        """Get the principal (id, username, role) of the current user."""
         return self._session_service.get_current_user()
     
     def get_current_user_id(self) -> int:
@@ -7,7 +7,7 @@ from utils.log_decorator import log_action
 
 
 class TravellerController:
-    """Controller layer for Traveller operations (add/update/delete/search).
+    """Controller layer for Traveller operations (add/update/delete/erase/search).
     Only *super* and *system_admin* roles can invoke these endpoints.
     """
     @staticmethod
@@ -31,6 +31,13 @@ class TravellerController:
         """Remove a traveller record."""
         return traveller_service.delete_traveller(traveller_id)
 
+    @staticmethod
+    @log_action("Erase travellers -> {msg}")
+    @require_role("system_admin", "super")
+    def erase_travellers_controller(current_user_id: int, traveller_ids):
+        """Erase traveller records for good (crypto-shredded, also in old backups)."""
+        return traveller_service.erase_travellers(traveller_ids)
+
     @staticmethod
     @log_action("Search travellers -> {msg}") 
     @require_role("system_admin", "super")
@@ -2,6 +2,7 @@
 
 from models.user import User
 from services.userservice import user_service
+from utils.validation import validate_password
 from utils.role_utils import require_role
 from controllers.session_controller import session_controller
 from utils.log_decorator import log_action
@@ -29,15 +30,11 @@ class UserController:
     @require_role("system_admin", "super")
     def add_user(user_id: int, username: str, password: str, first_name: str, last_name: str, role: str) -> Tuple[bool, str]:
         """Add a new user to the system."""
-        # Check permissions - handle super admin case
-        if user_id == 0:
-            # Super admin case - can add any role
-            current_user_role = "super"
-        else:
-            current_user = user_service.get_user_by_id(user_id)
-            if not current_user:
-                return False, "Current user not found."
-            current_user_role = current_user.role_plain
+        # Check permissions (the principal of user id 0 is the super admin)
+        current_user = user_service.get_principal(user_id)
+        if not current_user:
+            return False, "Current user not found."
+        current_user_role = current_user.role
 
         # System admin can only add service_engineer roles
         if current_user_role == "system_admin":
@@ -68,34 +65,27 @@ class UserController:
         """Update user information."""
         # Validate updates using User model
         if "password" in updates:
-            new_password = updates["password"]
-            user = user_service.get_user_by_id(target_user_id)
-            if not user:
+            if not user_service.get_principal(target_user_id):
                 return False, "User not found."
 
-            # Validate new password using User model
-            try:
-                User(username=user.username_plain, password_plain=new_password, role=user.role_plain)
-            except ValueError as e:
-                return False, str(e)
+            # Validate the new password (rules only: hashing it here would be wasted)
+            valid, msg = validate_password(updates["password"])
+            if not valid:
+                return False, msg
 
-        # Check permissions - handle super admin case
-        if user_id == 0:
-            # Super admin case - can update anyone
-            current_user_role = "super"
-        else:
-            current_user = user_service.get_user_by_id(user_id)
-            if not current_user:
-                return False, "Current user not found."
-            current_user_role = current_user.role_plain
+        # Check permissions (the principal of user id 0 is the super admin)
+        current_user = user_service.get_principal(user_id)
+        if not current_user:
+            return False, "Current user not found."
+        current_user_role = current_user.role
 
         if current_user_role == "system_admin":
-            target_user = user_service.get_user_by_id(target_user_id)
+            target_user = user_service.get_principal(target_user_id)
             if not target_user:
                 return False, "User not found."
             
             # System admin can only update service_engineer, NOT other system_admins or super admins
-            if target_user.role_plain != "service_engineer":
+            if target_user.role != "service_engineer":
                 return False, "System admins can only update service engineers."
             
             # Check if trying to escalate the target user's role
@@ -107,8 +97,7 @@ class UserController:
         else:
             # Super admin can update anyone, but check for self privilege escalation
             if user_id != 0 and target_user_id == user_id and "role" in updates:
-                current_user = user_service.get_user_by_id(user_id)
-                if current_user and updates["role"] != current_user.role_plain:
+                if updates["role"] != current_user.role:
                     return False, "Users cannot change their own role."
             
             return user_service.update_user(target_user_id, **updates)
@@ -121,22 +110,18 @@ class UserController:
     @require_role("system_admin", "super")
     def delete_user(user_id: int, target_user_id: int, username: str) -> Tuple[bool, str]:
         """Delete a user from the system."""
-        # Check permissions - handle super admin case
-        if user_id == 0:
-            # Super admin case - can delete anyone
-            current_user_role = "super"
-        else:
-            current_user = user_service.get_user_by_id(user_id)
-            if not current_user:
-                return False, "Current user not found."
-            current_user_role = current_user.role_plain
+        # Check permissions (the principal of user id 0 is the super admin)
+        current_user = user_service.get_principal(user_id)
+        if not current_user:
+            return False, "Current user not found."
+        current_user_role = current_user.role
 
         if current_user_role == "system_admin" or user_id == target_user_id:
-            target_user = user_service.get_user_by_id(target_user_id)
+            target_user = user_service.get_principal(target_user_id)
             if not target_user:
                 return False, "User not found."
             # System admin can only delete service_engineer, NOT other system_admins or themselves
-            if target_user.role_plain == "service_engineer":
+            if target_user.role == "service_engineer":
                 return user_service.delete_user(target_user_id, username)
             else:
                 return False, "System admins can only delete service engineers."
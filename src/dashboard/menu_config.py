@@ -10,6 +10,8 @@ from dashboard.menus.backup_management_menu import (
     restore_direct_flow,
     view_my_codes_flow
 )
+from dashboard.menus.key_rotation_menu import key_rotation_flow
+from dashboard.menus.current_backup_menu import current_backup_flow
 from dashboard.dashboard import build_menu_with_roles_and_permissions, display_menu
 from dashboard.menus.logmenu import view_logs_flow
 
@@ -36,6 +38,7 @@ from dashboard.menus.travellermenu import (
     add_traveller_flow,
     update_traveller_flow,
     delete_traveller_flow,
+    erase_travellers_flow,
     search_traveller_flow
 )
 
@@ -94,6 +97,9 @@ def get_menu_traveller_management(session):
         ("Delete Traveller", ("system_admin", "super"),
          None, lambda: delete_traveller_flow(session)),
 
+        ("Erase Travellers", ("system_admin", "super"),
+         None, lambda: erase_travellers_flow(session)),
+
         ("Search Travellers", ("system_admin", "super"),
          None, lambda: search_traveller_flow(session)),
 
@@ -220,6 +226,8 @@ def get_menu_backup_management(session):
     return [
         ("Create Database Backup", ("system_admin", "super"), None, lambda: backup_db_flow(session)),
 
+        ("Is the Backup Current?", ("system_admin", "super"), None, lambda: current_backup_flow(session)),
+
         ("Request Backup Restore", ("system_admin"), None, lambda: request_backup_restore_flow(session)),
 
         ("Generate Restore Code", ("super"), None, lambda: generate_restore_code_flow(session)),
@@ -230,6 +238,8 @@ def get_menu_backup_management(session):
         
         ("View My Restore Codes", ("system_admin"), None, lambda: view_my_codes_flow(session)),
 
+        ("Rotate Encryption Key", ("super"), None, lambda: key_rotation_flow(session)),
+
         ("Back", None, None, lambda: None)
     ]
 
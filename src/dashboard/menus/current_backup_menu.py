@@ -0,0 +1,13 @@
+from services.session_service import session_service
+from controllers.backupcontroller import BackupController
+
+
+def current_backup_flow(session):
+    """Check whether the latest backup holds the current data (system admin and super admin)."""
+    print("\n=== Is the Backup Current? ===")
+    user_id = session_service.get_current_user_id()
+    current, message = BackupController.is_backup_current(user_id)
+    print(message)
+    if not current:
+        print("Create a database backup to include these changes.")
+    input("\nPress Enter to continue...")
@@ -0,0 +1,53 @@
+import sys
+sys.path.append('../../')
+from services.session_service import session_service
+from controllers.backupcontroller import BackupController
+
+
+def key_rotation_flow(session):
+    """Show key rotation progress and start a new rotation (super admin only)."""
+    user_id = session_service.get_current_user_id()
+    user = session_service.get_current_user()
+
+    if user.role_plain != 'super':
+        print("Only super admins can rotate the encryption key.")
+        input("\nPress Enter to continue...")
+        return
+
+    print("\n=== Encryption Key Rotation ===")
+
+    status = BackupController.get_key_rotation_status(user_id)
+    if isinstance(status, tuple):
+        print(status[1])
+        input("\nPress Enter to continue...")
+        return
+
+    if status:
+        state = "running" if status['running'] else ("finished" if status['done'] else "paused")
+        print(f"Last rotation to key {status['key_id']}: {state}")
+        if status['error']:
+            print(f"Error: {status['error']}")
+        print(f"{'Target':<15} {'Progress':>9} {'Processed':>10} {'Re-encrypted':>13}")
+        print("-" * 50)
+        for target, t in status['targets'].items():
+            percent = f"{t['percent']:.0f}%"
+            print(f"{target:<15} {percent:>9} {t['processed']:>10} {t['changed']:>13}")
+        if status['running']:
+            print(f"\nThroughput: {status['throughput']:.0f} rows/s")
+            input("\nPress Enter to continue...")
+            return
+    else:
+        print("The encryption key has never been rotated.")
+
+    print("\nA new key is used for all new data at once; existing data is")
+    print("re-encrypted in the background while the system stays in use.")
+    confirm = input("Rotate the encryption key now? (yes/no): ").lower()
+    if confirm != 'yes':
+        print("Key rotation cancelled.")
+        input("\nPress Enter to continue...")
+        return
+
+    success, message = BackupController.start_key_rotation(user_id)
+    print(f"\n{message}")
+
+    input("\nPress Enter to continue...")
@@ -3,20 +3,30 @@ from services.log_service import read_logs
 from controllers.session_controller import session_controller
 from services.log_service import mark_logs_read
 
+PAGE_SIZE = 100
+
 def view_logs_flow(session):
-    print("\n=== System Logs (latest 100) ===")
-    logs = read_logs(limit=100)
+    offset = 0
+    while True:
+        print(f"\n=== System Logs (latest {offset + 1}-{offset + PAGE_SIZE}) ===")
+        logs = read_logs(limit=PAGE_SIZE, offset=offset)   # read from the end of the log, one page only
+
+        if not logs:
+            print("No log entries yet." if offset == 0 else "No older log entries.")
+        else:
+            print("ID  | Date       | Time     | Username     |  ⚠  |   additional  | Description")
+            print("-" * 90)
+            for e in logs:
+                flag = "⚠" if e.suspicious else " "
+                print(f"{e.log_id:>3} | {e.date} | {e.time} | {e.username:<12} |  {flag:<1}  | {e.additional:<13} | {e.description}")
 
-    if not logs:
-        print("No log entries yet.")
-    else:
-        print("ID  | Date       | Time     | Username     |  ⚠  |   additional  | Description")
-        print("-" * 90)
-        for e in logs:
-            flag = "⚠" if e.suspicious else " "
-            print(f"{e.log_id:>3} | {e.date} | {e.time} | {e.username:<12} |  {flag:<1}  | {e.additional:<13} | {e.description}")
+        if offset == 0 and session_controller.get_current_role() in ("system_admin", "super"):
+            mark_logs_read(session_controller.get_current_user_id())
 
-    if session_controller.get_current_role() in ("system_admin", "super"):
-        mark_logs_read(session_controller.get_current_user_id())
+        if len(logs) < PAGE_SIZE:
+            break
+        if input("\nType 'n' for older entries or press Enter to continue: ").lower() != "n":
+            return
+        offset += PAGE_SIZE
 
-    input("\nPress Enter to continue...")
\ No newline at end of file
+    input("\nPress Enter to continue...")
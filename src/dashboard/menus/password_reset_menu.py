@@ -29,12 +29,9 @@ def reset_password_flow(session):
             continue
         
         current_user_id = session_controller.get_current_user_id()
-        # Special-case for hardcoded super admin
-        if current_user_id == 0:
-            current_role = 'super'
-        else:
-            current_user = user_service.get_user_by_id(current_user_id)
-            current_role = current_user.role_plain if current_user else None
+        # The principal of user id 0 is the hard-coded super admin
+        current_user = user_service.get_principal(current_user_id)
+        current_role = current_user.role if current_user else None
 
         # Permission logic
         if current_role == 'system_admin':
@@ -78,11 +75,10 @@ def use_reset_code_flow(user_id):
         return False
     
     # Get previous password hash (if any)
-    conn = user_service._get_connection()
-    c = conn.cursor()
-    c.execute('SELECT password_hash FROM User WHERE user_id = ?', (user_id,))
-    row = c.fetchone()
-    conn.close()
+    with user_service._get_connection() as conn:
+        c = conn.cursor()
+        c.execute('SELECT password_hash FROM User WHERE user_id = ?', (user_id,))
+        row = c.fetchone()
     prev_hash = row[0] if row else None
     
     # Loop for new password entry/verification
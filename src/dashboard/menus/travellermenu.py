@@ -241,6 +241,45 @@ def delete_traveller_flow(session) -> None:
     else:
         input("Deletion cancelled. Press Enter to continue...")
 
+def erase_travellers_flow(session) -> None:
+    """
+    Erase several travellers for good (their data keys are shredded, so they
+    cannot be recovered from older backups either).
+
+    Args:
+        session: The current user session (not used directly here)
+
+    Returns:
+        None. Prints feedback to the console.
+    """
+    print("\n=== Erase Travellers ===")
+
+    user_input = input("Enter Traveller IDs to erase, separated by commas (leave blank to cancel): ")
+
+    if user_input.strip() == "":
+        print("Erasure cancelled.")
+        input("Press Enter to continue...")
+        return
+
+    parts = [part.strip() for part in user_input.split(",") if part.strip()]
+    if not all(part.isdigit() for part in parts):
+        print("Invalid input. Please enter numbers separated by commas.")
+        input("Press Enter to continue...")
+        return
+
+    traveller_ids = [int(part) for part in parts]
+    print("Erased travellers cannot be restored, not even from a backup.")
+    confirm = input("Type 'yes' to confirm: ")
+    if confirm == "yes":
+        current_user_id = session_controller.get_current_user_id()
+        ok, msg = TravellerController.erase_travellers_controller(
+            current_user_id, traveller_ids
+        )
+        print(msg if ok else f"Error: {msg}")
+        input("Press Enter to continue...")
+    else:
+        input("Erasure cancelled. Press Enter to continue...")
+
 def search_traveller_flow(session) -> None:
     """
     Search travellers by a free text key.
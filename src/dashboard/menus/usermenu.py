@@ -310,10 +310,5 @@ def edit_account_flow(session):
             print(message)
             input("\nPress Enter to continue...")
             if success:
-                # Optionally refresh session info if username was changed
-                if "username" in updates:
-                    session_controller._current_username = updates["username"]
-                if "first_name" in updates:
-                    session_controller._current_user.first_name = updates["first_name"]
-                if "last_name" in updates:
-                    session_controller._current_user.last_name = updates["last_name"]
+                # The session shows the new username from now on
+                session_controller.refresh_current_user()
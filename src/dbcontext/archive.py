@@ -0,0 +1,165 @@
+# dbcontext/archive.py
+"""
+Seekable, chunked backup archive with pluggable codecs, compressed and
+decompressed on a thread pool.
+
+The file is cut into BACKUP_ARCHIVE_CHUNK_SIZE chunks that are compressed
+independently, so they can be spread over threads (zlib, lzma and bz2 all
+release the GIL while they work) and any chunk can be read on its own.
+
+Layout (integers little-endian):
+    header   MAGIC, codec id (1 byte), chunk size (u32), original size (u64)
+    frames   the compressed chunks, back to back
+    index    per chunk: offset (u64), compressed size (u32), crc32 of the original (u32)
+    footer   index offset (u64), chunk count (u32), MAGIC
+
+Run from src/:  python -m dbcontext.archive <archive>   (lists the archive)
+"""
+import bz2
+import lzma
+import os
+import struct
+import sys
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from config import BACKUP_CODEC, BACKUP_CODEC_LEVELS, BACKUP_COMPRESSION_THREADS, BACKUP_ARCHIVE_CHUNK_SIZE
+
+ARCHIVE_SUFFIX = ".umbak"
+MAGIC = b"UMBAK\x01"
+_HEADER = struct.Struct("<6sBIQ")
+_ENTRY = struct.Struct("<QII")
+_FOOTER = struct.Struct("<QI6s")
+
+
+def _lzma_compress(data: bytes, level: int) -> bytes:
+    return lzma.compress(data, preset=level)
+
+
+# name -> (id stored in the archive, compress(data, level), decompress(data))
+CODECS = {
+    "none": (0, lambda data, _level: data, lambda data: data),
+    "zlib": (1, zlib.compress, zlib.decompress),
+    "lzma": (2, _lzma_compress, lzma.decompress),
+    "bz2": (3, bz2.compress, bz2.decompress),
+}
+_BY_ID = {codec_id: name for name, (codec_id, _c, _d) in CODECS.items()}
+
+
+def is_archive(path: str) -> bool:
+    return path.endswith(ARCHIVE_SUFFIX)
+
+
+def _pipeline(pool: ThreadPoolExecutor, fn, items, window: int):
+    """fn(item) for every item on `pool`, results in order, at most `window` in flight."""
+    pending = []
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.pop(0).result()
+    for future in pending:
+        yield future.result()
+
+
+def _read_chunks(f, chunk_size: int):
+    while chunk := f.read(chunk_size):
+        yield chunk
+
+
+def create_archive(source_path: str, archive_path: str, codec: str = BACKUP_CODEC,
+                   level: Optional[int] = None, threads: int = BACKUP_COMPRESSION_THREADS,
+                   chunk_size: int = BACKUP_ARCHIVE_CHUNK_SIZE) -> dict:
+    """
+    Compress `source_path` into a new archive at `archive_path`.
+    Returns statistics: codec, chunks, bytes (original) and archive_bytes.
+    """
+    if codec not in CODECS:
+        raise ValueError(f"Unknown backup codec: {codec}")
+    codec_id, compress, _decompress = CODECS[codec]
+    level = BACKUP_CODEC_LEVELS.get(codec, 6) if level is None else level
+
+    def _compress(chunk: bytes) -> tuple[bytes, int]:
+        return compress(chunk, level), zlib.crc32(chunk)
+
+    size = os.path.getsize(source_path)
+    index = []
+    tmp = archive_path + ".tmp"
+    try:
+        with open(source_path, "rb") as src, open(tmp, "wb") as out, \
+                ThreadPoolExecutor(max_workers=max(threads, 1)) as pool:
+            out.write(_HEADER.pack(MAGIC, codec_id, chunk_size, size))
+            for data, crc in _pipeline(pool, _compress, _read_chunks(src, chunk_size), 2 * max(threads, 1)):
+                index.append((out.tell(), len(data), crc))
+                out.write(data)
+            index_offset = out.tell()
+            for entry in index:
+                out.write(_ENTRY.pack(*entry))
+            out.write(_FOOTER.pack(index_offset, len(index), MAGIC))
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, archive_path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return {"codec": codec, "chunks": len(index), "bytes": size, "archive_bytes": os.path.getsize(archive_path)}
+
+
+def read_index(archive_path: str) -> tuple[str, int, int, list[tuple[int, int, int]]]:
+    """(codec, chunk size, original size, [(offset, compressed size, crc32), ...]) of an archive."""
+    with open(archive_path, "rb") as f:
+        magic, codec_id, chunk_size, size = _HEADER.unpack(f.read(_HEADER.size))
+        f.seek(-_FOOTER.size, os.SEEK_END)
+        index_offset, count, end_magic = _FOOTER.unpack(f.read(_FOOTER.size))
+        if magic != MAGIC or end_magic != MAGIC or codec_id not in _BY_ID:
+            raise ValueError("Not a backup archive (or an unsupported version)")
+        f.seek(index_offset)
+        raw = f.read(count * _ENTRY.size)
+    if len(raw) != count * _ENTRY.size:
+        raise ValueError("Backup archive is truncated")
+    return _BY_ID[codec_id], chunk_size, size, list(_ENTRY.iter_unpack(raw))
+
+
+def extract_archive(archive_path: str, dest_path: str, threads: int = BACKUP_COMPRESSION_THREADS) -> int:
+    """
+    Decompress an archive to `dest_path` on `threads` threads, checking every
+    chunk. The file is assembled next to `dest_path` and renamed over it at
+    the end. Returns the bytes written.
+    """
+    codec, _chunk_size, size, index = read_index(archive_path)
+    decompress = CODECS[codec][2]
+
+    def _frames(f):
+        for offset, length, crc in index:
+            f.seek(offset)
+            yield offset, f.read(length), crc
+
+    def _extract(frame: tuple[int, bytes, int]) -> bytes:
+        offset, data, crc = frame
+        chunk = decompress(data)
+        if zlib.crc32(chunk) != crc:
+            raise ValueError(f"Backup archive chunk at offset {offset} is corrupted")
+        return chunk
+
+    tmp = dest_path + ".restore"
+    written = 0
+    try:
+        with open(archive_path, "rb") as f, open(tmp, "wb") as out, \
+                ThreadPoolExecutor(max_workers=max(threads, 1)) as pool:
+            for chunk in _pipeline(pool, _extract, _frames(f), 2 * max(threads, 1)):
+                out.write(chunk)
+                written += len(chunk)
+            out.flush()
+            os.fsync(out.fileno())
+        if written != size:
+            raise ValueError("Backup archive is incomplete: extracted size does not match")
+        os.replace(tmp, dest_path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return written
+
+
+if __name__ == "__main__":
+    codec, chunk_size, size, index = read_index(sys.argv[1])
+    stored = sum(length for _offset, length, _crc in index)
+    print(f"{codec}, {len(index)} chunks of {chunk_size} bytes, {size} -> {stored} bytes")
@@ -0,0 +1,60 @@
+# dbcontext/change_tracking.py
+"""
+Per-table change counters, so "has anything changed since the last backup?"
+is answered by reading a few integers instead of comparing database files.
+
+Every tracked table has a row in TableChanges. Triggers created by
+install_triggers() add one to its `changes` for every inserted, updated or
+deleted row, so all writes are counted whatever code makes them: services,
+migrations, key rotation, even the sqlite3 shell. A table's digest is
+"<generation>:<changes>". The generation is a random token that
+new_generation() renews after a restore. A restored database starts again
+from older counts, and a new token keeps them from matching the digests of
+backups taken before the restore.
+
+Backup and RestoreCode are not tracked. They record the backups themselves,
+so they change with every backup, and that change alone is no reason to take
+another one.
+"""
+from typing import Dict, List
+
+UNTRACKED_TABLES = ("Backup", "RestoreCode", "TableChanges")
+_OPERATIONS = (("ins", "INSERT"), ("upd", "UPDATE"), ("del", "DELETE"))
+
+
+def install_triggers(c) -> List[str]:
+    """
+    Create the counter row and triggers of every tracked table that lacks them
+    (idempotent; a migration adding a table calls this again). Returns the tracked tables.
+    """
+    c.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")
+    tables = [row[0] for row in c.fetchall() if row[0] not in UNTRACKED_TABLES]
+    for table in tables:
+        c.execute('INSERT OR IGNORE INTO TableChanges (table_name, changes, generation) '
+                  'VALUES (?, 0, lower(hex(randomblob(8))))', (table,))
+        for suffix, operation in _OPERATIONS:
+            # Table names come from sqlite_master, never from user input
+            c.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_changes_{suffix}
+                AFTER {operation} ON {table}
+                BEGIN
+                    UPDATE TableChanges SET changes = changes + 1 WHERE table_name = '{table}';
+                END
+            ''')
+    return tables
+
+
+def table_digests(conn) -> Dict[str, str]:
+    """Digest of every tracked table, e.g. {"Traveller": "9f2c...:1234"}."""
+    rows = conn.execute('SELECT table_name, generation, changes FROM TableChanges').fetchall()
+    return {table: f"{generation}:{changes}" for table, generation, changes in rows}
+
+
+def changed_tables(old: Dict[str, str], new: Dict[str, str]) -> List[str]:
+    """Tables whose digest differs between `old` and `new` (added or removed tables included)."""
+    return sorted(table for table in old.keys() | new.keys() if old.get(table) != new.get(table))
+
+
+def new_generation(conn) -> None:
+    """Give every table a new generation token (after a restore); the caller commits."""
+    conn.execute('UPDATE TableChanges SET generation = lower(hex(randomblob(8)))')
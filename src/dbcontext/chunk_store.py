@@ -0,0 +1,267 @@
+# dbcontext/chunk_store.py
+"""
+Content-addressed chunk store for incremental, deduplicated database backups.
+
+A database snapshot is cut into fixed-size chunks (BACKUP_CHUNK_SIZE, a
+multiple of the SQLite page size, so a chunk is always a run of whole pages).
+Each chunk is stored once, zlib-compressed, under its SHA-256 in
+BACKUP_DIR/chunks/; a backup is only a small manifest file listing the
+hashes of its chunks in order. Between two backups SQLite rewrites just the
+pages that changed, so a new backup adds only the few chunks holding them.
+
+Every chunk has a reference count (the number of manifests using it) in the
+store's own index, BACKUP_DIR/chunks/index.db. It is deliberately kept out
+of the application database, because a restore replaces that one with an
+older copy. release() drops a manifest and deletes the chunks nobody uses
+any more. collect_garbage() recounts the references from the manifests on
+disk (mark and sweep) and removes whatever none of them uses.
+
+Run from src/:  python -m dbcontext.chunk_store [--gc]   (prints store statistics,
+                after a mark and sweep with --gc)
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+import zlib
+from config import BACKUP_DIR, BACKUP_CHUNK_SIZE
+from dbcontext.connection import get_connection
+
+MANIFEST_SUFFIX = ".manifest"
+MANIFEST_FORMAT = 1
+CHUNK_DIR = os.path.join(BACKUP_DIR, "chunks")
+INDEX_FILE = os.path.join(CHUNK_DIR, "index.db")
+
+# Storing and releasing both change reference counts and chunk files together
+_lock = threading.Lock()
+_ready = False
+
+
+def is_manifest(path: str) -> bool:
+    return path.endswith(MANIFEST_SUFFIX)
+
+
+def _chunk_path(digest: str) -> str:
+    return os.path.join(CHUNK_DIR, digest[:2], digest)
+
+
+def _connect():
+    """Pooled connection to the chunk index, creating it on first use."""
+    global _ready
+    os.makedirs(CHUNK_DIR, exist_ok=True)
+    conn = get_connection(INDEX_FILE)
+    if not _ready:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS Chunk (
+                hash TEXT PRIMARY KEY,             -- SHA-256 of the uncompressed chunk
+                stored_size INTEGER NOT NULL,      -- compressed bytes on disk
+                refs INTEGER NOT NULL              -- manifests using the chunk
+            ) WITHOUT ROWID
+        ''')
+        conn.commit()
+        _ready = True
+    return conn
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def store_file(source_path: str, manifest_path: str, chunk_size: int = BACKUP_CHUNK_SIZE) -> dict:
+    """
+    Store `source_path` (a database snapshot) as chunks and write its manifest
+    to `manifest_path`, which must not exist yet (replacing a manifest would
+    leave the references of the old one counted forever). Returns statistics:
+    chunks, new_chunks, bytes (file size) and new_bytes (compressed bytes
+    added to the store).
+    """
+    digests = []
+    new_chunks = new_bytes = 0
+    with _lock:
+        if os.path.exists(manifest_path):
+            raise FileExistsError(f"Backup manifest already exists: {manifest_path}")
+        conn = _connect()
+        try:
+            c = conn.cursor()
+            with open(source_path, "rb") as f:
+                while chunk := f.read(chunk_size):
+                    digest = hashlib.sha256(chunk).hexdigest()
+                    digests.append(digest)
+                    path = _chunk_path(digest)
+                    c.execute('SELECT 1 FROM Chunk WHERE hash = ?', (digest,))
+                    known = c.fetchone() is not None
+                    if known and os.path.exists(path):
+                        c.execute('UPDATE Chunk SET refs = refs + 1 WHERE hash = ?', (digest,))
+                        continue
+                    # Mostly ciphertext: the fastest level gets nearly all there is to get
+                    data = zlib.compress(chunk, 1)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    _write_atomic(path, data)
+                    c.execute('INSERT INTO Chunk (hash, stored_size, refs) VALUES (?, ?, 1) '
+                              'ON CONFLICT(hash) DO UPDATE SET refs = refs + 1, stored_size = excluded.stored_size',
+                              (digest, len(data)))
+                    new_chunks += 1
+                    new_bytes += len(data)
+            size = os.path.getsize(source_path)
+            manifest = {"format": MANIFEST_FORMAT, "size": size, "chunk_size": chunk_size, "chunks": digests}
+            _write_atomic(manifest_path, json.dumps(manifest).encode())
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            if os.path.exists(manifest_path):
+                os.remove(manifest_path)
+            raise
+        finally:
+            conn.close()
+    return {"chunks": len(digests), "new_chunks": new_chunks, "bytes": size, "new_bytes": new_bytes}
+
+
+def _read_manifest(manifest_path: str) -> dict:
+    with open(manifest_path, "rb") as f:
+        manifest = json.loads(f.read())
+    if manifest.get("format") != MANIFEST_FORMAT:
+        raise ValueError(f"Unsupported backup manifest format: {manifest.get('format')}")
+    return manifest
+
+
+def restore_file(manifest_path: str, dest_path: str) -> int:
+    """
+    Rebuild the file of a manifest at `dest_path`, verifying every chunk.
+    The file is assembled next to `dest_path` and renamed over it at the end.
+    Returns the bytes written.
+    """
+    manifest = _read_manifest(manifest_path)
+    tmp = dest_path + ".restore"
+    written = 0
+    try:
+        with open(tmp, "wb") as out:
+            for digest in manifest["chunks"]:
+                with open(_chunk_path(digest), "rb") as f:
+                    chunk = zlib.decompress(f.read())
+                if hashlib.sha256(chunk).hexdigest() != digest:
+                    raise ValueError(f"Backup chunk {digest} is corrupted")
+                out.write(chunk)
+                written += len(chunk)
+            out.flush()
+            os.fsync(out.fileno())
+        if written != manifest["size"]:
+            raise ValueError("Backup is incomplete: rebuilt size does not match its manifest")
+        os.replace(tmp, dest_path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return written
+
+
+def release(manifest_path: str) -> int:
+    """
+    Delete a backup manifest and every chunk no other manifest uses.
+    Returns the number of chunk files deleted.
+    """
+    if not os.path.exists(manifest_path):
+        return 0
+    counts: dict[str, int] = {}
+    for digest in _read_manifest(manifest_path)["chunks"]:
+        counts[digest] = counts.get(digest, 0) + 1
+    with _lock:
+        conn = _connect()
+        try:
+            c = conn.cursor()
+            c.executemany('UPDATE Chunk SET refs = refs - ? WHERE hash = ?',
+                          [(count, digest) for digest, count in counts.items()])
+            c.execute('SELECT hash FROM Chunk WHERE refs <= 0')
+            unused = [row[0] for row in c.fetchall()]
+            c.execute('DELETE FROM Chunk WHERE refs <= 0')
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        # After the commit: a crash in between only leaves files for collect_garbage()
+        os.remove(manifest_path)
+        for digest in unused:
+            try:
+                os.remove(_chunk_path(digest))
+            except FileNotFoundError:
+                pass
+    return len(unused)
+
+
+def collect_garbage(manifest_dir: str = BACKUP_DIR) -> dict:
+    """
+    Mark and sweep: recount every chunk's references from the manifests in
+    `manifest_dir`, then delete the index rows and chunk files none of them
+    uses. This repairs counts that no longer match the manifests (e.g. of a
+    manifest replaced by an older version, or a crash between the index and
+    the files) and removes chunk files left by an interrupted backup.
+    Returns manifests, chunks (in use), removed (files deleted) and missing
+    (referenced chunks without a file).
+    """
+    with _lock:
+        counts: dict[str, int] = {}
+        manifests = 0
+        for name in sorted(os.listdir(manifest_dir)):
+            if not is_manifest(name):
+                continue
+            try:
+                digests = _read_manifest(os.path.join(manifest_dir, name))["chunks"]
+            except (OSError, ValueError) as e:
+                print(f"Skipping unreadable backup manifest {name}: {e}")
+                continue
+            manifests += 1
+            for digest in digests:
+                counts[digest] = counts.get(digest, 0) + 1
+
+        missing = 0
+        conn = _connect()
+        try:
+            c = conn.cursor()
+            known = {row[0] for row in c.execute('SELECT hash FROM Chunk')}
+            c.executemany('DELETE FROM Chunk WHERE hash = ?', [(digest,) for digest in known - counts.keys()])
+            for digest, refs in counts.items():
+                path = _chunk_path(digest)
+                if not os.path.exists(path):
+                    missing += 1
+                    continue
+                c.execute('INSERT INTO Chunk (hash, stored_size, refs) VALUES (?, ?, ?) '
+                          'ON CONFLICT(hash) DO UPDATE SET refs = excluded.refs',
+                          (digest, os.path.getsize(path), refs))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        # Sweep after the commit: the index never refers to a deleted file
+        removed = 0
+        for prefix in os.listdir(CHUNK_DIR):
+            folder = os.path.join(CHUNK_DIR, prefix)
+            if not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                if name not in counts:
+                    os.remove(os.path.join(folder, name))
+                    removed += 1
+    return {"manifests": manifests, "chunks": len(counts), "removed": removed, "missing": missing}
+
+
+def store_stats() -> dict:
+    """Chunks in the store, their compressed bytes and total references."""
+    with _connect() as conn:
+        chunks, stored, refs = conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(stored_size), 0), COALESCE(SUM(refs), 0) FROM Chunk').fetchone()
+    return {"chunks": chunks, "stored_bytes": stored, "references": refs}
+
+
+if __name__ == "__main__":
+    if "--gc" in sys.argv:
+        print(collect_garbage())
+    print(store_stats())
@@ -0,0 +1,340 @@
+# dbcontext/connection.py
+"""
+Central SQLite connection manager shared by all services.
+
+Services used to open a fresh sqlite3 connection for nearly every call.
+get_connection() instead hands out pooled connections that stay open:
+  * re-entrant per thread – nested calls in one thread share one connection;
+    a nested checkout runs in a savepoint of the outer caller's open
+    transaction, so its commit(), rollback(), close() and `with` block never
+    end that transaction,
+  * bounded – at most DB_POOL_SIZE connections per database file,
+  * pausable – pause_connections() waits until other threads have given
+    their connections back and keeps them out, e.g. while the file is swapped,
+  * configured in one place (_configure) when they are opened, using the
+    performance profile selected in config.py.
+
+The object returned behaves like a sqlite3.Connection. close() and leaving a
+`with` block give it back to the pool (rolling back uncommitted work, like a
+real close would) instead of closing it. Give it back explicitly: a
+connection that is only dropped keeps its pool slot.
+"""
+import os
+import sqlite3
+import threading
+import time
+from config import (
+    DB_FILE, DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_PERFORMANCE_PROFILE, DB_PRAGMA_OVERRIDES,
+    BACKUP_PAGES_PER_STEP, BACKUP_STEP_PAUSE_MS
+)
+
+# WAL lets readers (and the backup) run while a writer commits.
+#   safe       – synchronous=FULL: a committed transaction survives power loss.
+#   throughput – synchronous=NORMAL: in WAL mode still consistent after a crash,
+#                but the last commits may be lost on power loss.
+PERFORMANCE_PROFILES = {
+    "safe": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -8000,          # KiB when negative (about 8 MB)
+        "mmap_size": 0,
+        "temp_store": "DEFAULT",
+        "busy_timeout": 5000,         # ms
+    },
+    "throughput": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -64000,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "busy_timeout": 10000,
+    },
+}
+
+
+def get_profile(name: str = DB_PERFORMANCE_PROFILE) -> dict:
+    """Pragmas of a performance profile, with DB_PRAGMA_OVERRIDES applied."""
+    if name not in PERFORMANCE_PROFILES:
+        raise ValueError(f"Unknown database performance profile: {name}")
+    return {**PERFORMANCE_PROFILES[name], **DB_PRAGMA_OVERRIDES}
+
+
+def _configure(conn: sqlite3.Connection) -> None:
+    """Connection-level settings, applied once per new connection."""
+    # busy_timeout first, switching journal_mode may have to wait for other connections
+    pragmas = get_profile()
+    conn.execute(f'PRAGMA busy_timeout = {int(pragmas["busy_timeout"])}')
+    for name, value in pragmas.items():
+        if name != "busy_timeout":
+            conn.execute(f'PRAGMA {name} = {value}')
+
+
+class PooledConnection:
+    """
+    A checked-out pool connection; close() returns it to the pool.
+
+    A nested checkout taken while the outer caller's transaction is open works
+    in a savepoint of that transaction: its commit() and rollback() release or
+    roll back only the savepoint, and close() or leaving its `with` block never
+    ends the outer transaction.
+    """
+
+    def __init__(self, pool: "ConnectionPool", conn: sqlite3.Connection, nested: bool = False):
+        self._pool = pool
+        self._conn = conn
+        self._released = False
+        self._savepoint = None
+        if nested and conn.in_transaction:
+            self._savepoint = f"pooled_{id(self)}"
+            conn.execute(f'SAVEPOINT {self._savepoint}')
+
+    def __getattr__(self, name):
+        if self._released:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(self._conn, name)
+
+    def _end_savepoint(self, keep: bool) -> None:
+        """Release the savepoint, after rolling it back unless `keep`."""
+        savepoint, self._savepoint = self._savepoint, None
+        try:
+            if not keep:
+                self._conn.execute(f'ROLLBACK TO {savepoint}')
+            self._conn.execute(f'RELEASE {savepoint}')
+        except sqlite3.OperationalError:
+            pass    # the outer caller already ended its transaction
+
+    def commit(self) -> None:
+        if self._released:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        if self._savepoint is None:
+            self._conn.commit()
+            return
+        # Keep the work in the outer transaction, and scope what follows again
+        savepoint = self._savepoint
+        self._end_savepoint(keep=True)
+        if self._conn.in_transaction:
+            self._savepoint = savepoint
+            self._conn.execute(f'SAVEPOINT {savepoint}')
+
+    def rollback(self) -> None:
+        if self._released:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        if self._savepoint is None:
+            self._conn.rollback()
+            return
+        try:
+            self._conn.execute(f'ROLLBACK TO {self._savepoint}')   # the savepoint stays open
+        except sqlite3.OperationalError:
+            self._savepoint = None
+
+    def __enter__(self):
+        if self._savepoint is None:
+            self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._released:
+            return False    # closed inside the block
+        try:
+            if self._savepoint is None:
+                return self._conn.__exit__(exc_type, exc, tb)
+            # Like a connection's `with`: keep the work unless the block failed
+            self._end_savepoint(keep=exc_type is None)
+            return False
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if not self._released:
+            if self._savepoint is not None:
+                self._end_savepoint(keep=False)     # uncommitted work goes, like a real close
+            self._released = True
+            self._pool.release(self._conn)
+
+
+class ConnectionPool:
+    """Bounded pool of persistent connections to one database file."""
+
+    def __init__(self, db_path: str, max_size: int = DB_POOL_SIZE):
+        self.db_path = db_path
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._idle: list[sqlite3.Connection] = []   # LIFO: the warmest connection is reused first
+        self._lock = threading.Lock()
+        self._local = threading.local()             # per-thread checkout (connection + depth)
+        self._generation = 0                        # bumped by close_all()
+        self._idle_cond = threading.Condition(self._lock)
+        self._checked_out = 0                       # outer checkouts not yet released
+        self._paused_by = None                      # thread holding the pool, see pause()
+
+    def acquire(self) -> PooledConnection:
+        local = self._local
+        if getattr(local, "depth", 0) > 0:
+            local.depth += 1                          # nested use in the same thread
+            return PooledConnection(self, local.conn, nested=True)
+
+        self._enter()
+        if not self._slots.acquire(timeout=DB_POOL_TIMEOUT):
+            self._leave()
+            raise sqlite3.OperationalError("Database connection pool exhausted")
+        try:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+                generation = self._generation
+            if conn is None:
+                conn = sqlite3.connect(self.db_path, check_same_thread=False)
+                _configure(conn)
+        except Exception:
+            self._slots.release()
+            self._leave()
+            raise
+        local.conn, local.depth, local.generation = conn, 1, generation
+        return PooledConnection(self, conn)
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        local = self._local
+        local.depth -= 1
+        if local.depth > 0:
+            return
+        local.conn = None
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            with self._lock:
+                stale = local.generation != self._generation
+                if not stale:
+                    self._idle.append(conn)
+            if stale:
+                conn.close()
+        except sqlite3.Error:
+            conn.close()
+        finally:
+            self._slots.release()
+            self._leave()
+
+    def _enter(self) -> None:
+        """Count an outer checkout, first waiting while another thread holds the pool paused."""
+        me = threading.get_ident()
+        with self._idle_cond:
+            if not self._idle_cond.wait_for(lambda: self._paused_by in (None, me), DB_POOL_TIMEOUT):
+                raise sqlite3.OperationalError("Database is unavailable (its file is being replaced)")
+            self._checked_out += 1
+
+    def _leave(self) -> None:
+        with self._idle_cond:
+            self._checked_out -= 1
+            self._idle_cond.notify_all()
+
+    def pause(self, timeout: float = DB_POOL_TIMEOUT) -> None:
+        """
+        Stop other threads from checking out connections and wait until every
+        checked-out connection has been given back, e.g. before the database
+        file is replaced. The calling thread keeps using the pool; resume()
+        lets the others in again.
+        """
+        if getattr(self._local, "depth", 0) > 0:
+            raise sqlite3.ProgrammingError("Cannot pause a pool while holding one of its connections")
+        me = threading.get_ident()
+        with self._idle_cond:
+            if not self._idle_cond.wait_for(lambda: self._paused_by is None, timeout):
+                raise sqlite3.OperationalError("Database pool is already paused")
+            self._paused_by = me
+            if not self._idle_cond.wait_for(lambda: self._checked_out == 0, timeout):
+                self._paused_by = None
+                self._idle_cond.notify_all()
+                raise sqlite3.OperationalError("Database connections still in use, not paused")
+
+    def resume(self) -> None:
+        """Let other threads check out connections again after pause()."""
+        with self._idle_cond:
+            if self._paused_by == threading.get_ident():
+                self._paused_by = None
+                self._idle_cond.notify_all()
+
+    def close_all(self) -> None:
+        """Close idle connections; checked-out ones are closed when released."""
+        with self._lock:
+            self._generation += 1
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+_pools: dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str = DB_FILE) -> ConnectionPool:
+    key = os.path.abspath(db_path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(key)
+    return pool
+
+
+def get_connection(db_path: str = DB_FILE) -> PooledConnection:
+    """Check out a connection to `db_path` (give it back with close() or a `with` block)."""
+    return get_pool(db_path).acquire()
+
+
+def checkpoint(db_path: str = DB_FILE, mode: str = "TRUNCATE") -> None:
+    """
+    Copy the WAL into the main database file (and empty it with TRUNCATE),
+    so the .db file alone is a complete copy, e.g. before it is zipped.
+    """
+    with get_connection(db_path) as conn:
+        conn.execute(f'PRAGMA wal_checkpoint({mode})')
+
+
+def snapshot(dest_path: str, db_path: str = DB_FILE, pages: int = BACKUP_PAGES_PER_STEP,
+             pause_ms: int = BACKUP_STEP_PAUSE_MS) -> tuple[int, float]:
+    """
+    Copy `db_path` into a new database file `dest_path` with SQLite's online
+    backup API, `pages` pages per step, sleeping `pause_ms` after each step
+    that leaves pages to copy so concurrent writers get the database in between.
+    The copy runs inside one read transaction, so in WAL mode it is a single
+    consistent state of the database (committed WAL content included) and
+    writers carry on meanwhile; without it every concurrent write would
+    restart the copy from its first page.
+    The source is a connection of its own, not a pooled one: a pooled checkout
+    may be nested in a caller's open transaction, where BEGIN would fail.
+    Returns (pages copied, seconds taken).
+    """
+    total = 0
+
+    def _progress(_status, remaining, page_count):
+        nonlocal total
+        total = page_count
+        if remaining and pause_ms > 0:
+            time.sleep(pause_ms / 1000)
+
+    start = time.perf_counter()
+    dest = sqlite3.connect(dest_path)
+    try:
+        source = sqlite3.connect(db_path)
+        try:
+            _configure(source)
+            source.execute('BEGIN')
+            source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()   # pins the read snapshot
+            source.backup(dest, pages=pages, progress=_progress)
+            source.rollback()
+        finally:
+            source.close()
+    finally:
+        dest.close()
+    return total, time.perf_counter() - start
+
+
+def close_all_connections(db_path: str = DB_FILE) -> None:
+    """Drop every pooled connection to `db_path`, e.g. before its file is replaced."""
+    get_pool(db_path).close_all()
+
+
+def pause_connections(db_path: str = DB_FILE) -> None:
+    """Wait until no other thread uses `db_path` and keep them out (see ConnectionPool.pause)."""
+    get_pool(db_path).pause()
+
+
+def resume_connections(db_path: str = DB_FILE) -> None:
+    """Undo pause_connections()."""
+    get_pool(db_path).resume()
@@ -0,0 +1,154 @@
+# dbcontext/data_keys.py
+"""
+Key store of the per-traveller data keys (envelope encryption).
+
+Every Traveller row is encrypted with its own random data key; the row only
+stores a random reference to it (Traveller.data_key_ref). The data key itself
+lives here, wrapped with the active key ring key (crypto_utils.wrap_key), in
+a separate SQLite file that database backups do not include. That gives:
+  * erasure in O(1) per traveller: deleting the wrapped key (shred) makes the
+    row unreadable in the live database and in every backup archive alike
+    (the search tokens are kept out of backups too, see dbcontext/traveller_index.py),
+  * cheap master-key rotation: only these 61-byte wrapped keys change, the
+    eleven traveller columns are never touched.
+
+The whitelisted columns encrypted deterministically (config.DETERMINISTIC_COLUMNS,
+e.g. gender and city) use the key ring, not the data key, so that SQLite can
+filter them. Shredding does not cover them: in a backup, an erased row still
+shows its gender and city (and id and registration date) to anyone holding
+the key ring.
+"""
+import secrets
+import threading
+from config import DATA_KEYS_FILE
+from dbcontext.connection import get_connection, checkpoint
+from utils.crypto_utils import generate_data_key, wrap_key, unwrap_key, rewrap_key
+
+REF_SIZE = 16
+_ID_CHUNK = 500    # stay well below SQLite's bound-variable limit
+
+_ready: set = set()
+_ready_lock = threading.Lock()
+
+
+def _connect(path: str = DATA_KEYS_FILE):
+    """Pooled connection to the key store, creating its table on first use."""
+    conn = get_connection(path)
+    # Deleted keys are overwritten with zeros instead of lingering in free pages
+    conn.execute('PRAGMA secure_delete = ON')
+    if path not in _ready:
+        with _ready_lock:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS DataKey (
+                    key_ref BLOB PRIMARY KEY,          -- random, stored in the owning row
+                    wrapped_key BLOB NOT NULL,         -- crypto_utils.wrap_key(data key)
+                    created_at TEXT NOT NULL DEFAULT (datetime('now'))
+                ) WITHOUT ROWID
+            ''')
+            conn.commit()
+            _ready.add(path)
+    return conn
+
+
+def create_data_keys(count: int, path: str = DATA_KEYS_FILE) -> list[tuple[bytes, bytes]]:
+    """Create and store `count` new data keys; returns (key_ref, data_key) pairs."""
+    keys = [(secrets.token_bytes(REF_SIZE), generate_data_key()) for _ in range(count)]
+    with _connect(path) as conn:
+        conn.executemany('INSERT INTO DataKey (key_ref, wrapped_key) VALUES (?, ?)',
+                         [(ref, wrap_key(key)) for ref, key in keys])
+        conn.commit()
+    return keys
+
+
+def store_data_key(data_key: bytes, path: str = DATA_KEYS_FILE) -> bytes:
+    """Store an existing data key (e.g. of a new Traveller); returns its key_ref."""
+    ref = secrets.token_bytes(REF_SIZE)
+    with _connect(path) as conn:
+        conn.execute('INSERT INTO DataKey (key_ref, wrapped_key) VALUES (?, ?)', (ref, wrap_key(data_key)))
+        conn.commit()
+    return ref
+
+
+def load_data_keys(refs, path: str = DATA_KEYS_FILE) -> dict[bytes, bytes]:
+    """
+    Unwrapped data keys by reference. Shredded (or unknown) references are
+    missing from the result, so their rows simply fail to decrypt.
+    """
+    refs = list({ref for ref in refs if ref is not None})
+    keys = {}
+    with _connect(path) as conn:
+        for start in range(0, len(refs), _ID_CHUNK):
+            chunk = refs[start:start + _ID_CHUNK]
+            placeholders = ','.join(['?'] * len(chunk))
+            for ref, wrapped in conn.execute(
+                    f'SELECT key_ref, wrapped_key FROM DataKey WHERE key_ref IN ({placeholders})', chunk):
+                try:
+                    keys[ref] = unwrap_key(wrapped)
+                except Exception as e:
+                    print(f"Could not unwrap data key: {e}")
+    return keys
+
+
+def load_data_key(ref, path: str = DATA_KEYS_FILE):
+    """One unwrapped data key, or None if it was shredded."""
+    return load_data_keys([ref], path).get(ref)
+
+
+def shred(refs, path: str = DATA_KEYS_FILE) -> int:
+    """
+    Delete data keys for good, which crypto-shreds everything encrypted with
+    them. The WAL is checkpointed and truncated afterwards, so no copy of the
+    deleted keys stays behind in it. Returns the number of keys deleted.
+    """
+    refs = [ref for ref in refs if ref is not None]
+    if not refs:
+        return 0
+    deleted = 0
+    with _connect(path) as conn:
+        for start in range(0, len(refs), _ID_CHUNK):
+            chunk = refs[start:start + _ID_CHUNK]
+            placeholders = ','.join(['?'] * len(chunk))
+            deleted += conn.execute(f'DELETE FROM DataKey WHERE key_ref IN ({placeholders})', chunk).rowcount
+        conn.commit()
+    checkpoint(path)
+    return deleted
+
+
+def existing_refs(refs, path: str = DATA_KEYS_FILE) -> set:
+    """The references in `refs` whose data key still exists."""
+    refs = list({ref for ref in refs if ref is not None})
+    found = set()
+    with _connect(path) as conn:
+        for start in range(0, len(refs), _ID_CHUNK):
+            chunk = refs[start:start + _ID_CHUNK]
+            placeholders = ','.join(['?'] * len(chunk))
+            found.update(row[0] for row in conn.execute(
+                f'SELECT key_ref FROM DataKey WHERE key_ref IN ({placeholders})', chunk))
+    return found
+
+
+def count_data_keys(up_to=None, path: str = DATA_KEYS_FILE) -> int:
+    """Number of stored keys, or of those up to key_ref `up_to` (a rewrap_step position)."""
+    with _connect(path) as conn:
+        if up_to is None:
+            return conn.execute('SELECT COUNT(*) FROM DataKey').fetchone()[0]
+        return conn.execute('SELECT COUNT(*) FROM DataKey WHERE key_ref <= ?', (up_to,)).fetchone()[0]
+
+
+def rewrap_step(position, limit: int, path: str = DATA_KEYS_FILE) -> tuple[bytes, int, int, bool]:
+    """
+    Rewrap up to `limit` keys after `position` (a key_ref; 0 to start) with the
+    active key ring key. Returns (position, keys looked at, keys rewrapped, done).
+    """
+    with _connect(path) as conn:
+        rows = conn.execute('SELECT key_ref, wrapped_key FROM DataKey WHERE key_ref > ? ORDER BY key_ref LIMIT ?',
+                            (position, limit)).fetchall()
+        changed = 0
+        for ref, wrapped in rows:
+            new = rewrap_key(wrapped)
+            if new is not None:
+                # Only if unchanged meanwhile (a shred in between must stay a shred)
+                changed += conn.execute('UPDATE DataKey SET wrapped_key = ? WHERE key_ref = ? AND wrapped_key = ?',
+                                        (new, ref, wrapped)).rowcount
+        conn.commit()
+    return (rows[-1][0] if rows else position), len(rows), changed, len(rows) < limit
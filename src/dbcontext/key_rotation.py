@@ -0,0 +1,265 @@
+# dbcontext/key_rotation.py
+"""
+Online key rotation: switch new writes to a fresh key at once, then
+re-encrypt everything stored under older keys in the background.
+
+The job walks every table of reencrypt.ENCRYPTED_COLUMNS, the activity log and
+the per-traveller data keys (which are only rewrapped) in small batches. Each
+table batch is committed together with its checkpoint row in KeyRotation, so
+stopping the job (or the application) at any point loses nothing:
+resume_rotation() continues from the last committed batch.
+The job only holds a pooled connection for the duration of one batch and
+pauses between batches, so interactive use is not blocked.
+
+Run from src/:  python -m dbcontext.key_rotation [--resume]
+"""
+import atexit
+import os
+import sys
+import threading
+import time
+from typing import Callable, Optional
+from config import DB_FILE, LOG_FILE, KEY_ROTATION_BATCH_SIZE, KEY_ROTATION_PAUSE_MS
+from dbcontext.connection import get_connection
+from dbcontext.reencrypt import ENCRYPTED_COLUMNS, select_batch_sql, reencrypt_rows
+from dbcontext import data_keys
+from utils.crypto_utils import rotate_key, active_key_id
+
+LOG_TARGET = "activity.log"
+DATA_KEY_TARGET = "DataKey"
+TARGETS = (*ENCRYPTED_COLUMNS, LOG_TARGET, DATA_KEY_TARGET)
+
+
+class KeyRotationJob:
+    """Background thread re-encrypting all stored values under the active key."""
+
+    def __init__(self, db_path: str = DB_FILE, batch_size: int = KEY_ROTATION_BATCH_SIZE,
+                 pause_ms: int = KEY_ROTATION_PAUSE_MS, progress: Optional[Callable] = None):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.pause = pause_ms / 1000
+        self.progress = progress or (lambda _: None)
+        self.error: Optional[Exception] = None
+        self.processed = 0               # table rows (and log bytes) looked at by this run
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------------- control ----------------
+    def start(self) -> "KeyRotationJob":
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="key-rotation", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Ask the job to stop after its current batch (it can be resumed later)."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return not self.is_running()
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def throughput(self) -> float:
+        """Table rows (and log bytes) per second processed by this run."""
+        if self.started_at is None:
+            return 0.0
+        elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    # ---------------- work ----------------
+    def _run(self) -> None:
+        try:
+            for target in TARGETS:
+                while not self._stop.is_set():
+                    if self._step(target):
+                        break
+                    self._stop.wait(self.pause)
+                if self._stop.is_set():
+                    self.progress("Key rotation paused, it resumes from its checkpoint.")
+                    return
+            self.progress(f"Key rotation finished ({self.processed} rows and log bytes, {self.throughput():.0f}/s).")
+        except Exception as e:
+            self.error = e
+            self.progress(f"Key rotation stopped: {e}")
+        finally:
+            self.finished_at = time.monotonic()
+
+    def _step(self, target: str) -> bool:
+        """Process one batch of `target`; returns True once the target is done."""
+        conn = get_connection(self.db_path)
+        try:
+            c = conn.cursor()
+            c.execute('SELECT position, output_offset, done FROM KeyRotation WHERE target = ?', (target,))
+            row = c.fetchone()
+            if row is None or row[2]:
+                return True
+            position, output_offset, _done = row
+
+            if target == LOG_TARGET:
+                from services.log_service import reencrypt_log_step
+                conn.close()                 # the log step can take a while; don't hold the connection
+                new_position, output_offset, changed, done = reencrypt_log_step(
+                    position, output_offset, self.batch_size)
+                lines = max(new_position - position, 0) if not done else 0   # bytes for the log
+                conn = get_connection(self.db_path)
+                c = conn.cursor()
+            elif target == DATA_KEY_TARGET:
+                # Envelope keys: rewrapping 61 bytes re-keys a whole traveller row
+                new_position, lines, changed, done = data_keys.rewrap_step(position, self.batch_size)
+                output_offset = 0
+            else:
+                c.execute(select_batch_sql(target), (position, self.batch_size))
+                rows = c.fetchall()
+                changed = reencrypt_rows(c, target, rows, self.progress)
+                lines = len(rows)
+                new_position = rows[-1][0] if rows else position
+                done = len(rows) < self.batch_size
+                output_offset = 0
+
+            c.execute('''
+                UPDATE KeyRotation
+                SET position = ?, output_offset = ?, processed = processed + ?,
+                    changed = changed + ?, done = ?
+                WHERE target = ?
+            ''', (new_position, output_offset, lines, changed, int(done), target))
+            conn.commit()
+            self.processed += lines
+            self.progress(f"  {target}: position {new_position}, {changed} re-encrypted"
+                          + (" (done)" if done else ""))
+            return done
+        finally:
+            conn.close()
+
+
+_job: Optional[KeyRotationJob] = None
+_job_lock = threading.Lock()
+
+
+def _start(progress: Optional[Callable]) -> KeyRotationJob:
+    global _job
+    _job = KeyRotationJob(progress=progress).start()
+    return _job
+
+
+def start_rotation(progress: Optional[Callable] = None) -> KeyRotationJob:
+    """Activate a new key and start re-encrypting existing data with it in the background."""
+    with _job_lock:
+        if _job is not None and _job.is_running():
+            raise RuntimeError("A key rotation is already running.")
+        key_id = rotate_key()
+        with get_connection(DB_FILE) as conn:
+            conn.execute('DELETE FROM KeyRotation')
+            conn.executemany('INSERT INTO KeyRotation (target, key_id) VALUES (?, ?)',
+                             [(target, key_id) for target in TARGETS])
+            conn.commit()
+        return _start(progress)
+
+
+def resume_rotation(progress: Optional[Callable] = None) -> Optional[KeyRotationJob]:
+    """Continue an unfinished rotation from its checkpoint; None if there is nothing to do."""
+    with _job_lock:
+        if _job is not None and _job.is_running():
+            return _job
+        with get_connection(DB_FILE) as conn:
+            c = conn.cursor()
+            c.execute('SELECT COUNT(*), MAX(key_id) FROM KeyRotation WHERE done = 0')
+            pending, key_id = c.fetchone()
+            if not pending:
+                return None
+            if key_id != active_key_id():
+                # Rotated again since (or restored from a backup): redo every target for the active key
+                c.execute('UPDATE KeyRotation SET key_id = ?, position = 0, output_offset = 0, done = 0',
+                          (active_key_id(),))
+                conn.commit()
+        return _start(progress)
+
+
+def pause_rotation() -> bool:
+    """Stop a running rotation after its current batch; True if one was running."""
+    with _job_lock:
+        job = _job
+        if job is None or not job.is_running():
+            return False
+        job.stop()
+        return True
+
+
+def restart_after_restore() -> None:
+    """
+    A restored database may hold older values behind the checkpoints: rescan
+    every table (the log and the data keys are not part of a backup).
+    """
+    with get_connection(DB_FILE) as conn:
+        conn.execute('UPDATE KeyRotation SET position = 0, output_offset = 0, done = 0 '
+                     "WHERE target NOT IN (?, ?)", (LOG_TARGET, DATA_KEY_TARGET))
+        conn.commit()
+
+
+def rotation_status() -> Optional[dict]:
+    """
+    Progress of the current (or last) rotation, None if there never was one.
+    'processed' counts rows for the tables and data keys, bytes for the activity log.
+    """
+    with get_connection(DB_FILE) as conn:
+        c = conn.cursor()
+        c.execute('SELECT target, key_id, position, processed, changed, done FROM KeyRotation ORDER BY rowid')
+        rows = c.fetchall()
+        if not rows:
+            return None
+        targets = {}
+        for target, key_id, position, processed, changed, done in rows:
+            if target == LOG_TARGET:
+                done_rows = position
+                total = os.path.getsize(LOG_FILE) if os.path.exists(LOG_FILE) else 0
+            elif target == DATA_KEY_TARGET:
+                done_rows = data_keys.count_data_keys(up_to=position)
+                total = data_keys.count_data_keys()
+            else:
+                id_column = ENCRYPTED_COLUMNS[target][0]
+                c.execute(f'SELECT COUNT(*) FROM {target} WHERE {id_column} <= ?', (position,))
+                done_rows = c.fetchone()[0]
+                c.execute(f'SELECT COUNT(*) FROM {target}')
+                total = c.fetchone()[0]
+            targets[target] = {
+                "processed": processed,
+                "changed": changed,
+                "done": bool(done),
+                "percent": 100.0 if done else min(100.0 * done_rows / total, 100.0) if total else 0.0,
+            }
+    job = _job
+    return {
+        "key_id": rows[0][1],
+        "running": bool(job and job.is_running()),
+        "done": all(t["done"] for t in targets.values()),
+        "throughput": job.throughput() if job else 0.0,
+        "error": str(job.error) if job and job.error else None,
+        "targets": targets,
+    }
+
+
+@atexit.register
+def _stop_on_exit() -> None:
+    job = _job
+    if job is not None and job.is_running():
+        job.stop(timeout=5)
+
+
+if __name__ == "__main__":
+    from dbcontext.dbcontext import create_db
+    create_db()
+    job = resume_rotation(print) if "--resume" in sys.argv else start_rotation(print)
+    if job is None:
+        print("No unfinished key rotation.")
+    else:
+        try:
+            job.wait()
+        except KeyboardInterrupt:
+            job.stop()
@@ -0,0 +1,546 @@
+# dbcontext/migrations.py
+"""
+Versioned schema migrations, tracked with SQLite's PRAGMA user_version.
+
+Each migration has a schema step and an optional backfill. migrate() commits
+the schema step on its own, then runs the backfill in committed batches with
+progress output, and only then bumps user_version in a separate commit. An
+interruption anywhere in between leaves the version as it was, so both run
+again on the next start: schema steps must be re-runnable on a database they
+already changed, and backfills must continue where they stopped.
+
+Migrations are append only: a released migration is never edited, a change
+gets a new one. Data let in by older versions that a released migration
+cannot take is repaired by a step in PREPARE, run before that migration on
+databases that have not applied it yet.
+
+When the schema is current, migrate() costs a single pragma read.
+"""
+import sqlite3
+from typing import Callable, Optional
+from utils.crypto_utils import decrypt, blind_index
+from utils.search_index import INDEXED_FIELDS, index_row
+
+BATCH_SIZE = 500
+
+
+def _column_exists(c, table: str, column: str) -> bool:
+    c.execute(f'PRAGMA table_info({table})')
+    return any(row[1] == column for row in c.fetchall())
+
+
+def run_batched(conn, label: str, total_sql: str, batch_sql: str, process_batch: Callable,
+                progress: Callable = print, batch_size: int = BATCH_SIZE) -> int:
+    """
+    Feed rows to `process_batch(cursor, rows)` in keyset-paginated chunks,
+    committing after each one. `batch_sql` takes (last_id, limit) and must
+    return the id as first column, ordered by it. Returns the rows processed.
+    """
+    c = conn.cursor()
+    c.execute(total_sql)
+    total = c.fetchone()[0]
+    if not total:
+        return 0
+    done, last_id = 0, 0
+    while True:
+        c.execute(batch_sql, (last_id, batch_size))
+        rows = c.fetchall()
+        if not rows:
+            break
+        process_batch(c, rows)
+        conn.commit()
+        done += len(rows)
+        last_id = rows[-1][0]
+        progress(f"  {label}: {done}/{total}")
+    return done
+
+
+#-------------------------------------------------
+#                   1: Base schema
+#-------------------------------------------------
+def _base_schema(c):
+    # User table
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS User (
+        user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE,
+        password_hash TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        registration_date DATETIME,
+        role TEXT
+    )
+    ''')
+
+    # Traveller table
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS Traveller (
+        traveller_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        registration_date DATETIME,
+        first_name TEXT,
+        last_name TEXT,
+        birthday DATE,
+        gender TEXT,
+        street_name TEXT,
+        house_number TEXT,
+        zip_code TEXT,
+        city TEXT,
+        email TEXT,
+        mobile_phone TEXT,
+        driving_license_no TEXT
+    )
+    ''')
+
+    # Scooter table
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS Scooter (
+        scooter_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        brand TEXT,
+        model TEXT,
+        serial_number TEXT UNIQUE,
+        top_speed REAL,
+        battery_capacity REAL,
+        state_of_charge REAL,
+        target_soc_min REAL,
+        target_soc_max REAL,
+        location_lat REAL,
+        location_lon REAL,
+        out_of_service BOOLEAN,
+        mileage REAL,
+        last_maint_date DATE,
+        in_service_date DATETIME
+    )
+    ''')
+
+    # Backup table
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS Backup (
+        backup_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        backup_date DATETIME,
+        file_path TEXT,
+        created_by_user_id INTEGER,
+        FOREIGN KEY(created_by_user_id) REFERENCES User(user_id)
+    )
+    ''')
+
+    # Restore code table
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS RestoreCode (
+        code_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        code TEXT UNIQUE,
+        backup_id INTEGER,
+        system_admin_user_id INTEGER,
+        is_used BOOLEAN,
+        generated_date DATETIME,
+        FOREIGN KEY(backup_id) REFERENCES Backup(backup_id),
+        FOREIGN KEY(system_admin_user_id) REFERENCES User(user_id)
+    )
+    ''')
+
+    # Temporary password reset code table
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS TempCodes (
+        user_id INTEGER PRIMARY KEY,
+        code TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES User(user_id)
+    )
+    ''')
+
+    # table LogStatus to track “last seen” ID per user
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS LogStatus (
+        user_id INTEGER PRIMARY KEY,
+        last_seen_log_id INTEGER
+    )
+    ''')
+
+
+#-------------------------------------------------
+#                   2: Username blind index
+#-------------------------------------------------
+def _username_bidx_schema(c):
+    if not _column_exists(c, 'User', 'username_bidx'):
+        c.execute('ALTER TABLE User ADD COLUMN username_bidx TEXT')
+
+
+def _username_bidx_backfill(conn, progress):
+    def process(c, rows):
+        for user_id, username in rows:
+            try:
+                bidx = blind_index(decrypt(username).lower(), "username")
+                c.execute('UPDATE User SET username_bidx = ? WHERE user_id = ?', (bidx, user_id))
+            except Exception as e:
+                progress(f"  Could not index username of user {user_id}: {e}")
+
+    run_batched(
+        conn, "username blind index",
+        'SELECT COUNT(*) FROM User WHERE username_bidx IS NULL',
+        'SELECT user_id, username FROM User WHERE username_bidx IS NULL AND user_id > ? ORDER BY user_id LIMIT ?',
+        process, progress,
+    )
+    # Unique only once every row has its value
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_user_username_bidx ON User(username_bidx)')
+    conn.commit()
+
+
+#-------------------------------------------------
+#                   3: Suspicious log index
+#-------------------------------------------------
+def _suspicious_log_schema(c):
+    # Ids of suspicious log entries, so unread counts need no log scan
+    # (filled from the log itself by log_service._sync_suspicious_index)
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS SuspiciousLog (
+        log_id INTEGER PRIMARY KEY
+    )
+    ''')
+
+
+#-------------------------------------------------
+#                   4: Trigram search index
+#-------------------------------------------------
+def _search_index_schema(c):
+    # Keyed trigram index for substring search on encrypted columns
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS SearchIndex (
+        table_name TEXT NOT NULL,
+        field TEXT NOT NULL,
+        token TEXT NOT NULL,
+        row_id INTEGER NOT NULL,
+        PRIMARY KEY (table_name, field, token, row_id)
+    ) WITHOUT ROWID
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_searchindex_row ON SearchIndex(table_name, row_id)')
+
+
+def _search_index_backfill(conn, progress):
+    for table, (id_column, fields) in INDEXED_FIELDS.items():
+        def process(c, rows, table=table, fields=fields):
+            for row in rows:
+                try:
+                    plain = {field: decrypt(value) for field, value in zip(fields, row[1:]) if value}
+                except Exception as e:
+                    progress(f"  Could not index {table} {row[0]}: {e}")
+                    continue
+                index_row(c, table, row[0], plain)
+
+        run_batched(
+            conn, f"{table} search index",
+            f'SELECT COUNT(*) FROM {table}',
+            f'SELECT {id_column}, {", ".join(fields)} FROM {table} WHERE {id_column} > ? ORDER BY {id_column} LIMIT ?',
+            process, progress,
+        )
+
+
+#-------------------------------------------------
+#                   5: Secondary indexes
+#-------------------------------------------------
+def _secondary_indexes_schema(c):
+    # Explicit restore code state instead of the 'PENDING_%' code sentinel
+    if not _column_exists(c, 'RestoreCode', 'status'):
+        c.execute("ALTER TABLE RestoreCode ADD COLUMN status TEXT NOT NULL DEFAULT 'issued'")
+        c.execute('''
+            UPDATE RestoreCode SET status = CASE
+                WHEN code LIKE 'PENDING_%' THEN 'pending'
+                WHEN is_used THEN 'used'
+                ELSE 'issued'
+            END
+        ''')
+        # Pending requests carry no code any more (UNIQUE allows many NULLs)
+        c.execute("UPDATE RestoreCode SET code = NULL WHERE status = 'pending'")
+
+    # Only plaintext columns: ciphertext has a random IV, an index on it is useless.
+    # (TempCodes needs none, its user_id is the INTEGER PRIMARY KEY.)
+    c.execute('CREATE INDEX IF NOT EXISTS idx_restorecode_admin_status ON RestoreCode(system_admin_user_id, status)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_restorecode_backup ON RestoreCode(backup_id, system_admin_user_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_restorecode_status_date ON RestoreCode(status, generated_date)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_backup_date ON Backup(backup_date)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_scooter_soc ON Scooter(state_of_charge)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_scooter_out_of_service ON Scooter(out_of_service, state_of_charge)')
+
+
+#-------------------------------------------------
+#                   6: Key rotation checkpoints
+#-------------------------------------------------
+def _key_rotation_schema(c):
+    # One row per re-encryption target of a running key rotation (dbcontext/key_rotation.py)
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS KeyRotation (
+        target TEXT PRIMARY KEY,                  -- table name, or 'activity.log'
+        key_id INTEGER NOT NULL,                  -- key being rotated to
+        position INTEGER NOT NULL DEFAULT 0,      -- last row id done (log: bytes read)
+        output_offset INTEGER NOT NULL DEFAULT 0, -- log only: bytes of the re-encrypted copy
+        processed INTEGER NOT NULL DEFAULT 0,     -- rows (log: bytes) looked at
+        changed INTEGER NOT NULL DEFAULT 0,       -- values re-encrypted
+        done INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+
+
+#-------------------------------------------------
+#                   7: Compact binary ciphertext
+#-------------------------------------------------
+def _binary_ciphertext_schema(c):
+    # Data only: SQLite keeps bytes as BLOB whatever the declared column type
+    pass
+
+
+def _binary_ciphertext_backfill(conn, progress):
+    """Store existing base64url ciphertext as raw bytes (config.CIPHERTEXT_STORAGE)."""
+    from dbcontext.reencrypt import ENCRYPTED_COLUMNS, select_batch_sql, reencrypt_rows
+    from utils.crypto_utils import to_storage
+    changed = 0
+    for table in ENCRYPTED_COLUMNS:
+        def process(c, rows, table=table):
+            nonlocal changed
+            changed += reencrypt_rows(c, table, rows, progress,
+                                      convert=lambda value, _column: to_storage(value))
+
+        run_batched(conn, f"{table} ciphertext", f'SELECT COUNT(*) FROM {table}',
+                    select_batch_sql(table), process, progress)
+    # The rows shrank in place, leaving every page part empty: repack the file
+    if changed:
+        progress("  Compacting the database file...")
+        conn.execute('VACUUM')
+
+
+#-------------------------------------------------
+#                   8: Deterministic columns
+#-------------------------------------------------
+def _deterministic_columns_schema(c):
+    # Equality filters and GROUP BY on the deterministically encrypted columns
+    c.execute('CREATE INDEX IF NOT EXISTS idx_traveller_city ON Traveller(city)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_traveller_gender ON Traveller(gender)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_user_role ON User(role)')
+
+
+def _deterministic_columns_backfill(conn, progress):
+    """Re-encrypt the columns of config.DETERMINISTIC_COLUMNS with the deterministic cipher."""
+    from config import DETERMINISTIC_COLUMNS
+    from dbcontext.reencrypt import select_batch_sql, reencrypt_rows
+    from utils.crypto_utils import reencrypt
+    for table, columns in DETERMINISTIC_COLUMNS.items():
+        def convert(value, column, columns=columns):
+            return reencrypt(value, deterministic=True) if column in columns else None
+
+        def process(c, rows, table=table, convert=convert):
+            reencrypt_rows(c, table, rows, progress, convert=convert)
+
+        run_batched(conn, f"{table} {', '.join(columns)}", f'SELECT COUNT(*) FROM {table}',
+                    select_batch_sql(table), process, progress)
+
+
+#-------------------------------------------------
+#                   9: Per-traveller data keys
+#-------------------------------------------------
+def _traveller_data_keys_schema(c):
+    # Reference to the row's wrapped data key in dbcontext/data_keys.py
+    if not _column_exists(c, 'Traveller', 'data_key_ref'):
+        c.execute('ALTER TABLE Traveller ADD COLUMN data_key_ref BLOB')
+
+
+def _traveller_data_keys_backfill(conn, progress):
+    """Give every traveller its own data key and re-encrypt its (non-deterministic) fields with it."""
+    from dbcontext.data_keys import create_data_keys, shred
+    from dbcontext.reencrypt import ENCRYPTED_COLUMNS
+    from utils.crypto_utils import is_deterministic, encrypt_with_data_key
+    columns = [column for column in ENCRYPTED_COLUMNS["Traveller"][1]
+               if not is_deterministic("Traveller", column)]
+
+    def process(c, rows):
+        unused = []
+        for (traveller_id, *values), (ref, data_key) in zip(rows, create_data_keys(len(rows))):
+            try:
+                new = [None if value is None else encrypt_with_data_key(data_key, decrypt(value))
+                       for value in values]
+            except Exception as e:
+                progress(f"  Could not convert traveller {traveller_id}: {e}")
+                unused.append(ref)
+                continue
+            # Only if the row was not given a key (or edited) meanwhile
+            c.execute(f'UPDATE Traveller SET {", ".join(f"{col} = ?" for col in columns)}, data_key_ref = ? '
+                      f'WHERE traveller_id = ? AND data_key_ref IS NULL '
+                      f'AND {" AND ".join(f"{col} IS ?" for col in columns)}',
+                      (*new, ref, traveller_id, *values))
+            if not c.rowcount:
+                unused.append(ref)
+        shred(unused)
+
+    run_batched(conn, "Traveller data keys", 'SELECT COUNT(*) FROM Traveller WHERE data_key_ref IS NULL',
+                f'SELECT traveller_id, {", ".join(columns)} FROM Traveller '
+                f'WHERE traveller_id > ? AND data_key_ref IS NULL ORDER BY traveller_id LIMIT ?',
+                process, progress)
+
+
+#-------------------------------------------------
+#                   10: Backup statistics
+#-------------------------------------------------
+def _backup_stats_schema(c):
+    # Measured by the online backup (dbcontext.connection.snapshot); NULL for older backups
+    for column, type_ in (("pages", "INTEGER"), ("duration_seconds", "REAL"), ("pages_per_second", "REAL")):
+        if not _column_exists(c, 'Backup', column):
+            c.execute(f'ALTER TABLE Backup ADD COLUMN {column} {type_}')
+
+
+#-------------------------------------------------
+#                   11: Table change counters
+#-------------------------------------------------
+def _table_changes_schema(c):
+    # Counted by triggers (dbcontext/change_tracking.py), to skip backups when nothing changed
+    from dbcontext.change_tracking import install_triggers
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS TableChanges (
+        table_name TEXT PRIMARY KEY,
+        changes INTEGER NOT NULL,           -- rows inserted, updated or deleted
+        generation TEXT NOT NULL            -- renewed by every restore
+    ) WITHOUT ROWID
+    ''')
+    install_triggers(c)
+    # Digests of the database a backup holds; a backup of an unchanged database
+    # only refers to the earlier one
+    for column, type_ in (("table_digests", "TEXT"), ("same_as_backup_id", "INTEGER")):
+        if not _column_exists(c, 'Backup', column):
+            c.execute(f'ALTER TABLE Backup ADD COLUMN {column} {type_}')
+
+
+#-------------------------------------------------
+#                   12: Traveller search tokens out of the database
+#-------------------------------------------------
+def _traveller_tokens_schema(c):
+    # Data only: the tokens move to the store of dbcontext/traveller_index.py
+    pass
+
+
+def _traveller_tokens_backfill(conn, progress):
+    """
+    Drop the Traveller search tokens from the database, so backups no longer
+    hold them; the start-up rebuilds them in their own store. The file is
+    rewritten afterwards, so no deleted token is left in its free space.
+    """
+    deleted = conn.execute("DELETE FROM SearchIndex WHERE table_name = 'Traveller'").rowcount
+    conn.commit()
+    if deleted:
+        progress(f"  Removed {deleted} traveller search tokens, compacting the database file...")
+        conn.execute('VACUUM')
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+
+#-------------------------------------------------
+#                   Repairs before a migration
+#-------------------------------------------------
+def _free_username(old: str, user_id: int, taken: set) -> str:
+    """
+    A name for a renamed account: `old` cut short so that _<user id> (or, if
+    that is taken or too long, _<user id>_<n> or _<n>) fits the 8-10
+    character username rule, not in `taken` (lower-cased names).
+    """
+    from utils.validation import validate_username
+    suffixes = [f"_{user_id}"] + [f"_{user_id}_{n}" for n in range(1, 100)] + [f"_{n}" for n in range(1, 10000)]
+    for base in (old, "user"):              # "user" if the old name breaks the rule anyway
+        for suffix in suffixes:
+            if len(suffix) > 9:
+                continue                    # leave room for at least one character of the name
+            new = (base[:10 - len(suffix)] + suffix).ljust(8, "_")
+            if new.lower() not in taken and validate_username(new)[0]:
+                return new
+    raise sqlite3.IntegrityError(f"No free username for user {user_id}")
+
+
+def _rename_duplicate_usernames(conn, progress):
+    """
+    Older versions could store usernames that differ only by case, which the
+    unique, case-insensitive index of migration 2 cannot hold twice. The
+    oldest account keeps its name; the others get a free, valid name ending
+    in _<user id> (see _free_username), reported in the output and the
+    activity log.
+    """
+    from utils.crypto_utils import encrypt
+    c = conn.cursor()
+    c.execute('SELECT user_id, username FROM User ORDER BY user_id')
+    groups: dict[str, list] = {}
+    for user_id, username in c.fetchall():
+        old = decrypt(username)
+        groups.setdefault(old.lower(), []).append((user_id, old))
+    taken = set(groups)
+    has_bidx = _column_exists(c, 'User', 'username_bidx')
+    renamed = []
+    for accounts in groups.values():
+        for user_id, old in accounts[1:]:       # the oldest account keeps its name
+            new = _free_username(old, user_id, taken)
+            c.execute('UPDATE User SET username = ? WHERE user_id = ?', (encrypt(new), user_id))
+            if has_bidx:
+                # An interrupted migration 2 may have indexed the old name: index it again
+                c.execute('UPDATE User SET username_bidx = NULL WHERE user_id = ?', (user_id,))
+            taken.add(new.lower())
+            renamed.append((user_id, old, new))
+    conn.commit()
+
+    for user_id, old, new in renamed:
+        progress(f"  Username of user {user_id} renamed from {old} to {new} (same name as an older account)")
+    try:
+        from models.log_entry import LogEntry
+        from services.log_service import write_log_entry
+        for user_id, old, new in renamed:
+            write_log_entry(LogEntry(user_id="-", username="system",
+                                     description=f"Duplicate username of user {user_id} renamed",
+                                     additional=f"{old} -> {new}", suspicious=False))
+    except Exception as e:
+        progress(f"  Could not log the renamed usernames: {e}")
+
+
+# (version, description, schema step, backfill step or None) – append only, never reorder
+MIGRATIONS: list[tuple[int, str, Callable, Optional[Callable]]] = [
+    (1, "base schema", _base_schema, None),
+    (2, "username blind index", _username_bidx_schema, _username_bidx_backfill),
+    (3, "suspicious log index", _suspicious_log_schema, None),
+    (4, "trigram search index", _search_index_schema, _search_index_backfill),
+    (5, "secondary indexes", _secondary_indexes_schema, None),
+    (6, "key rotation checkpoints", _key_rotation_schema, None),
+    (7, "compact binary ciphertext", _binary_ciphertext_schema, _binary_ciphertext_backfill),
+    (8, "deterministic columns", _deterministic_columns_schema, _deterministic_columns_backfill),
+    (9, "traveller data keys", _traveller_data_keys_schema, _traveller_data_keys_backfill),
+    (10, "backup statistics", _backup_stats_schema, None),
+    (11, "table change counters", _table_changes_schema, None),
+    (12, "traveller search tokens out of the database", _traveller_tokens_schema, _traveller_tokens_backfill),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# version -> repair run before that migration on databases that have not applied it yet
+PREPARE: dict[int, Callable] = {
+    2: _rename_duplicate_usernames,     # unique username index
+}
+
+
+def get_schema_version(conn) -> int:
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn, progress: Callable = print) -> int:
+    """Bring the database up to SCHEMA_VERSION. Returns the resulting version."""
+    version = get_schema_version(conn)
+    if version >= SCHEMA_VERSION:
+        return version
+
+    for number, description, schema, backfill in MIGRATIONS:
+        if number <= version:
+            continue
+        progress(f"Applying database migration {number}: {description}")
+        if number in PREPARE:
+            PREPARE[number](conn, progress)
+        c = conn.cursor()
+        try:
+            c.execute('BEGIN')
+            schema(c)
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        if backfill is not None:
+            backfill(conn, progress)
+        # Only counted as applied once its backfill is complete
+        conn.execute(f'PRAGMA user_version = {number}')
+        conn.commit()
+        version = number
+    return version
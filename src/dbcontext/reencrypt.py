@@ -0,0 +1,105 @@
+# dbcontext/reencrypt.py
+"""
+Re-encrypt stored values into the current cipher format (config.FIELD_CIPHER)
+and storage form (config.CIPHERTEXT_STORAGE).
+
+Walks every encrypted column in keyset-paginated batches that commit as they
+go, so the application keeps working meanwhile and an interrupted run just
+continues on the next one (values already in the current format are skipped).
+The activity log is rewritten by log_service.reencrypt_log.
+
+Run from src/:  python -m dbcontext.reencrypt
+"""
+from typing import Callable, Optional
+from config import DB_FILE
+from dbcontext.connection import get_connection
+from dbcontext.migrations import run_batched
+from utils.crypto_utils import reencrypt, is_deterministic
+
+# table -> (id column, encrypted columns)
+ENCRYPTED_COLUMNS = {
+    "User": ("user_id", ("username", "first_name", "last_name", "role")),
+    "Traveller": ("traveller_id", (
+        "first_name", "last_name", "birthday", "gender", "street_name",
+        "house_number", "zip_code", "city", "email", "mobile_phone",
+        "driving_license_no",
+    )),
+    "Scooter": ("scooter_id", ("brand", "model", "serial_number")),
+    "TempCodes": ("user_id", ("code",)),
+}
+
+
+def select_batch_sql(table: str) -> str:
+    """Keyset-paginated SELECT of (id, encrypted columns...) taking (last_id, limit)."""
+    id_column, columns = ENCRYPTED_COLUMNS[table]
+    return f'SELECT {id_column}, {", ".join(columns)} FROM {table} WHERE {id_column} > ? ORDER BY {id_column} LIMIT ?'
+
+
+def reencrypt_rows(c, table: str, rows: list, progress: Callable = print,
+                   convert: Optional[Callable] = None) -> int:
+    """
+    Re-encrypt the outdated values of `rows` (from select_batch_sql);
+    `convert(value, column)` returns a value's replacement, or None to keep it
+    (by default crypto_utils.reencrypt, deterministic for DETERMINISTIC_COLUMNS).
+    Each UPDATE only applies if the row still holds the values that were
+    read, so a concurrent edit (already written in the current format) is
+    never overwritten with older data. Returns the number of values changed.
+    """
+    id_column, columns = ENCRYPTED_COLUMNS[table]
+    changed = 0
+    for row in rows:
+        updates, expected = {}, {}
+        for column, value in zip(columns, row[1:]):
+            try:
+                if convert is None:
+                    new = reencrypt(value, deterministic=is_deterministic(table, column))
+                else:
+                    new = convert(value, column)
+            except Exception as e:
+                progress(f"  Could not convert {table}.{column} of {row[0]}: {e}")
+                continue
+            if new is not None:
+                updates[column] = new
+                expected[column] = value
+        if updates:
+            assignments = ", ".join(f"{column} = ?" for column in updates)
+            conditions = " AND ".join(f"{column} = ?" for column in expected)
+            c.execute(f'UPDATE {table} SET {assignments} WHERE {id_column} = ? AND {conditions}',
+                      (*updates.values(), row[0], *expected.values()))
+            if c.rowcount:
+                changed += len(updates)
+    return changed
+
+
+def reencrypt_table(conn, table: str, progress: Callable = print) -> int:
+    """Re-encrypt the outdated values of one table. Returns the number of values changed."""
+    changed = 0
+
+    def process(c, rows):
+        nonlocal changed
+        changed += reencrypt_rows(c, table, rows, progress)
+
+    run_batched(
+        conn, f"{table} re-encryption",
+        f'SELECT COUNT(*) FROM {table}',
+        select_batch_sql(table),
+        process, progress,
+    )
+    return changed
+
+
+def reencrypt_database(db_path: str = DB_FILE, progress: Callable = print) -> dict:
+    """Re-encrypt every encrypted column; returns values changed per table."""
+    conn = get_connection(db_path)
+    try:
+        return {table: reencrypt_table(conn, table, progress) for table in ENCRYPTED_COLUMNS}
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    from services.log_service import reencrypt_log
+    changed = reencrypt_database()
+    changed["activity.log"] = reencrypt_log()
+    for name, count in changed.items():
+        print(f"{name}: {count} value(s) re-encrypted")
@@ -0,0 +1,88 @@
+# dbcontext/traveller_index.py
+"""
+Store of the Traveller search tokens (utils/search_index.py), in a separate
+SQLite file next to the data keys (config.TRAVELLER_INDEX_FILE).
+
+The tokens are keyed hashes of trigrams, and trigrams are a small space:
+anyone holding a copy of them and the blind index key could recover the
+indexed names, e-mail addresses and phone numbers. So they are kept out of
+the database file, and with it out of every backup. Erasing a traveller
+deletes its tokens here (overwritten, see _connect) and shreds its data key,
+and no backup holds either.
+
+The tokens are derived data. TravellerService.rebuild_search_index() writes
+them again from the travellers whose data key still exists: at start-up
+when this file is missing or incomplete, and for a restored database.
+"""
+import os
+import threading
+from config import TRAVELLER_INDEX_FILE
+from dbcontext.connection import get_connection, checkpoint, close_all_connections
+
+_ready: set = set()
+_ready_lock = threading.Lock()
+
+
+def _connect(path: str = TRAVELLER_INDEX_FILE):
+    """Pooled connection to the token store, creating its tables on first use."""
+    # A staging store (see backup_service) is deleted and created again at the same path
+    fresh = not os.path.exists(path)
+    conn = get_connection(path)
+    # Deleted tokens are overwritten with zeros instead of lingering in free pages
+    conn.execute('PRAGMA secure_delete = ON')
+    if fresh or path not in _ready:
+        with _ready_lock:
+            # Same layout as the SearchIndex table of the database (migration 4)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS SearchIndex (
+                    table_name TEXT NOT NULL,
+                    field TEXT NOT NULL,
+                    token TEXT NOT NULL,
+                    row_id INTEGER NOT NULL,
+                    PRIMARY KEY (table_name, field, token, row_id)
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_searchindex_row ON SearchIndex(table_name, row_id)')
+            # 'built' is set once a rebuild has indexed every traveller
+            conn.execute('CREATE TABLE IF NOT EXISTS IndexState (name TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID')
+            conn.commit()
+            _ready.add(path)
+    return conn
+
+
+def connect(path: str = TRAVELLER_INDEX_FILE):
+    """Check out a connection to the token store (give it back with close() or a `with` block)."""
+    return _connect(path)
+
+
+def is_built(path: str = TRAVELLER_INDEX_FILE) -> bool:
+    """True if the store exists and its last rebuild ran to the end."""
+    if not os.path.exists(path):
+        return False
+    with _connect(path) as conn:
+        return conn.execute("SELECT 1 FROM IndexState WHERE name = 'built'").fetchone() is not None
+
+
+def set_built(conn, built: bool) -> None:
+    """Mark the store complete (or not, at the start of a rebuild); the caller commits."""
+    if built:
+        conn.execute("INSERT OR REPLACE INTO IndexState (name, value) VALUES ('built', datetime('now'))")
+    else:
+        conn.execute("DELETE FROM IndexState WHERE name = 'built'")
+
+
+def flush(path: str = TRAVELLER_INDEX_FILE) -> None:
+    """Checkpoint and truncate the WAL, so no copy of deleted tokens stays behind in it."""
+    checkpoint(path)
+
+
+def replace(source_path: str, path: str = TRAVELLER_INDEX_FILE) -> None:
+    """Put the (closed) store at `source_path` in place of the one at `path`."""
+    checkpoint(source_path)
+    close_all_connections(source_path)
+    checkpoint(path)
+    close_all_connections(path)
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    os.replace(source_path, path)
@@ -0,0 +1,54 @@
+# models/encrypted_field.py
+"""
+Encrypted model attributes with a per-instance memo of their plaintext.
+
+    class Scooter:
+        __slots__ = ("scooter_id", *encrypted_slots("brand"))
+        brand = EncryptedField()
+
+        @property
+        def brand_plain(self):
+            return Scooter.brand.plain(self)
+
+`scooter.brand` still reads and writes the ciphertext. plain() decrypts it on
+first use only; assigning new ciphertext drops the memo, so a stale plaintext
+is never returned. The values live in two slots per field (`_brand` and
+`_brand_memo`), which keeps large in-memory collections compact.
+
+Models with envelope encryption (Traveller) keep the record's data key in a
+`_data_key` slot; plain() passes it along to decrypt values encrypted with it.
+"""
+from utils.crypto_utils import decrypt
+
+_UNSET = object()
+
+
+def encrypted_slots(*names: str) -> tuple[str, ...]:
+    """The __slots__ entries backing the EncryptedFields called `names`."""
+    return tuple(slot for name in names for slot in (f"_{name}", f"_{name}_memo"))
+
+
+class EncryptedField:
+    """Data descriptor holding ciphertext, with memoized decryption."""
+
+    def __set_name__(self, owner, name: str) -> None:
+        self.name = name
+        self.slot = f"_{name}"
+        self.memo = f"_{name}_memo"
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return getattr(obj, self.slot, None)
+
+    def __set__(self, obj, token) -> None:
+        setattr(obj, self.slot, token)
+        setattr(obj, self.memo, _UNSET)
+
+    def plain(self, obj):
+        """Decrypted value (None when unset), decrypted at most once per assignment."""
+        value = getattr(obj, self.memo, _UNSET)
+        if value is _UNSET:
+            value = decrypt(getattr(obj, self.slot, None), getattr(obj, "_data_key", None))
+            setattr(obj, self.memo, value)
+        return value
@@ -0,0 +1,37 @@
+# models/principal.py
+from typing import Optional
+
+
+class Principal:
+    """
+    Who is acting: the plain id, username and role of a logged-in user.
+    Used for permission checks instead of a full User, so a check costs no
+    database read, no decryption and no password hashing.
+    """
+    __slots__ = ("user_id", "username", "role")
+
+    def __init__(self, user_id: Optional[int], username: str, role: str) -> None:
+        self.user_id = user_id
+        self.username = username
+        self.role = role
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        """Principal of a stored User (decrypts its username and role once)."""
+        return cls(user.user_id, user.username_plain, user.role_plain)
+
+    # Same names as on User, for code that checks either
+    @property
+    def username_plain(self) -> str:
+        return self.username
+
+    @property
+    def role_plain(self) -> str:
+        return self.role
+
+    def __repr__(self) -> str:
+        return f"Principal(user_id={self.user_id}, username={self.username}, role={self.role})"
+
+
+# The hard-coded super admin (user id 0) has no row in the User table
+SUPER_ADMIN = Principal(0, "super_admin", "super")
@@ -1,11 +1,24 @@
 import re, random
 from datetime import datetime
 from typing import Optional
-from utils.crypto_utils import encrypt, decrypt
+from utils.crypto_utils import encrypt
+from models.encrypted_field import EncryptedField, encrypted_slots
 from utils.validation import validate_brand, validate_model, validate_serial_number, validate_scooter_date, TOP_SPEED_MIN, TOP_SPEED_MAX, BATTERY_CAP_MAX, MILEAGE_MAX
 
 
 class Scooter:
+    __slots__ = (
+        "scooter_id", "top_speed", "battery_capacity", "state_of_charge",
+        "target_soc_min", "target_soc_max", "location_lat", "location_lon",
+        "out_of_service", "mileage", "last_maint_date", "in_service_date",
+        *encrypted_slots("brand", "model", "serial_number"),
+    )
+
+    # Ciphertext attributes, their plaintext is decrypted once and memoized
+    brand = EncryptedField()
+    model = EncryptedField()
+    serial_number = EncryptedField()
+
     def __init__(
         self,
         brand: str,
@@ -92,19 +105,34 @@ class Scooter:
         self.last_maint_date = last_maint_date  # string YYYY-MM-DD or None
         self.in_service_date = in_service_date_str  # string YYYY-MM-DD
 
+    @classmethod
+    def from_row(cls, row: tuple) -> "Scooter":
+        """
+        Build a Scooter from a stored `SELECT * FROM Scooter` row.
+        Skips validation and encryption: the row was validated when it was
+        written, and its ciphertext is kept as-is until a *_plain getter needs it.
+        """
+        scooter = cls.__new__(cls)
+        (scooter.scooter_id, scooter.brand, scooter.model, scooter.serial_number,
+         scooter.top_speed, scooter.battery_capacity, scooter.state_of_charge,
+         scooter.target_soc_min, scooter.target_soc_max, scooter.location_lat,
+         scooter.location_lon, scooter.out_of_service, scooter.mileage,
+         scooter.last_maint_date, scooter.in_service_date) = row[:15]
+        scooter.out_of_service = int(bool(scooter.out_of_service))
+        return scooter
 
     # Getters (plain text)
     @property
     def brand_plain(self) -> str:
-        return decrypt(self.brand)
+        return Scooter.brand.plain(self)
 
     @property
     def model_plain(self) -> str:
-        return decrypt(self.model)
+        return Scooter.model.plain(self)
 
     @property
     def serial_number_plain(self) -> str:
-        return decrypt(self.serial_number)
+        return Scooter.serial_number.plain(self)
 
     @property
     def is_out_of_service(self) -> bool:
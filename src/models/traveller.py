@@ -1,7 +1,8 @@
 # models/traveller.py
 from datetime import datetime, date
 from typing import Optional
-from utils.crypto_utils import encrypt, decrypt
+from utils.crypto_utils import encrypt_field, generate_data_key
+from models.encrypted_field import EncryptedField, encrypted_slots
 from utils.validation import (
     validate_first_name, validate_last_name, validate_birthday,
     validate_gender, validate_street_name, validate_house_number,
@@ -11,6 +12,27 @@ from utils.validation import (
 
 
 class Traveller:
+    __slots__ = (
+        "traveller_id", "registration_date", "data_key_ref", "_data_key",
+        *encrypted_slots(
+            "first_name", "last_name", "birthday", "gender", "street_name", "house_number",
+            "zip_code", "city", "email", "mobile_phone", "driving_license_no",
+        ),
+    )
+
+    # Ciphertext attributes, their plaintext is decrypted once and memoized
+    first_name = EncryptedField()
+    last_name = EncryptedField()
+    birthday = EncryptedField()
+    gender = EncryptedField()
+    street_name = EncryptedField()
+    house_number = EncryptedField()
+    zip_code = EncryptedField()
+    city = EncryptedField()
+    email = EncryptedField()
+    mobile_phone = EncryptedField()
+    driving_license_no = EncryptedField()
+
     def __init__(
         self,
         first_name: str,
@@ -67,65 +89,94 @@ class Traveller:
         if traveller_id is not None and not isinstance(traveller_id, int):
             raise ValueError("traveller_id must be an integer")
     
-        # store(encrypted)
+        # store(encrypted) with the traveller's own data key; the service stores
+        # the (wrapped) key in dbcontext.data_keys and sets data_key_ref
         self.traveller_id       = traveller_id
         self.registration_date  = datetime.now()
-        self.first_name         = encrypt(first_name)
-        self.last_name          = encrypt(last_name)
-        self.birthday           = encrypt(birthday)
-        self.gender             = encrypt(gender)
-        self.street_name        = encrypt(street_name)
-        self.house_number       = encrypt(house_number)
-        self.zip_code           = encrypt(zip_code)
-        self.city               = encrypt(city)
-        self.email              = encrypt(email)
-        self.mobile_phone       = encrypt(mobile_phone)
-        self.driving_license_no = encrypt(driving_license_no)
+        key = generate_data_key()
+        self.data_key_ref       = None
+        self._data_key          = key
+        self.first_name         = encrypt_field("Traveller", "first_name", first_name, key)
+        self.last_name          = encrypt_field("Traveller", "last_name", last_name, key)
+        self.birthday           = encrypt_field("Traveller", "birthday", birthday, key)
+        self.gender             = encrypt_field("Traveller", "gender", gender, key)
+        self.street_name        = encrypt_field("Traveller", "street_name", street_name, key)
+        self.house_number       = encrypt_field("Traveller", "house_number", house_number, key)
+        self.zip_code           = encrypt_field("Traveller", "zip_code", zip_code, key)
+        self.city               = encrypt_field("Traveller", "city", city, key)
+        self.email              = encrypt_field("Traveller", "email", email, key)
+        self.mobile_phone       = encrypt_field("Traveller", "mobile_phone", mobile_phone, key)
+        self.driving_license_no = encrypt_field("Traveller", "driving_license_no", driving_license_no, key)
+
+    @classmethod
+    def from_row(cls, row: tuple, data_key: Optional[bytes] = None) -> "Traveller":
+        """
+        Build a Traveller from a stored row of
+        (traveller_id, first_name, ..., driving_license_no, registration_date[, data_key_ref]),
+        i.e. the columns in table order with registration_date last, and the
+        row's unwrapped data key (see dbcontext.data_keys.load_data_keys).
+        Skips validation and encryption: the row was validated when it was
+        written, and its ciphertext is kept as-is until a *_plain getter needs it.
+        """
+        traveller = cls.__new__(cls)
+        (traveller.traveller_id, traveller.first_name, traveller.last_name,
+         traveller.birthday, traveller.gender, traveller.street_name,
+         traveller.house_number, traveller.zip_code, traveller.city,
+         traveller.email, traveller.mobile_phone, traveller.driving_license_no,
+         traveller.registration_date) = row[:13]
+        traveller.data_key_ref = row[13] if len(row) > 13 else None
+        traveller._data_key = data_key
+        return traveller
+
+    @property
+    def data_key(self) -> Optional[bytes]:
+        """The traveller's own data key (None for rows from before envelope encryption)."""
+        return self._data_key
 
 
     @property
     def first_name_plain(self) -> str:
-        return decrypt(self.first_name)
+        return Traveller.first_name.plain(self)
 
     @property
     def last_name_plain(self) -> str:
-        return decrypt(self.last_name)
+        return Traveller.last_name.plain(self)
 
     @property
     def birthday_plain(self) -> str:
-        return decrypt(self.birthday)
+        return Traveller.birthday.plain(self)
 
     @property
     def gender_plain(self) -> str:
-        return decrypt(self.gender)
+        return Traveller.gender.plain(self)
 
     @property
     def street_name_plain(self) -> str:
-        return decrypt(self.street_name)
+        return Traveller.street_name.plain(self)
 
     @property
     def house_number_plain(self) -> str:
-        return decrypt(self.house_number)
+        return Traveller.house_number.plain(self)
 
     @property
     def zip_code_plain(self) -> str:
-        return decrypt(self.zip_code)
+        return Traveller.zip_code.plain(self)
 
     @property
     def city_plain(self) -> str:
-        return decrypt(self.city)
+        return Traveller.city.plain(self)
 
     @property
     def email_plain(self) -> str:
-        return decrypt(self.email)
+        return Traveller.email.plain(self)
 
     @property
     def mobile_phone_plain(self) -> str:
-        return decrypt(self.mobile_phone)
+        return Traveller.mobile_phone.plain(self)
 
     @property
     def driving_license_no_plain(self) -> str:
-        return decrypt(self.driving_license_no)
+        return Traveller.driving_license_no.plain(self)
 
     @property
     def full_name(self) -> str:
@@ -2,12 +2,24 @@
 import re, random
 from datetime import datetime
 from typing import Optional
-from utils.crypto_utils import encrypt, decrypt, hash_password, check_password
+from utils.crypto_utils import encrypt, encrypt_field, hash_password, check_password
+from models.encrypted_field import EncryptedField, encrypted_slots
 from utils.validation import validate_username, validate_password, validate_first_name, validate_last_name
 
 
 
 class User:
+    __slots__ = (
+        "user_id", "password_hash", "registration_date",
+        *encrypted_slots("username", "role", "first_name", "last_name"),
+    )
+
+    # Ciphertext attributes, their plaintext is decrypted once and memoized
+    username = EncryptedField()
+    role = EncryptedField()
+    first_name = EncryptedField()
+    last_name = EncryptedField()
+
     def __init__(
         self,
         username: str,
@@ -70,7 +82,7 @@ class User:
         else:
             self.password_hash: bytes = hash_password(password_plain)
             
-        self.role: str = encrypt(role)  # Store role encrypted
+        self.role: str = encrypt_field("User", "role", role)  # Store role encrypted (deterministic when configured)
 
         # Optional profile (encrypted)
         self.user_id = user_id
@@ -83,30 +95,43 @@ class User:
         else:
             self.registration_date = datetime.now().isoformat()
 
+    @classmethod
+    def from_row(cls, row: tuple) -> "User":
+        """
+        Build a User from a stored row of
+        (user_id, username, first_name, last_name, role, registration_date, password_hash).
+        Skips validation and encryption: the row was validated when it was
+        written, and its ciphertext is kept as-is until a *_plain getter needs it.
+        """
+        user = cls.__new__(cls)
+        (user.user_id, user.username, user.first_name, user.last_name,
+         user.role, user.registration_date, password_hash) = row[:7]
+        # Handle NULL password_hash by providing a default empty value
+        user.password_hash = password_hash if password_hash is not None else b''
+        return user
+
     def verify_password(self, password_input: str) -> bool:
         return check_password(password_input, self.password_hash)
 
     @property
     def username_plain(self) -> str:
-        return decrypt(self.username)
+        return User.username.plain(self)
 
     @property
     def role_plain(self) -> str:
-        return decrypt(self.role)
+        return User.role.plain(self)
 
     @property
     def first_name_plain(self) -> str:
-        return decrypt(self.first_name) if self.first_name else ""
+        return User.first_name.plain(self) if self.first_name else ""
 
     @property
     def last_name_plain(self) -> str:
-        return decrypt(self.last_name) if self.last_name else ""
+        return User.last_name.plain(self) if self.last_name else ""
 
     @property
     def full_name(self) -> str:
-        first = decrypt(self.first_name) if self.first_name else ""
-        last  = decrypt(self.last_name)  if self.last_name  else ""
-        return f"{first} {last}"
+        return f"{self.first_name_plain} {self.last_name_plain}"
 
     def __repr__(self) -> str:
         uname = self.username_plain if self.username else "<unset>"
@@ -0,0 +1,516 @@
+import os
+import json
+import zipfile
+import shutil
+import time
+from datetime import datetime
+import sqlite3
+from services.userservice import user_service
+from services.restore_code_service import restore_code_service
+from services.traveller_service import traveller_service, TravellerService
+from services.log_service import pause_log_writer, resume_log_writer
+from typing import Optional, Tuple
+from config import DB_FILE, BACKUP_DIR, BACKUP_MODE, TRAVELLER_INDEX_FILE
+from dbcontext.connection import (
+    get_connection, close_all_connections, checkpoint, snapshot, pause_connections, resume_connections
+)
+from dbcontext.migrations import migrate
+from dbcontext import key_rotation, chunk_store, archive, change_tracking, traveller_index
+from utils.crypto_utils import active_key_id
+
+class BackupService:
+    def __init__(self):
+        if not os.path.exists(BACKUP_DIR):
+            os.makedirs(BACKUP_DIR)
+
+    def create_db_backup(self, user_id):
+        # Check permissions (user id 0 is the super admin)
+        user = user_service.get_principal(user_id)
+        
+        if not user:
+            return False, 'User not found.'
+        
+        if user.role_plain not in ('system_admin', 'super'):
+            return False, 'Only system admin or super admin can create database backups.'
+
+        # Nothing written since the latest backup: refer to it instead of copying again
+        conn = get_connection(DB_FILE)
+        try:
+            digests = change_tracking.table_digests(conn)
+            latest = self._latest_backup(conn.cursor())
+        finally:
+            conn.close()
+        if latest and latest['table_digests'] == digests:
+            return self._record_same_backup(latest, user_id)
+
+        # Down to the microsecond: two backups in one second must not share a file
+        timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S_%f')
+        if BACKUP_MODE == "incremental":
+            backup_filename = f'db_backup_{timestamp}{chunk_store.MANIFEST_SUFFIX}'
+        else:
+            backup_filename = f'db_backup_{timestamp}{archive.ARCHIVE_SUFFIX}'
+        backup_path = os.path.join(BACKUP_DIR, backup_filename)
+        if os.path.exists(backup_path):
+            return False, 'A backup with this name already exists, please try again.'
+        snapshot_path = os.path.join(BACKUP_DIR, f'db_snapshot_{timestamp}.db')
+        stored = ""
+
+        try:
+            # A consistent copy taken in small steps while the database stays in use,
+            # then stored from that copy instead of from the live file
+            start = time.perf_counter()
+            pages, snapshot_seconds = snapshot(snapshot_path)
+            # Read from the snapshot itself, so they match its contents exactly
+            snapshot_conn = sqlite3.connect(snapshot_path)
+            try:
+                digests = change_tracking.table_digests(snapshot_conn)
+            finally:
+                snapshot_conn.close()
+            if BACKUP_MODE == "incremental":
+                # Only the chunks no earlier backup has are written
+                stats = chunk_store.store_file(snapshot_path, backup_path)
+                stored = f", {stats['new_chunks']} of {stats['chunks']} chunks new"
+            else:
+                # Chunks compressed in parallel (config.BACKUP_CODEC, BACKUP_COMPRESSION_THREADS)
+                stats = archive.create_archive(snapshot_path, backup_path)
+                stored = f", {stats['codec']} {stats['archive_bytes']} of {stats['bytes']} bytes"
+            duration = time.perf_counter() - start
+        except Exception as e:
+            return False, f'Failed to create DB zip: {e}'
+        finally:
+            if os.path.exists(snapshot_path):
+                os.remove(snapshot_path)
+        # Copy rate of the snapshot itself; the duration includes the compression
+        pages_per_second = pages / snapshot_seconds if snapshot_seconds > 0 else None
+
+        with get_connection(DB_FILE) as conn:
+            c = conn.cursor()
+            c.execute('''
+                INSERT INTO Backup (backup_date, file_path, created_by_user_id,
+                                    pages, duration_seconds, pages_per_second, table_digests)
+                VALUES (datetime('now'), ?, ?, ?, ?, ?, ?)
+            ''', (backup_path, None if user_id == 0 else user_id, pages, duration, pages_per_second,
+                  json.dumps(digests)))
+            conn.commit()
+
+        return True, (f'Database backup created successfully '
+                      f'({pages} pages in {duration:.2f}s, {pages_per_second or 0:.0f} pages/s{stored})')
+
+    def _latest_backup(self, c) -> Optional[dict]:
+        """The most recent backup with table digests, None if there is none or its file is gone."""
+        c.execute('''
+            SELECT backup_id, backup_date, file_path, pages, table_digests, same_as_backup_id
+            FROM Backup WHERE table_digests IS NOT NULL
+            ORDER BY backup_id DESC LIMIT 1
+        ''')
+        row = c.fetchone()
+        if not row or not os.path.exists(row[2]):
+            return None
+        backup_id, backup_date, file_path, pages, digests, same_as_backup_id = row
+        return {
+            'backup_id': backup_id,
+            'backup_date': backup_date,
+            'file_path': file_path,
+            'pages': pages,
+            'table_digests': json.loads(digests),
+            # The backup that actually made the copy
+            'original_id': same_as_backup_id or backup_id,
+        }
+
+    def _record_same_backup(self, latest: dict, user_id: int) -> Tuple[bool, str]:
+        """Record a backup sharing the file of `latest`, whose data is unchanged."""
+        success = False  # Whitelist: default to False
+        conn = get_connection(DB_FILE)
+        try:
+            conn.execute('''
+                INSERT INTO Backup (backup_date, file_path, created_by_user_id, pages, duration_seconds,
+                                    pages_per_second, table_digests, same_as_backup_id)
+                VALUES (datetime('now'), ?, ?, ?, 0, NULL, ?, ?)
+            ''', (latest['file_path'], None if user_id == 0 else user_id, latest['pages'],
+                  json.dumps(latest['table_digests']), latest['original_id']))
+            conn.commit()
+            success = True
+            message = (f"Database backup created successfully (nothing changed since backup "
+                       f"{latest['original_id']}, recorded as the same backup without copying)")
+        except Exception as e:
+            conn.rollback()
+            print(f"Error recording backup: {str(e)}")
+            message = f"Failed to record backup: {e}"
+        finally:
+            conn.close()
+        return success, message
+
+    def is_backup_current(self) -> Tuple[bool, str]:
+        """Whether the latest backup holds the current data, and if not which tables changed."""
+        conn = get_connection(DB_FILE)
+        try:
+            digests = change_tracking.table_digests(conn)
+            latest = self._latest_backup(conn.cursor())
+        finally:
+            conn.close()
+        if not latest:
+            return False, "There is no backup of the current data yet."
+        changed = change_tracking.changed_tables(latest['table_digests'], digests)
+        if not changed:
+            return True, f"The latest backup ({latest['backup_id']}, {latest['backup_date']}) is current."
+        return False, (f"Changed since the latest backup ({latest['backup_id']}, {latest['backup_date']}): "
+                       f"{', '.join(changed)}")
+
+    def restore_backup_with_code(self, code: str, system_admin_user_id: int) -> Tuple[bool, str]:
+        """
+        Restore a backup using a restore code.
+        Only the system admin who requested the code can use it.
+        """
+        
+        # Check if user is a system admin
+        user = user_service.get_principal(system_admin_user_id)
+        
+        if not user:
+            return False, "User not found."
+        
+        if user.role_plain != 'system_admin':
+            return False, "Only system admins can restore backups with codes."
+
+        # Verify the code and get backup_id
+        success, message, backup_id = restore_code_service.verify_and_use_code(code, system_admin_user_id)
+        
+        if not success:
+            return False, message
+
+        # Perform the restore
+        success, message = self._perform_restore(backup_id, system_admin_user_id)
+        
+        if success:
+            # For system admin restore, only delete the specific backup that was restored
+            self._delete_specific_backup(backup_id)
+            return True, f"{message} The restored backup has been removed from the database."
+        return success, message
+
+    def restore_backup_direct(self, backup_id: int, user_id: int) -> Tuple[bool, str]:
+        """
+        Restore a backup directly (super admin only).
+        This will wipe all older backups.
+        """        
+        # Check if user is a super admin (user id 0 is the super admin)
+        user = user_service.get_principal(user_id)
+        
+        if not user:
+            return False, "User not found."
+        
+        if user.role_plain != 'super':
+            return False, "Only super admins can restore backups directly."
+        
+        # Perform the restore
+        success, message = self._perform_restore(backup_id, user_id)
+        if success:
+            # Wipe all older backups (super admin behavior)
+            self._wipe_older_backups(backup_id)
+            return True, f"{message} All older backups have been wiped."
+        return success, message
+
+    def _perform_restore(self, backup_id: int, user_id: int) -> Tuple[bool, str]:
+        """Internal method to perform the actual restore operation."""
+        
+        # Get backup details
+        with get_connection(DB_FILE) as conn:
+            c = conn.cursor()
+            c.execute('SELECT file_path FROM Backup WHERE backup_id = ?', (backup_id,))
+            row = c.fetchone()
+
+        if not row:
+            return False, "Backup not found."
+
+        backup_path = row[0]
+        if not os.path.exists(backup_path):
+            return False, "Backup file not found on disk."
+
+        try:
+            # All backups are now database backups
+            return self._restore_database_backup(backup_path)
+        except Exception as e:
+            return False, f"Restore failed: {str(e)}"
+
+    def _restore_database_backup(self, backup_path: str) -> Tuple[bool, str]:
+        """
+        Restore database from backup while preserving current user passwords.
+        The backup is rebuilt, checked and migrated in a staging file while the
+        live database stays in use; the live file is only closed for the swap.
+        """
+        staging_path = os.path.splitext(DB_FILE)[0] + '.restore.db'
+        staging_index_path = os.path.splitext(TRAVELLER_INDEX_FILE)[0] + '.restore.db'
+        try:
+            # Keep a copy of the current database (a consistent online snapshot)
+            timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S_%f')
+            current_db_backup = os.path.join(BACKUP_DIR, f'pre_restore_db_{timestamp}.db')
+            snapshot(current_db_backup)
+
+            # 1 Rebuild the backup into the staging file, never over the live one
+            self._remove_file(staging_path)
+            if chunk_store.is_manifest(backup_path):
+                chunk_store.restore_file(backup_path, staging_path)
+            elif archive.is_archive(backup_path):
+                archive.extract_archive(backup_path, staging_path)
+            else:
+                self._extract_zip_backup(backup_path, staging_path)
+
+            # 2 Check it, and bring it up to the current schema (a backup taken by an
+            #   older version lacks later schema changes)
+            try:
+                conn = get_connection(staging_path)
+                result = conn.execute('PRAGMA integrity_check').fetchone()[0]
+            except sqlite3.DatabaseError as e:
+                conn, result = None, str(e)
+            try:
+                if result != 'ok':
+                    return False, f"Database restore failed: the backup is damaged ({result})"
+                migrate(conn)
+                # Its counters restart from the backup's: keep them from matching later backups
+                change_tracking.new_generation(conn)
+                conn.commit()
+            finally:
+                if conn is not None:
+                    conn.close()
+
+            # Backups hold no traveller search tokens: index the restored travellers
+            # (erased ones cannot be decrypted, so they stay out) in a staging store
+            self._remove_file(staging_index_path)
+            TravellerService(staging_path).rebuild_search_index(staging_index_path, progress=lambda _: None)
+
+            # 3 Swap: the only part during which the database is unavailable. Every
+            #   thread that could touch the files is stopped first: the key rotation,
+            #   the audit-log writer (it indexes suspicious entries) and, through the
+            #   pools, any other thread holding a connection; a connection kept open
+            #   across the swap would checkpoint into the old file or unlink the new -wal
+            key_rotation.pause_rotation()
+            try:
+                start = time.perf_counter()
+                # Restore current passwords to prevent security vulnerability
+                self._restore_current_passwords(self._backup_current_passwords(), staging_path)
+                checkpoint(staging_path)
+                close_all_connections(staging_path)
+                pause_log_writer()
+                paused = []
+                try:
+                    for path in (DB_FILE, TRAVELLER_INDEX_FILE):
+                        pause_connections(path)
+                        paused.append(path)
+                    # A leftover -wal/-shm would be replayed on top of the restored file
+                    checkpoint(DB_FILE)
+                    close_all_connections(DB_FILE)
+                    self._remove_wal_files()
+                    os.replace(staging_path, DB_FILE)
+                    traveller_index.replace(staging_index_path)
+                    with get_connection(DB_FILE) as conn:          # reopen the pool on the new file
+                        conn.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+
+                    # Users (and their roles) are those of the backup now
+                    user_service.invalidate_principal()
+
+                    # Travellers erased after this backup was taken have no data key any more
+                    purged = traveller_service.purge_erased_travellers()
+
+                    # The restored rows may predate the rotation checkpoints: rescan them
+                    key_rotation.restart_after_restore()
+                finally:
+                    for path in paused:
+                        resume_connections(path)
+                    resume_log_writer()
+                downtime_ms = (time.perf_counter() - start) * 1000
+            finally:
+                # Also after a failed swap: a paused rotation must not stay stopped
+                try:
+                    key_rotation.resume_rotation()
+                except Exception as e:
+                    print(f"Could not resume key rotation: {str(e)}")
+
+            # The restored Backup table lacks the backups made after this one: recount
+            # the chunk references from the manifests on disk, which still hold them
+            try:
+                chunk_store.collect_garbage()
+            except Exception as e:
+                print(f"Could not check the backup chunk store: {str(e)}")
+
+            message = (f"Database restored successfully (current passwords preserved, "
+                       f"downtime {downtime_ms:.0f} ms)")
+            if purged:
+                message += f", {purged} erased traveller(s) left out"
+            return True, message
+        except Exception as e:
+            return False, f"Database restore failed: {str(e)}"
+        finally:
+            for path in (staging_path, staging_index_path):
+                close_all_connections(path)
+                for suffix in ('', '-wal', '-shm'):
+                    self._remove_file(path + suffix)
+
+    def _extract_zip_backup(self, backup_path: str, dest_path: str):
+        """Copy the database out of a zip backup (the format used before archives) to dest_path."""
+        with zipfile.ZipFile(backup_path, 'r') as zipf:
+            names = zipf.namelist()
+            name = os.path.basename(DB_FILE) if os.path.basename(DB_FILE) in names else names[0]
+            with zipf.open(name) as src, open(dest_path, 'wb') as out:
+                shutil.copyfileobj(src, out, 1024 * 1024)
+
+    @staticmethod
+    def _remove_file(path: str):
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _remove_backup_file(self, file_path: str, c=None):
+        """
+        Delete a backup zip, or a manifest together with the chunks only it used.
+        With cursor `c`, the file is kept while another Backup row still refers to it.
+        """
+        if c is not None:
+            c.execute('SELECT 1 FROM Backup WHERE file_path = ? LIMIT 1', (file_path,))
+            if c.fetchone():
+                return
+        try:
+            if chunk_store.is_manifest(file_path):
+                chunk_store.release(file_path)
+            elif os.path.exists(file_path):
+                os.remove(file_path)
+        except Exception:
+            pass  # Continue even if file deletion fails
+
+    def _remove_wal_files(self):
+        """Delete the WAL and shared-memory files of the (checkpointed, closed) database."""
+        for suffix in ('-wal', '-shm'):
+            path = DB_FILE + suffix
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _backup_current_passwords(self) -> dict:
+        """Backup current user passwords before database restore."""
+        with get_connection(DB_FILE) as conn:
+            c = conn.cursor()
+        
+            # Get all current user passwords
+            c.execute('SELECT user_id, password_hash FROM User WHERE password_hash IS NOT NULL')
+            rows = c.fetchall()
+        
+        # Store as {user_id: password_hash}
+        current_passwords = {row[0]: row[1] for row in rows}
+        return current_passwords
+
+    def _restore_current_passwords(self, current_passwords: dict, db_path: str = DB_FILE):
+        """Restore current user passwords after database restore, in one transaction."""
+        if not current_passwords:
+            return
+            
+        conn = get_connection(db_path)
+        c = conn.cursor()
+        
+        try:
+            # Update passwords for users that exist in the restored database
+            c.executemany('''
+                UPDATE User 
+                SET password_hash = ? 
+                WHERE user_id = ? AND password_hash IS NOT NULL
+            ''', [(password_hash, user_id) for user_id, password_hash in current_passwords.items()])
+            
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"Error restoring passwords: {str(e)}")
+        finally:
+            conn.close()
+
+    def _wipe_older_backups(self, current_backup_id: int):
+        """Wipe all backups older than the current one."""
+        with get_connection(DB_FILE) as conn:
+            c = conn.cursor()
+        
+            # Get all backup IDs older than the current one
+            c.execute('''
+                SELECT backup_id, file_path FROM Backup 
+                WHERE backup_id < ? 
+                ORDER BY backup_id
+            ''', (current_backup_id,))
+        
+            old_backups = c.fetchall()
+        
+            for backup_id, file_path in old_backups:
+                # Delete from database
+                c.execute('DELETE FROM Backup WHERE backup_id = ?', (backup_id,))
+
+                # Delete file from disk, unless a newer "same as" backup uses it
+                self._remove_backup_file(file_path, c)
+            
+                # Delete associated restore codes
+                c.execute('DELETE FROM RestoreCode WHERE backup_id = ?', (backup_id,))
+        
+            conn.commit()
+
+    def start_key_rotation(self) -> Tuple[bool, str]:
+        """Switch to a new field encryption key and re-encrypt stored data in the background."""
+        success = False  # Whitelist: default to False
+        try:
+            key_rotation.start_rotation()
+            success = True
+            message = f"Key rotation started; new data is encrypted with key {active_key_id()}."
+        except Exception as e:
+            print(f"Error starting key rotation: {e}")
+            message = f"Could not start key rotation: {e}"
+        return success, message
+
+    def get_key_rotation_status(self):
+        """Progress of the current or last key rotation, None if there never was one."""
+        return key_rotation.rotation_status()
+
+    def get_backup_list(self):
+        """Get list of all backups."""
+        return restore_code_service.get_backup_list()
+
+    def generate_restore_code(self, backup_id: int, super_admin_user_id: int, system_admin_user_id: int) -> Tuple[bool, str]:
+        """Generate a restore code for a specific backup."""
+        return restore_code_service.generate_code(backup_id, system_admin_user_id)
+
+    def get_user_restore_codes(self, system_admin_user_id: int):
+        """Get all restore codes for a specific system admin."""
+        return restore_code_service.get_user_restore_codes(system_admin_user_id)
+
+    def create_restore_request(self, backup_id: int, system_admin_user_id: int) -> Tuple[bool, str]:
+        """Create a restore code request from a system admin."""
+        return restore_code_service.create_restore_request(backup_id, system_admin_user_id)
+
+    def get_pending_requests(self):
+        """Get all pending restore code requests."""
+        return restore_code_service.get_pending_requests()
+
+    def get_user_pending_requests(self, system_admin_user_id: int):
+        """Get pending restore code requests for a specific system admin."""
+        return restore_code_service.get_user_pending_requests(system_admin_user_id)
+
+    def mark_request_completed(self, request_id: int) -> bool:
+        """Mark a restore code request as completed."""
+        return restore_code_service.mark_request_completed(request_id)
+
+    def _delete_specific_backup(self, backup_id: int):
+        """Delete a specific backup and its associated restore codes."""
+        conn = get_connection(DB_FILE)
+        c = conn.cursor()
+        
+        try:
+            # Get backup file path before deletion
+            c.execute('SELECT file_path FROM Backup WHERE backup_id = ?', (backup_id,))
+            row = c.fetchone()
+
+            # Delete from database
+            c.execute('DELETE FROM Backup WHERE backup_id = ?', (backup_id,))
+
+            if row:
+                # Delete file from disk, unless another backup shares it
+                self._remove_backup_file(row[0], c)
+            
+            # Delete associated restore codes
+            c.execute('DELETE FROM RestoreCode WHERE backup_id = ?', (backup_id,))
+            
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"Error deleting backup: {str(e)}")
+        finally:
+            conn.close()
+
+backup_service = BackupService() 
\ No newline at end of file
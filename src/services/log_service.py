@@ -1,41 +1,339 @@
 # services/log_service.py
 import os
+import json
+import time
+import queue
+import atexit
+import threading
 from models.log_entry import LogEntry
-from utils.crypto_utils import decrypt, encrypt
+from utils.crypto_utils import decrypt, decrypt_many, encrypt_text, reencrypt
 from collections import defaultdict
+from itertools import islice
 from models.log_entry import LogEntry
 import sqlite3
 from pathlib import Path
-from config import DB_FILE, LOG_FILE
+from dbcontext.connection import get_connection
+from config import DB_FILE, LOG_FILE, LOG_HEAD_FILE, LOG_WRITER_MODE, LOG_DURABILITY, LOG_FLUSH_INTERVAL_MS
 
 _failed_counter = defaultdict(int)   # username -> consecutive fails
 
+# Guards the log file and its head record (appends must not interleave)
+_log_lock = threading.RLock()
+_head: dict | None = None            # cached head record, see _load_head()
+_TAIL_BLOCK_SIZE = 64 * 1024         # bytes read per step by the reverse reader
+
+
+# Suspicious log ids not yet in SuspiciousLog, see _index_suspicious()
+_pending_suspicious: set[int] = set()
+_pending_lock = threading.Lock()
+
+_READ_BATCH_SIZE = 1000             # log lines decrypted together by full reads
+REKEY_FILE = LOG_FILE + ".rekey"     # log copy being re-encrypted, see reencrypt_log_step()
+
+
+def _parse_line(token: bytes) -> LogEntry:
+    """Decrypt one log line into a LogEntry (raises on corrupted lines)."""
+    return _entry_from_line(decrypt(token.strip()))
+
+
+def _parse_lines(tokens: list[bytes]) -> list[LogEntry]:
+    """Decrypt a batch of log lines at once; corrupted lines are skipped."""
+    lines, _errors = decrypt_many([token.strip() for token in tokens])
+    entries = []
+    for line in lines:
+        if line is None:
+            continue
+        try:
+            entries.append(_entry_from_line(line))
+        except Exception:
+            # corrupted line? skip
+            continue
+    return entries
+
+
+def _entry_from_line(line: str) -> LogEntry:
+    """Build a LogEntry from a decrypted "log_id|date|time|username|description|additional|flag|user_id" line."""
+    parts = line.split("|")
+    return LogEntry(
+        user_id=parts[7],
+        username=parts[3],
+        description=parts[4],
+        additional=parts[5],
+        suspicious=(parts[6] == "Yes"),
+        log_id=int(parts[0]),
+        date=parts[1],
+        time=parts[2]
+    )
+
+
+def _scan_log(head: dict) -> dict:
+    """
+    Extend a head record with every complete line after head["offset"].
+    Used to rebuild the head (offset 0) or to catch up after a crash
+    between an append and the head update.
+    """
+    last_id = head["last_id"]
+    offset = head["offset"]
+    last_suspicious_id = head["last_suspicious_id"]
+    token = b"\n"
+    with open(LOG_FILE, "rb") as f:
+        f.seek(offset)
+        for token in f:
+            last_id += 1                 # each line is one entry -> line count == last id
+            offset += len(token)
+            try:
+                if _parse_line(token).suspicious:
+                    last_suspicious_id = last_id
+            except Exception:
+                continue                 # corrupted line still takes its id
+    if offset and not token.endswith(b"\n"):
+        # Torn final write: terminate it so the next entry gets its own line
+        with open(LOG_FILE, "ab") as f:
+            f.write(b"\n")
+        offset += 1
+    return {"last_id": last_id, "offset": offset, "last_suspicious_id": last_suspicious_id}
+
+
+def _save_head(head: dict) -> None:
+    """Atomically replace the head record (write temp file, then rename)."""
+    tmp_path = LOG_HEAD_FILE + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(head, f)
+    os.replace(tmp_path, LOG_HEAD_FILE)
+
+
+def _load_head() -> dict:
+    """
+    Return the head record, validated against the log file size.
+
+    The head is trusted when its offset equals the file size (O(1)).
+    A shorter offset means entries were appended but the head was not
+    updated, so only the tail is scanned; anything else rebuilds it.
+    """
+    global _head
+    empty = {"last_id": 0, "offset": 0, "last_suspicious_id": 0}
+    if not os.path.exists(LOG_FILE):
+        _head = empty
+        return _head
+
+    size = os.path.getsize(LOG_FILE)
+    head = _head
+    if head is None:
+        try:
+            with open(LOG_HEAD_FILE, "r") as f:
+                head = json.load(f)
+            head = {key: int(head[key]) for key in empty}
+        except (OSError, ValueError, KeyError, TypeError):
+            head = None
+
+    if head is None or head["offset"] > size:
+        head = _scan_log(empty)
+        _save_head(head)
+    elif head["offset"] < size:
+        head = _scan_log(head)
+        _save_head(head)
+    _head = head
+    return _head
+
+
+def get_last_log_id() -> int:
+    """Id of the newest log entry (0 when the log is empty)."""
+    flush_logs()
+    with _log_lock:
+        return _load_head()["last_id"]
+
+
 def get_next_log_id() -> int:
     """
     Determine the next incremental log_id.
 
-    Counts how many lines (encrypted log records) are already present
-    in the log file. If the file does not exist, the first log_id is 1.
+    Read from the log head record instead of counting the lines of the
+    log file. If the file does not exist, the first log_id is 1.
     """
-    if not os.path.exists(LOG_FILE):
-        return 1
-    # Each line is one log entry -> line count == last id
-    with open(LOG_FILE, "rb") as f:
-        return sum(1 for _ in f) + 1
+    return get_last_log_id() + 1
+
+
+def _append_batch(entries: list[LogEntry], fsync: bool = False) -> None:
+    """
+    Assign ids to a batch of entries, encrypt them and append them with a
+    single write (and at most one fsync), then update the head once.
+    """
+    global _head
+    if not entries:
+        return
+    with _log_lock:
+        head = _load_head()
+        last_id = head["last_id"]
+        last_suspicious_id = head["last_suspicious_id"]
+        lines = []
+        for entry in entries:
+            last_id += 1
+            entry.log_id = last_id
+            if entry.suspicious:
+                last_suspicious_id = last_id
+            line = entry.as_line()          # Plain text (pipe-separated) line
+            lines.append(encrypt_text(line))     # => base64url bytes, never contains a newline
+        data = b"\n".join(lines) + b"\n"   # One encrypted line per entry
+        with open(LOG_FILE, "ab") as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        _head = {
+            "last_id": last_id,
+            "offset": head["offset"] + len(data),
+            "last_suspicious_id": last_suspicious_id,
+        }
+        _save_head(_head)
+
+    suspicious_ids = [entry.log_id for entry in entries if entry.suspicious]
+    if suspicious_ids:
+        _index_suspicious(suspicious_ids)
+
+
+def _index_suspicious(log_ids: list[int]) -> None:
+    """
+    Record suspicious log ids in SuspiciousLog. Ids that cannot be written
+    (e.g. the database is busy) stay pending and are written again with the
+    next batch, or by _sync_suspicious_index before the next unread count.
+    """
+    with _pending_lock:
+        _pending_suspicious.update(log_ids)
+        pending = sorted(_pending_suspicious)
+    try:
+        with _conn() as conn:
+            conn.executemany('INSERT OR IGNORE INTO SuspiciousLog (log_id) VALUES (?)',
+                             [(log_id,) for log_id in pending])
+            conn.commit()
+    except sqlite3.Error:
+        return                            # still pending
+    with _pending_lock:
+        _pending_suspicious.difference_update(pending)
+
+
+class _BackgroundLogWriter:
+    """
+    Writer thread for LOG_WRITER_MODE = "background".
+
+    Callers only enqueue entries; the thread drains the queue, assigns ids and
+    appends each batch with one write. When the batch is fsynced depends on
+    LOG_DURABILITY (see config.py). flush() blocks until everything queued
+    before it is on disk.
+    """
+
+    def __init__(self, durability: str, interval_ms: int):
+        if durability not in ("entry", "interval", "shutdown"):
+            raise ValueError(f"Unknown log durability: {durability}")
+        self._durability = durability
+        self._interval = interval_ms / 1000
+        self._queue: queue.Queue = queue.Queue()
+        self._gate = threading.Lock()       # held while paused: no batch is written meanwhile
+        self._paused = False
+        self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, entry: LogEntry) -> None:
+        self._queue.put(entry)
+
+    def flush(self) -> None:
+        """Write and fsync everything queued so far."""
+        if self._queue.unfinished_tasks == 0:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    def pause(self) -> None:
+        """Write everything queued so far, then hold back later batches until resume()."""
+        self.flush()
+        self._gate.acquire()
+        self._paused = True
+
+    def resume(self) -> None:
+        if self._paused:
+            self._paused = False
+            self._gate.release()
+
+    def _collect(self) -> list:
+        """Block for the first item, then gather what belongs to the same batch."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self._interval if self._durability == "interval" else None
+        while not isinstance(batch[-1], threading.Event):
+            try:
+                if deadline is None:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=max(0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            marker = batch.pop() if isinstance(batch[-1], threading.Event) else None
+            try:
+                with self._gate:
+                    _append_batch(batch, fsync=marker is not None or self._durability != "shutdown")
+            except Exception as e:
+                print(f"Error writing audit log: {e}")
+            finally:
+                for _ in range(len(batch) + (marker is not None)):
+                    self._queue.task_done()
+                if marker is not None:
+                    marker.set()
+
+
+_writer: _BackgroundLogWriter | None = None
+_writer_lock = threading.Lock()
+
+
+def _get_writer() -> _BackgroundLogWriter:
+    """Start the background writer on first use (and flush it at exit)."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = _BackgroundLogWriter(LOG_DURABILITY, LOG_FLUSH_INTERVAL_MS)
+            atexit.register(flush_logs)
+    return _writer
+
+
+def flush_logs() -> None:
+    """Make sure every queued log entry is written and synced (no-op in sync mode)."""
+    if _writer is not None:
+        _writer.flush()
+
+
+def pause_log_writer() -> None:
+    """
+    Write out the queued entries and hold back further batches (their
+    suspicious ids go to the database) until resume_log_writer(), e.g. while
+    the database file is replaced. No-op in sync mode.
+    """
+    if _writer is not None:
+        _writer.pause()
+
+
+def resume_log_writer() -> None:
+    """Undo pause_log_writer()."""
+    if _writer is not None:
+        _writer.resume()
 
 
 def write_log_entry(entry: LogEntry) -> None:
     """
     Encrypts a LogEntry and appends it to the log file.
 
+    In background mode the entry is only queued; its log_id is set by the
+    writer thread when the batch is written.
+
     Args:
         entry (LogEntry): fully populated log entry (log_id is set here).
     """
-    entry.log_id = get_next_log_id()
-    line = entry.as_line()          # Plain text (pipe-separated) line
-    token = encrypt(line)           # => bytes
-    with open(LOG_FILE, "ab") as f:
-        f.write(token + b"\n")      # One encrypted line per entry
+    if LOG_WRITER_MODE == "background":
+        _get_writer().submit(entry)
+    else:
+        _append_batch([entry])
 
 def log_login_attempt(username: str, success: bool):
     if success:
@@ -63,68 +361,230 @@ def log_login_attempt(username: str, success: bool):
     ))
 
 
-def read_logs(limit: int | None = None) -> list[LogEntry]:
+def _iter_lines_reverse(f, end: int):
+    """Yield the raw lines before byte `end` of the open log `f`, last line first, reading blocks backwards."""
+    with f:
+        pos = end
+        remainder = b""
+        while pos > 0:
+            size = min(_TAIL_BLOCK_SIZE, pos)
+            pos -= size
+            f.seek(pos)
+            lines = (f.read(size) + remainder).split(b"\n")
+            remainder = lines.pop(0)     # may continue in the previous block
+            for line in reversed(lines):
+                if line:
+                    yield line
+        if remainder:
+            yield remainder
+
+
+def iter_logs_reverse(offset: int = 0, batch_size: int = 64):
+    """
+    Generator over LogEntry objects, newest first.
+
+    Seeks from the end of the log and only decrypts the lines that are
+    actually consumed (in batches of `batch_size`), so the cost depends on
+    how many entries are read, not on the size of the log.
+    offset – skip the newest N lines first (for paging), without decrypting them.
+    """
+    flush_logs()                         # include entries still queued for the writer
+    if not os.path.exists(LOG_FILE):
+        return
+    with _log_lock:
+        end = _load_head()["offset"]     # only complete, committed lines
+        f = open(LOG_FILE, "rb")         # same file as `end`, even if a re-encryption swaps it
+
+    tokens = islice(_iter_lines_reverse(f, end), offset, None)
+    while True:
+        batch = list(islice(tokens, batch_size))
+        if not batch:
+            return
+        yield from _parse_lines(batch)
+
+
+def read_logs(limit: int | None = None, offset: int = 0) -> list[LogEntry]:
     """
     Decrypts log file and returns LogEntry objects (newest first).
-    limit – show only the latest N entries if provided.
+    limit – show only the latest N entries if provided (read from the end of the file).
+    offset – skip the newest N lines first.
     """
+    flush_logs()
     if not os.path.exists(LOG_FILE):
         return []
 
+    if limit:
+        return list(islice(iter_logs_reverse(offset, batch_size=limit), limit))
+
     entries: list[LogEntry] = []
     with open(LOG_FILE, "rb") as f:
-        for token in f:
-            try:
-                line = decrypt(token.strip())  # "log_id|date|time|username|description|additional|flag|user_id"
-                parts = line.split("|")
-                entry = LogEntry(
-                    user_id=parts[7],
-                    username=parts[3],
-                    description=parts[4],
-                    additional=parts[5],
-                    suspicious=(parts[6] == "Yes"),
-                    log_id=int(parts[0]),
-                    date=parts[1],
-                    time=parts[2]
-                )
-                entries.append(entry)
-            except Exception:
-                # corrupted line? skip
-                continue
+        while True:
+            batch = list(islice(f, _READ_BATCH_SIZE))
+            if not batch:
+                break
+            entries.extend(_parse_lines([token for token in batch if token.strip()]))
 
     entries.reverse()          # newest first
-    if limit:
-        entries = entries[:limit]
-    return entries
+    return entries[offset:]
+
+
+def _reencrypt_lines(batch: list[bytes]) -> tuple[bytes, int]:
+    """Re-encrypt outdated lines; corrupted lines are copied unchanged, so ids stay aligned."""
+    out, changed = [], 0
+    for token in batch:
+        line = token.rstrip(b"\n")
+        try:
+            new = reencrypt(line, text=True) if line else None
+        except Exception:
+            new = None
+        if new is not None:
+            changed += 1
+            line = new
+        out.append(line + b"\n")
+    return b"".join(out), changed
+
+
+def reencrypt_log_step(position: int, output_offset: int, max_lines: int = _READ_BATCH_SIZE) -> tuple[int, int, int, bool]:
+    """
+    One resumable step of re-encrypting the log into REKEY_FILE.
+
+    position      – bytes of the log already processed
+    output_offset – bytes of REKEY_FILE written for them (the file is cut back
+                    to this length first, dropping a step that did not finish)
+
+    Copies up to `max_lines` lines without holding the log lock. Once the copy
+    has caught up it takes the lock, copies what was appended meanwhile and
+    swaps the copy in. Returns (position, output_offset, lines re-encrypted, done).
+    """
+    global _head
+    flush_logs()
+    if not os.path.exists(LOG_FILE):
+        return 0, 0, 0, True
+    with _log_lock:
+        end = _load_head()["offset"]
+    if position > end or (output_offset and not os.path.exists(REKEY_FILE)):
+        position, output_offset = 0, 0   # the log was replaced (or the copy lost): start over
+    mode = "r+b" if os.path.exists(REKEY_FILE) else "w+b"
+    with open(REKEY_FILE, mode) as dst:
+        dst.truncate(output_offset)
+        dst.seek(output_offset)
+        with open(LOG_FILE, "rb") as src:
+            src.seek(position)
+            if position < end:
+                batch = []
+                for token in src:
+                    if position + len(token) > end or len(batch) >= max_lines:
+                        break
+                    batch.append(token)
+                    position += len(token)
+                data, changed = _reencrypt_lines(batch)
+                dst.write(data)
+                return position, output_offset + len(data), changed, False
+
+            # Caught up: finish under the lock so no append is lost
+            with _log_lock:
+                head = _load_head()
+                changed = 0
+                while True:
+                    batch = list(islice(src, _READ_BATCH_SIZE))
+                    if not batch:
+                        break
+                    data, batch_changed = _reencrypt_lines(batch)
+                    dst.write(data)
+                    changed += batch_changed
+                dst.flush()
+                os.fsync(dst.fileno())
+                output_offset = dst.tell()
+                os.replace(REKEY_FILE, LOG_FILE)
+                _head = {**head, "offset": output_offset}
+                _save_head(_head)
+    return output_offset, output_offset, changed, True
+
+
+def reencrypt_log(progress=print) -> int:
+    """
+    Rewrite the log with every line in the current cipher format, streaming it
+    into a copy that is swapped in atomically. Returns the lines re-encrypted.
+    """
+    position, output_offset, changed, done = 0, 0, 0, False
+    while not done:
+        position, output_offset, step_changed, done = reencrypt_log_step(position, output_offset)
+        changed += step_changed
+        progress(f"  {LOG_FILE}: {position} bytes processed")
+    return changed
 
 
 def _conn():
-    return sqlite3.connect(DB_FILE)
+    return get_connection(DB_FILE)
+
+def get_last_suspicious_id() -> int:
+    """Id of the newest suspicious log entry (0 if there is none)."""
+    flush_logs()
+    with _log_lock:
+        return _load_head()["last_suspicious_id"]
+
+def _sync_suspicious_index(conn, last_suspicious_id: int) -> None:
+    """
+    Bring SuspiciousLog in line with the log head. Normally a no-op; it
+    writes the ids _index_suspicious could not, and after a crash, a
+    restored database or on first use it indexes the missing entries by
+    reading the log backwards down to the newest indexed id. Ids that were
+    still pending when the process exited are not found that way if later
+    ones were indexed.
+    """
+    c = conn.cursor()
+    with _pending_lock:
+        pending = sorted(_pending_suspicious)
+    if pending:
+        c.executemany('INSERT OR IGNORE INTO SuspiciousLog (log_id) VALUES (?)',
+                      [(log_id,) for log_id in pending])
+    c.execute('SELECT MAX(log_id) FROM SuspiciousLog')
+    indexed = c.fetchone()[0] or 0
+    if indexed > last_suspicious_id:
+        # The log was reset underneath the index: drop ids it no longer has
+        c.execute('DELETE FROM SuspiciousLog WHERE log_id > ?', (last_suspicious_id,))
+        c.execute('SELECT MAX(log_id) FROM SuspiciousLog')
+        indexed = c.fetchone()[0] or 0
+    if indexed < last_suspicious_id:
+        missing = []
+        for entry in iter_logs_reverse():
+            if entry.log_id <= indexed:
+                break
+            if entry.suspicious:
+                missing.append((entry.log_id,))
+        c.executemany('INSERT OR IGNORE INTO SuspiciousLog (log_id) VALUES (?)', missing)
+    conn.commit()
+    if pending:
+        with _pending_lock:
+            _pending_suspicious.difference_update(pending)
 
 def unread_suspicious_count(user_id: int) -> int:
     """
     Returns how many suspicious logs have appeared
-    since this admin's last_seen_log_id.
+    since this admin's last_seen_log_id (an indexed range count).
     """
     last_seen = 0
+    last_suspicious_id = get_last_suspicious_id()
+    if not last_suspicious_id:
+        return 0
     with _conn() as conn:
         c = conn.cursor()
         c.execute('SELECT last_seen_log_id FROM LogStatus WHERE user_id=?', (user_id,))
         row = c.fetchone()
         if row:
             last_seen = row[0]
+        if last_suspicious_id <= last_seen:
+            return 0                  # nothing suspicious since last visit
 
-    # read newest logs
-    logs = read_logs()               # already returns newest→oldest
-    unseen = [e for e in logs if e.suspicious and e.log_id > last_seen]
-    return len(unseen)
+        _sync_suspicious_index(conn, last_suspicious_id)
+        c.execute('SELECT COUNT(*) FROM SuspiciousLog WHERE log_id > ?', (last_seen,))
+        return c.fetchone()[0]
 
 def mark_logs_read(user_id: int) -> None:
     """Store highest log_id as last seen for this admin."""
-    logs = read_logs(limit=1)        # latest only
-    if not logs:
+    top_id = get_last_log_id()       # from the log head, no decryption
+    if not top_id:
         return
-    top_id = logs[0].log_id
     with _conn() as conn:
         c = conn.cursor()
         c.execute('INSERT OR REPLACE INTO LogStatus (user_id,last_seen_log_id) VALUES (?,?)',
@@ -0,0 +1,316 @@
+import sqlite3
+import secrets
+import string
+from datetime import datetime
+from typing import Tuple, List, Optional
+from models.restore_code import RestoreCode
+from services.userservice import user_service
+from utils.crypto_utils import check_password, decrypt, hash_password
+from config import DB_FILE
+from dbcontext.connection import get_connection
+
+# RestoreCode.status (indexed, replaces the old 'PENDING_%' code sentinel)
+STATUS_PENDING = 'pending'   # requested by a system admin, no code generated yet
+STATUS_ISSUED = 'issued'     # code generated, not used yet
+STATUS_USED = 'used'
+
+class RestoreCodeService:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Return a pooled SQLite connection (caller closes it, which returns it to the pool)."""
+        return get_connection(self.db_path)
+
+    def generate_code(self, backup_id: int, system_admin_user_id: int) -> Tuple[bool, str]:
+        """
+        Generate a restore code for a specific backup and system admin.
+        Only super admins can generate codes.
+        """
+        # Note: This method is called by super admins, so we don't need to check permissions here
+        # The permission check is done in the menu function
+
+        # Verify the backup exists
+        with self._get_connection() as conn:
+            c = conn.cursor()
+            c.execute('SELECT backup_id FROM Backup WHERE backup_id = ?', (backup_id,))
+            if not c.fetchone():
+                return False, "Backup not found."
+
+            # Check if there's a pending request for this backup and system admin
+            c.execute('''
+                SELECT code_id FROM RestoreCode 
+                WHERE backup_id = ? AND system_admin_user_id = ? AND status = ?
+            ''', (backup_id, system_admin_user_id, STATUS_PENDING))
+        
+            pending_request = c.fetchone()
+            if not pending_request:
+                return False, "No pending request found for this backup and system admin."
+
+            # Generate a secure random code
+            code = ''.join(secrets.choice(string.ascii_uppercase + string.digits) for _ in range(8))
+        
+            # Hash the code for storage
+            code_hash = hash_password(code)
+        
+            try:
+                # Update the pending request with the actual code
+                c.execute('''
+                    UPDATE RestoreCode 
+                    SET code = ?, is_used = 0, status = ?
+                    WHERE code_id = ?
+                ''', (code_hash, STATUS_ISSUED, pending_request[0]))
+                conn.commit()
+                return True, code
+            except Exception as e:
+                conn.rollback()
+                return False, f"Failed to generate restore code: {str(e)}"
+
+    def verify_and_use_code(self, code: str, system_admin_user_id: int) -> Tuple[bool, str, Optional[int]]:
+        """
+        Verify a restore code and return the backup_id if valid.
+        Only the system admin who requested the code can use it.
+        """
+        
+        with self._get_connection() as conn:
+            c = conn.cursor()
+        
+            try:
+                # Get the unused restore codes of this system admin
+                c.execute('''
+                    SELECT code_id, code, backup_id FROM RestoreCode 
+                    WHERE system_admin_user_id = ? AND status = ?
+                ''', (system_admin_user_id, STATUS_ISSUED))
+            
+                rows = c.fetchall()
+            
+                for row in rows:
+                    code_id, stored_code, backup_id = row
+                
+                    # Verify the code using bcrypt
+                    try:
+                        if check_password(code, stored_code):
+                            # Mark as used
+                            c.execute('''
+                                UPDATE RestoreCode SET is_used = 1, status = ?
+                                WHERE code_id = ?
+                            ''', (STATUS_USED, code_id))
+                            conn.commit()
+                            return True, "Code verified successfully", backup_id
+                        else:
+                            continue
+                    except Exception as e:
+                        # If bcrypt verification fails, continue to next code
+                        continue
+            
+                return False, "Invalid or already used code", None
+            
+            except Exception as e:
+                conn.rollback()
+                return False, f"Error verifying code: {str(e)}", None
+
+    def get_backup_list(self) -> List[dict]:
+        """Get a list of all backups with their details."""
+        with self._get_connection() as conn:
+            c = conn.cursor()
+        
+            c.execute('''
+                SELECT b.backup_id, b.backup_date, b.file_path, b.created_by_user_id,
+                       u.first_name, u.last_name, u.role,
+                       b.pages, b.duration_seconds, b.pages_per_second, b.same_as_backup_id
+                FROM Backup b
+                LEFT JOIN User u ON b.created_by_user_id = u.user_id
+                ORDER BY b.backup_date DESC
+            ''')
+        
+            rows = c.fetchall()
+        
+        backups = []
+        for row in rows:
+            (backup_id, backup_date, file_path, created_by_user_id, first_name, last_name, role,
+             pages, duration_seconds, pages_per_second, same_as_backup_id) = row
+            
+            # Decrypt user data if available
+            if first_name and last_name and role:
+                try:
+                    first_name = decrypt(first_name)
+                    last_name = decrypt(last_name)
+                    role = decrypt(role)
+                    creator_name = f"{first_name} {last_name} ({role})"
+                except:
+                    creator_name = f"User ID: {created_by_user_id}"
+            elif created_by_user_id is None:
+                creator_name = "Super Admin"
+            else:
+                creator_name = f"User ID: {created_by_user_id}"
+            
+            backups.append({
+                'backup_id': backup_id,
+                'backup_date': backup_date,
+                'file_path': file_path,
+                'creator': creator_name,
+                # Online backup statistics (None for backups made before they were recorded)
+                'pages': pages,
+                'duration_seconds': duration_seconds,
+                'pages_per_second': pages_per_second,
+                # Backup whose file this one shares, when nothing had changed since (else None)
+                'same_as_backup_id': same_as_backup_id,
+            })
+        
+        return backups
+
+    def get_user_restore_codes(self, system_admin_user_id: int) -> List[dict]:
+        """Get all restore codes for a specific system admin."""
+        with self._get_connection() as conn:
+            c = conn.cursor()
+        
+            c.execute('''
+                SELECT rc.code_id, rc.code, rc.backup_id, rc.is_used, rc.generated_date,
+                       b.backup_date, b.file_path
+                FROM RestoreCode rc
+                JOIN Backup b ON rc.backup_id = b.backup_id
+                WHERE rc.system_admin_user_id = ?
+                ORDER BY rc.generated_date DESC
+            ''', (system_admin_user_id,))
+        
+            rows = c.fetchall()
+        
+        codes = []
+        for row in rows:
+            code_id, code_hash, backup_id, is_used, generated_date, backup_date, file_path = row
+            
+            codes.append({
+                'code_id': code_id,
+                'backup_id': backup_id,
+                'is_used': bool(is_used),
+                'generated_date': generated_date,
+                'backup_date': backup_date,
+                'file_path': file_path
+            })
+        
+        return codes
+
+    def create_restore_request(self, backup_id: int, system_admin_user_id: int) -> Tuple[bool, str]:
+        """Create a restore code request from a system admin."""
+        # Verify the backup exists
+        with self._get_connection() as conn:
+            c = conn.cursor()
+            c.execute('SELECT backup_id FROM Backup WHERE backup_id = ?', (backup_id,))
+            if not c.fetchone():
+                return False, "Backup not found."
+
+            # Check if a restore code already exists for this backup and system admin
+            c.execute('''
+                SELECT code_id FROM RestoreCode 
+                WHERE backup_id = ? AND system_admin_user_id = ?
+            ''', (backup_id, system_admin_user_id))
+        
+            if c.fetchone():
+                return False, "A restore code for this backup already exists for you."
+
+            try:
+                # Create a placeholder entry without code to indicate the request
+                c.execute('''
+                    INSERT INTO RestoreCode (code, backup_id, system_admin_user_id, is_used, generated_date, status)
+                    VALUES (NULL, ?, ?, ?, datetime('now'), ?)
+                ''', (
+                    backup_id,
+                    system_admin_user_id,
+                    0,  # is_used = False
+                    STATUS_PENDING
+                ))
+                conn.commit()
+                return True, "Restore code request created successfully."
+            except Exception as e:
+                conn.rollback()
+                return False, f"Failed to create request: {str(e)}"
+
+    def get_pending_requests(self) -> List[dict]:
+        """Get all pending restore code requests."""
+        with self._get_connection() as conn:
+            c = conn.cursor()
+        
+            c.execute('''
+                SELECT rc.code_id, rc.backup_id, rc.system_admin_user_id, rc.generated_date,
+                       b.backup_date, b.file_path, b.created_by_user_id,
+                       u.first_name, u.last_name, u.role
+                FROM RestoreCode rc
+                JOIN Backup b ON rc.backup_id = b.backup_id
+                JOIN User u ON rc.system_admin_user_id = u.user_id
+                WHERE rc.status = ?
+                ORDER BY rc.generated_date ASC
+            ''', (STATUS_PENDING,))
+        
+            rows = c.fetchall()
+        
+        requests = []
+        for row in rows:
+            code_id, backup_id, system_admin_user_id, generated_date, backup_date, file_path, created_by_user_id, first_name, last_name, role = row
+            
+            # Decrypt user data
+            try:
+                first_name = decrypt(first_name)
+                last_name = decrypt(last_name)
+                role = decrypt(role)
+                requester_name = f"{first_name} {last_name} ({role})"
+            except:
+                requester_name = f"User ID: {system_admin_user_id}"
+            
+            requests.append({
+                'request_id': code_id,  # Use code_id as request_id
+                'backup_id': backup_id,
+                'system_admin_user_id': system_admin_user_id,
+                'request_date': generated_date,
+                'backup_date': backup_date,
+                'requester_name': requester_name
+            })
+        
+        return requests
+
+    def get_user_pending_requests(self, system_admin_user_id: int) -> List[dict]:
+        """Get pending restore code requests for a specific system admin."""
+        with self._get_connection() as conn:
+            c = conn.cursor()
+        
+            c.execute('''
+                SELECT rc.code_id, rc.backup_id, rc.generated_date,
+                       b.backup_date, b.file_path
+                FROM RestoreCode rc
+                JOIN Backup b ON rc.backup_id = b.backup_id
+                WHERE rc.system_admin_user_id = ? AND rc.status = ?
+                ORDER BY rc.generated_date ASC
+            ''', (system_admin_user_id, STATUS_PENDING))
+        
+            rows = c.fetchall()
+        
+        requests = []
+        for row in rows:
+            code_id, backup_id, generated_date, backup_date, file_path = row
+            
+            requests.append({
+                'request_id': code_id,
+                'backup_id': backup_id,
+                'request_date': generated_date,
+                'backup_date': backup_date
+            })
+        
+        return requests
+
+    def mark_request_completed(self, request_id: int) -> bool:
+        """Mark a restore code request as completed by deleting the pending entry."""
+        with self._get_connection() as conn:
+            c = conn.cursor()
+        
+            try:
+                c.execute('''
+                    DELETE FROM RestoreCode 
+                    WHERE code_id = ? AND status = ?
+                ''', (request_id, STATUS_PENDING))
+                conn.commit()
+                return True
+            except Exception as e:
+                conn.rollback()
+                return False
+
+# Create a singleton instance
+restore_code_service = RestoreCodeService(DB_FILE) 
\ No newline at end of file
@@ -2,14 +2,17 @@ from typing import Optional
 import sqlite3
 from datetime import datetime
 from models.scooter import Scooter
-from utils.crypto_utils import decrypt
+from utils.crypto_utils import decrypt_many
+from dbcontext.connection import get_connection
+from utils.search_index import index_row, remove_row, iter_candidate_batches
 
 class ScooterService:
     def __init__(self, db_path: str):
         self.db_path = db_path
 
     def _get_connection(self) -> sqlite3.Connection:
-        return sqlite3.connect(self.db_path)
+        """Pooled connection (leaving the `with` block returns it to the pool)."""
+        return get_connection(self.db_path)
     
     # def add_scooter_from_params(self, scooter_id, brand, model, serial_number, top_speed, battery_capacity,
     #                             state_of_charge, target_soc_min, target_soc_max, location_lat, location_lon,
@@ -68,6 +71,7 @@ class ScooterService:
                     scooter.last_maint_date,
                     scooter.in_service_date
                 ))
+                index_row(cursor, "Scooter", cursor.lastrowid, self._search_fields(scooter))
                 conn.commit()
                 success = True
         except sqlite3.Error as e:
@@ -144,35 +148,25 @@ class ScooterService:
                 cursor = conn.cursor()
                 
                 # PHASE 1: SINGLE-FIELD SEARCH - Only decrypt the specified field
-                # Fetch only scooter_id and the target field
-                cursor.execute(f'''
-                    SELECT scooter_id, {field_name}
-                    FROM Scooter
-                    WHERE {field_name} IS NOT NULL
-                ''')
-                
-                rows = cursor.fetchall()
+                # The trigram index narrows this to candidate rows (full scan for terms < 3 chars),
+                # which are streamed and decrypted batch by batch
                 matching_ids = []
-                
-                # Decrypt ONLY the specified field (1 field total!)
-                for row in rows:
-                    scooter_id = row[0]
-                    try:
-                        # Decrypt the single target field
-                        field_value = decrypt(row[1].encode() if isinstance(row[1], str) else row[1]) if row[1] else ""
-                        
+                for rows in iter_candidate_batches(cursor, "Scooter", field_name, search_term):
+                    # Decrypt ONLY the specified field (1 field total!)
+                    values, errors = decrypt_many([row[1] for row in rows])
+                    for index, exc in errors.items():
+                        # Skip rows that fail to decrypt
+                        print(f"Error processing scooter {rows[index][0]}: {exc}")
+
+                    for (scooter_id, _), field_value in zip(rows, values):
                         # Check if this row matches
-                        if search_term in field_value:
+                        if field_value and search_term in field_value:
                             matching_ids.append(scooter_id)
-                            
-                            # Early exit when limit reached
                             if len(matching_ids) >= limit:
                                 break
-                                
-                    except Exception as exc:
-                        # Skip rows that fail to decrypt
-                        print(f"Error processing scooter {scooter_id}: {exc}")
-                        continue
+                    # Early exit when limit reached
+                    if len(matching_ids) >= limit:
+                        break
                 
                 # If no matches, return empty list
                 if not matching_ids:
@@ -203,34 +197,18 @@ class ScooterService:
             print(f"Error in field-specific scooter search: {e}")
             return []
 
-    def _row_to_scooter(self, row: tuple) -> Scooter:
-        """Convert a database row to a Scooter object"""
-        try:
-            # The data in the database is stored as strings, so we need to encode it first
-            brand = decrypt(row[1].encode() if isinstance(row[1], str) else row[1])
-            model = decrypt(row[2].encode() if isinstance(row[2], str) else row[2])
-            serial_number = decrypt(row[3].encode() if isinstance(row[3], str) else row[3])
+    @staticmethod
+    def _search_fields(scooter: Scooter) -> dict:
+        """Plaintext of the fields kept in the search index."""
+        return {
+            'brand': scooter.brand_plain,
+            'model': scooter.model_plain,
+            'serial_number': scooter.serial_number_plain,
+        }
 
-            # Create a new Scooter object with the decrypted data
-            
-            return Scooter(
-                scooter_id=row[0],
-                brand=brand,
-                model=model,
-                serial_number=serial_number,
-                top_speed=row[4],
-                battery_capacity=row[5],
-                state_of_charge=row[6],
-                target_soc_min=row[7],
-                target_soc_max=row[8],
-                location_lat=row[9],
-                location_lon=row[10],
-                out_of_service=bool(row[11]),
-                mileage=row[12],
-                last_maint_date=row[13]
-            )
-        except Exception as e:
-            raise
+    def _row_to_scooter(self, row: tuple) -> Scooter:
+        """Convert a database row to a Scooter object (ciphertext is decrypted on access)"""
+        return Scooter.from_row(row)
 
     def update_scooter(self, scooter: Scooter) -> bool:
         """Update an existing scooter in the database"""
@@ -262,6 +240,8 @@ class ScooterService:
                     scooter.last_maint_date,
                     scooter.scooter_id
                 ))
+                if cursor.rowcount > 0:
+                    index_row(cursor, "Scooter", scooter.scooter_id, self._search_fields(scooter))
                 conn.commit()
                 success = True
         except sqlite3.Error as e:
@@ -277,8 +257,11 @@ class ScooterService:
             with self._get_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute("DELETE FROM Scooter WHERE scooter_id = ?", (scooter_id,))
+                # Read before remove_row reuses the cursor for the index rows
+                deleted = cursor.rowcount
+                remove_row(cursor, "Scooter", scooter_id)
                 conn.commit()
-                if cursor.rowcount > 0:
+                if deleted > 0:
                     success = True
         except sqlite3.Error as e:
             pass
@@ -4,10 +4,11 @@ import os
 import time
 from datetime import datetime, timedelta
 from typing import Optional, Tuple
-from services.log_service import log_login_attempt, unread_suspicious_count
+from services.log_service import log_login_attempt, unread_suspicious_count, flush_logs
 from services.userservice import user_service
-from models.user import User
-from utils.crypto_utils import decrypt
+from models.principal import Principal, SUPER_ADMIN
+from utils.crypto_utils import clear_decrypt_cache
+from dbcontext.connection import get_connection
 
 class SessionService:
     def __init__(self, db_path: str):
@@ -30,12 +31,8 @@ class SessionService:
         self._allowed_ip_patterns = ["*"]  # Allow all for now
 
     def _get_connection(self) -> sqlite3.Connection:
-        """Get database connection."""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            return conn
-        except Exception as e:
-            raise
+        """Get a pooled database connection."""
+        return get_connection(self.db_path)
 
     def _is_username_allowed(self, username: str) -> bool:
         """Check if username is in whitelist."""
@@ -149,11 +146,7 @@ class SessionService:
 
     def _handle_super_admin_login(self) -> bool:
         """Handle super admin login."""
-        self._current_user = User(
-            username="super_admin",
-            password_plain="Admin_123?",
-            role="super"
-        )
+        self._current_user = SUPER_ADMIN
         self._current_user_id = 0
         self._current_username = "super_admin"
         self._current_role = "super"
@@ -171,11 +164,10 @@ class SessionService:
 
     def _needs_password_reset(self, user_data) -> bool:
         """Check if user needs password reset."""
-        conn = self._get_connection()
-        c = conn.cursor()
-        c.execute('SELECT password_hash FROM User WHERE user_id = ?', (user_data.user_id,))
-        row = c.fetchone()
-        conn.close()
+        with self._get_connection() as conn:
+            c = conn.cursor()
+            c.execute('SELECT password_hash FROM User WHERE user_id = ?', (user_data.user_id,))
+            row = c.fetchone()
         
         return (row and row[0] is None) or user_service.has_pending_reset(user_data.user_id)
 
@@ -196,14 +188,8 @@ class SessionService:
         self._global_failed_attempts = 0
         self._global_lockout_end = None
         
-        # Create User object
-        self._current_user = User(
-            username=user_data.username_plain,
-            password_plain=password,
-            role=user_data.role_plain,
-            first_name=decrypt(user_data.first_name) if user_data.first_name else None,
-            last_name=decrypt(user_data.last_name) if user_data.last_name else None
-        )
+        # Principal of the session (the password was verified, it is not hashed again)
+        self._current_user = Principal.from_user(user_data)
         self._current_user_id = user_data.user_id
         self._current_username = user_data.username_plain
         self._current_role = user_data.role_plain
@@ -230,16 +216,31 @@ class SessionService:
         self._current_user_id = None
         self._current_username = None
         self._current_role = None
+        flush_logs()  # queued audit entries of this session reach the disk
+        clear_decrypt_cache()  # no plaintext of this session outlives it
+        user_service.invalidate_principal()
         print("Logged out successfully.")
         # Return to login by raising a special exception
         raise SystemError("User logged out")
 
+    def refresh_current_user(self) -> bool:
+        """Reload the session principal after the current user edited their account."""
+        if not self._current_user_id:
+            return False    # the super admin's account cannot be edited
+        principal = user_service.get_principal(self._current_user_id)
+        if principal is None:
+            return False
+        self._current_user = principal
+        self._current_username = principal.username
+        self._current_role = principal.role
+        return True
+
     def is_authenticated(self) -> bool:
         """Check if user is currently authenticated."""
         return self._current_user is not None
 
-    def get_current_user(self) -> Optional[User]:
-        """Get current user object."""
+    def get_current_user(self) -> Optional[Principal]:
+        """Get the principal (id, username, role) of the current user."""
         return self._current_user
 
     def get_current_user_id(self) -> Optional[int]:
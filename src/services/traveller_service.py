@@ -1,10 +1,15 @@
 import sqlite3
+from collections import Counter
 from datetime import date
 from typing import Tuple, Optional
 
-from utils.crypto_utils import encrypt, decrypt
+from utils.crypto_utils import encrypt_field, decrypt_many, is_deterministic, deterministic_tokens, clear_decrypt_cache
 from models.traveller import Traveller
-from config import DB_FILE
+from config import DB_FILE, TRAVELLER_INDEX_FILE
+from dbcontext.connection import get_connection
+from dbcontext.data_keys import store_data_key, load_data_keys, load_data_key, shred, existing_refs
+from dbcontext import traveller_index
+from utils.search_index import INDEXED_FIELDS, index_row, remove_row, iter_candidate_batches, SCAN_BATCH_SIZE
 from utils.validation import (
     validate_first_name, validate_last_name, validate_birthday, validate_gender,
     validate_street_name, validate_house_number, validate_zip, validate_city,
@@ -19,6 +24,16 @@ ALLOWED_FIELDS = {
     "driving_license_no"
 }
 
+# Fields with a small whitelist of values, for list_travellers_by / count_travellers_by
+FILTER_FIELDS = {"gender", "city"}
+
+# Traveller.from_row column order
+_ROW_COLUMNS = (
+    "traveller_id, first_name, last_name, birthday, gender, street_name, house_number, "
+    "zip_code, city, email, mobile_phone, driving_license_no, registration_date, data_key_ref"
+)
+_ID_CHUNK = 500    # stay well below SQLite's bound-variable limit
+
 class TravellerService:
     """Service layer responsible for CRUD operations on *Traveller* records.
     * A thin validation layer to give quick feedback before creating a ``Traveller``.
@@ -31,8 +46,14 @@ class TravellerService:
 
     # Low-level helpers
     def _get_connection(self) -> sqlite3.Connection:
-        """Return a *new* SQLite connection (caller closes it)."""
-        return sqlite3.connect(self.db_path)
+        """Return a pooled SQLite connection (caller closes it, which returns it to the pool)."""
+        return get_connection(self.db_path)
+
+    @staticmethod
+    def _from_rows(rows) -> list[Traveller]:
+        """Travellers from rows of _ROW_COLUMNS, with their data keys unwrapped in one batch."""
+        keys = load_data_keys(row[13] for row in rows)
+        return [Traveller.from_row(row, keys.get(row[13])) for row in rows]
 
     # CRUD Methods
     def add_traveller(self, *, traveller: Optional[Traveller] = None, **fields) -> Tuple[bool, str]:
@@ -43,6 +64,7 @@ class TravellerService:
         """
         success = False  # default whitelist: fail unless proven valid
         message = "Traveller could not be added"
+        new_ref = None
         try:
             if traveller is None:
                 validations = [
@@ -62,38 +84,49 @@ class TravellerService:
                         return False, msg
                 traveller = Traveller(**fields)
 
-            # 3️ Persist (encrypted!)
-            conn = self._get_connection()
-            cur = conn.cursor()
-            cur.execute(
-                """
-                INSERT INTO Traveller (
-                    first_name, last_name, birthday, gender, street_name, house_number,
-                    zip_code, city, email, mobile_phone, driving_license_no,
-                    registration_date
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
-                """,
-                (
-                    traveller.first_name,
-                    traveller.last_name,
-                    traveller.birthday,
-                    traveller.gender,
-                    traveller.street_name,
-                    traveller.house_number,
-                    traveller.zip_code,
-                    traveller.city,
-                    traveller.email,
-                    traveller.mobile_phone,
-                    traveller.driving_license_no,
-                ),
-            )
-            conn.commit()
-            conn.close()
+            # 3️ Persist (encrypted!) – the data key first, the row refers to it
+            if traveller.data_key_ref is None:
+                traveller.data_key_ref = new_ref = store_data_key(traveller.data_key)
+            with self._get_connection() as conn:
+                cur = conn.cursor()
+                cur.execute(
+                    """
+                    INSERT INTO Traveller (
+                        first_name, last_name, birthday, gender, street_name, house_number,
+                        zip_code, city, email, mobile_phone, driving_license_no,
+                        registration_date, data_key_ref
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'), ?)
+                    """,
+                    (
+                        traveller.first_name,
+                        traveller.last_name,
+                        traveller.birthday,
+                        traveller.gender,
+                        traveller.street_name,
+                        traveller.house_number,
+                        traveller.zip_code,
+                        traveller.city,
+                        traveller.email,
+                        traveller.mobile_phone,
+                        traveller.driving_license_no,
+                        traveller.data_key_ref,
+                    ),
+                )
+                # Tokens (in their own store) before the commit: a row that cannot be
+                # indexed is not written, at worst a token is left without its row
+                with traveller_index.connect() as index_conn:
+                    index_row(index_conn.cursor(), "Traveller", cur.lastrowid, {
+                        field: getattr(traveller, f"{field}_plain") for field in ALLOWED_FIELDS
+                    })
+                conn.commit()
             success, message = True, "Traveller added successfully"
         except ValueError as exc:
             message = str(exc)
         except Exception as exc:
             message = f"Unexpected error: {exc}"
+        if not success and new_ref is not None:
+            shred([new_ref])      # the key of a row that was never written
+            traveller.data_key_ref = None
         return success, message
 
     def update_traveller(self, traveller_id: int, **updates) -> Tuple[bool, str]:
@@ -127,11 +160,24 @@ class TravellerService:
             if not ok:
                 return False, msg
 
-        # 2️ Build dynamic UPDATE
+        # 2️ Build dynamic UPDATE, encrypting with the traveller's own data key
+        data_key = None
+        try:
+            with self._get_connection() as conn:
+                row = conn.execute("SELECT data_key_ref FROM Traveller WHERE traveller_id = ?",
+                                   (traveller_id,)).fetchone()
+        except Exception as exc:
+            return False, f"Error updating traveller: {exc}"
+        if row is None:
+            return False, message
+        if row[0] is not None:
+            data_key = load_data_key(row[0])
+            if data_key is None:
+                return False, "Traveller has been erased"
         set_parts = []
         values: list[bytes] = []
         for col, val in updates.items():
-            encrypted = encrypt(val)
+            encrypted = encrypt_field("Traveller", col, val, data_key)
             set_parts.append(f"{col} = ?")
             values.append(encrypted)
         values.append(traveller_id)
@@ -140,12 +186,14 @@ class TravellerService:
 
         # 3️ Execute & close
         try:
-            conn = self._get_connection()
-            cur = conn.cursor()
-            cur.execute(sql, tuple(values))
-            conn.commit()
-            affected = cur.rowcount
-            conn.close()
+            with self._get_connection() as conn:
+                cur = conn.cursor()
+                cur.execute(sql, tuple(values))
+                affected = cur.rowcount
+                if affected:
+                    with traveller_index.connect() as index_conn:
+                        index_row(index_conn.cursor(), "Traveller", traveller_id, updates)
+                conn.commit()
             if affected:
                 success, message = True, "Traveller updated successfully"
         except Exception as exc:
@@ -154,22 +202,129 @@ class TravellerService:
         return success, message
 
     def delete_traveller(self, traveller_id: int) -> Tuple[bool, str]:
-        """Remove a traveller record by *traveller_id*."""
+        """Remove a traveller record by *traveller_id* (its data key is shredded as well)."""
         success = False
         message = "Traveller could not be deleted"
         try:
-            conn = self._get_connection()
-            cur = conn.cursor()
-            cur.execute("DELETE FROM Traveller WHERE traveller_id = ?", (traveller_id,))
-            conn.commit()
-            affected = cur.rowcount
-            conn.close()
-            if affected:
+            if self._erase([traveller_id]):
                 success, message = True, "Traveller deleted successfully"
         except Exception as exc:
             message = f"Error deleting traveller: {exc}"
         return success, message
 
+    def erase_travellers(self, traveller_ids) -> Tuple[bool, str]:
+        """
+        Erase travellers for good. Their data keys are shredded first, which
+        makes their rows unreadable everywhere, old backup archives included;
+        then their search tokens and rows are deleted. Backups hold no search
+        tokens (dbcontext/traveller_index.py). What a backup still shows of an
+        erased row is its id, registration date, and gender and city, which
+        are encrypted with the key ring for filtering (config.DETERMINISTIC_COLUMNS).
+        """
+        success = False  # Whitelist: default to False
+        message = "No travellers were erased"
+        try:
+            ids = sorted({int(traveller_id) for traveller_id in traveller_ids})
+            erased = self._erase(ids)
+            if erased:
+                success, message = True, f"{erased} of {len(ids)} traveller(s) erased"
+        except (TypeError, ValueError):
+            message = "Traveller IDs must be numbers"
+        except Exception as exc:
+            message = f"Error erasing travellers: {exc}"
+        return success, message
+
+    def _erase(self, ids) -> int:
+        """Shred the data keys of, and delete, the travellers in *ids*; returns the rows deleted."""
+        erased = 0
+        conn = self._get_connection()
+        cur = conn.cursor()
+        try:
+            for start in range(0, len(ids), _ID_CHUNK):
+                chunk = ids[start:start + _ID_CHUNK]
+                placeholders = ','.join(['?'] * len(chunk))
+                cur.execute(f"SELECT traveller_id, data_key_ref FROM Traveller WHERE traveller_id IN ({placeholders})",
+                            chunk)
+                rows = cur.fetchall()
+                shred([ref for _traveller_id, ref in rows])
+                with traveller_index.connect() as index_conn:
+                    index_cur = index_conn.cursor()
+                    for traveller_id, _ref in rows:
+                        remove_row(index_cur, "Traveller", traveller_id)
+                cur.execute(f"DELETE FROM Traveller WHERE traveller_id IN ({placeholders})", chunk)
+                erased += cur.rowcount
+                conn.commit()
+        finally:
+            conn.close()
+        traveller_index.flush()        # no copy of the deleted tokens stays in the WAL
+        clear_decrypt_cache()          # no plaintext of an erased traveller stays in memory
+        return erased
+
+    def purge_erased_travellers(self) -> int:
+        """
+        Delete rows whose data key no longer exists, e.g. travellers that were
+        erased after the backup that was just restored. Returns the rows deleted.
+        """
+        conn = self._get_connection()
+        cur = conn.cursor()
+        orphans = []
+        try:
+            cur.execute("SELECT traveller_id, data_key_ref FROM Traveller WHERE data_key_ref IS NOT NULL")
+            while rows := cur.fetchmany(SCAN_BATCH_SIZE):
+                live = existing_refs(ref for _traveller_id, ref in rows)
+                orphans.extend(traveller_id for traveller_id, ref in rows if ref not in live)
+            with traveller_index.connect() as index_conn:
+                index_cur = index_conn.cursor()
+                for traveller_id in orphans:
+                    remove_row(index_cur, "Traveller", traveller_id)
+            for traveller_id in orphans:
+                cur.execute("DELETE FROM Traveller WHERE traveller_id = ?", (traveller_id,))
+            conn.commit()
+        finally:
+            conn.close()
+        if orphans:
+            traveller_index.flush()
+        return len(orphans)
+
+    def rebuild_search_index(self, index_path: str = TRAVELLER_INDEX_FILE, progress=print) -> int:
+        """
+        Write the search tokens of every traveller whose data key still exists
+        to the token store at *index_path*, replacing what it held. Run at
+        start-up when the store is missing or incomplete, and for a restored
+        database (backups hold no tokens). Erased travellers cannot be
+        decrypted, so they are never indexed again. Returns the travellers indexed.
+        """
+        fields = INDEXED_FIELDS["Traveller"][1]      # columns 1-11 of _ROW_COLUMNS, in order
+        indexed = last_id = 0
+        with self._get_connection() as conn, traveller_index.connect(index_path) as index_conn:
+            cur = conn.cursor()
+            index_cur = index_conn.cursor()
+            traveller_index.set_built(index_conn, False)
+            index_cur.execute("DELETE FROM SearchIndex WHERE table_name = 'Traveller'")
+            index_conn.commit()
+            while True:
+                cur.execute(f"SELECT {_ROW_COLUMNS} FROM Traveller WHERE traveller_id > ? "
+                            f"ORDER BY traveller_id LIMIT ?", (last_id, SCAN_BATCH_SIZE))
+                rows = cur.fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                keys = load_data_keys(row[13] for row in rows)
+                # Rows whose data key is gone (erased) are left out
+                rows = [row for row in rows if row[13] is None or row[13] in keys]
+                data_keys = [keys.get(row[13]) for row in rows]
+                columns = [decrypt_many([row[i] for row in rows], data_keys=data_keys)[0]
+                           for i in range(1, len(fields) + 1)]
+                for n, row in enumerate(rows):
+                    index_row(index_cur, "Traveller", row[0],
+                              {field: values[n] for field, values in zip(fields, columns)})
+                indexed += len(rows)
+                index_conn.commit()
+                progress(f"  Traveller search index: {indexed} indexed")
+            traveller_index.set_built(index_conn, True)
+            index_conn.commit()
+        return indexed
+
     def search_travellers(self, key: str, field_name: str, limit: int = 50) -> list[Traveller]:
         """
         Search for travellers in a SPECIFIC field only.
@@ -183,78 +338,120 @@ class TravellerService:
         if not key or field_name not in ALLOWED_FIELDS:
             return []
         
-        conn = self._get_connection()
-        cur = conn.cursor()
-        
+        results = []
         try:
-            # PHASE 1: Fetch only specified field
-            cur.execute(f'''
-                SELECT traveller_id, {field_name}
-                FROM Traveller
-                WHERE {field_name} IS NOT NULL
-            ''')
+            with self._get_connection() as conn, traveller_index.connect() as index_conn:
+                cur = conn.cursor()
+                # PHASE 1: Fetch only specified field, narrowed by the trigram index
+                # and streamed in batches that are decrypted together
+                matching_ids = []
+                key_lc = key
             
-            rows = cur.fetchall()
-            matching_ids = []
-            key_lc = key
+                # Decrypt and search ONLY the specified field (rows that fail to decrypt are skipped)
+                for rows in iter_candidate_batches(cur, "Traveller", field_name, key,
+                                                   extra_columns=("data_key_ref",),
+                                                   index_cursor=index_conn.cursor()):
+                    keys = load_data_keys(row[2] for row in rows)
+                    values, _errors = decrypt_many([row[1] for row in rows],
+                                                   data_keys=[keys.get(row[2]) for row in rows])
+                    for (traveller_id, _, _ref), decrypted in zip(rows, values):
+                        if decrypted and key_lc in decrypted:
+                            matching_ids.append(traveller_id)
+                            if len(matching_ids) >= limit:
+                                break
+                    if len(matching_ids) >= limit:
+                        break
             
-            # Decrypt and search ONLY the specified field
-            for row in rows:
-                traveller_id, encrypted_value = row
-                try:
-                    decrypted = decrypt(encrypted_value) if encrypted_value else ""
-                    if key_lc in decrypted:
-                        matching_ids.append(traveller_id)
-                        if len(matching_ids) >= limit:
-                            break
-                except Exception:
-                    continue
+                if not matching_ids:
+                    return []
             
-            if not matching_ids:
-                return []
+                # PHASE 2: Fetch full records for matches
+                placeholders = ','.join(['?'] * len(matching_ids))
+                cur.execute(f'''
+                    SELECT {_ROW_COLUMNS}
+                    FROM Traveller 
+                    WHERE traveller_id IN ({placeholders})
+                ''', matching_ids)            
             
-            # PHASE 2: Fetch full records for matches
-            placeholders = ','.join(['?'] * len(matching_ids))
-            cur.execute(f'''
-                SELECT traveller_id, first_name, last_name, birthday, gender,
-                    street_name, house_number, zip_code, city, email,
-                    mobile_phone, driving_license_no, registration_date
-                FROM Traveller 
-                WHERE traveller_id IN ({placeholders})
-            ''', matching_ids)            
-            
-            matching_rows = cur.fetchall()
-            results = []
-
-            # Now decrypt all fields only for matches
-            for row in matching_rows:
-                try:
-                    traveller = Traveller(
-                        traveller_id=row[0],
-                        first_name=decrypt(row[1]) if row[1] else "",
-                        last_name=decrypt(row[2]) if row[2] else "",
-                        birthday=decrypt(row[3]) if row[3] else "",
-                        gender=decrypt(row[4]) if row[4] else "",
-                        street_name=decrypt(row[5]) if row[5] else "",
-                        house_number=decrypt(row[6]) if row[6] else "",
-                        zip_code=decrypt(row[7]) if row[7] else "",
-                        city=decrypt(row[8]) if row[8] else "",
-                        email=decrypt(row[9]) if row[9] else "",
-                        mobile_phone=decrypt(row[10]) if row[10] else "",
-                        driving_license_no=decrypt(row[11]) if row[11] else ""
-                    )
-                    results.append(traveller)
-                except Exception as exc:
-                    print(f"Error creating traveller {row[0]}: {exc}")
-                    continue
+                matching_rows = cur.fetchall()
+
+                # Stored rows are trusted, their fields are decrypted on access
+                results = self._from_rows(matching_rows)
 
         except Exception as e:
             print(f"Error in traveller search: {e}")
+
+        return results
+
+    # Filtered listing
+    def list_travellers_by(self, field_name: str, value: str) -> list[Traveller]:
+        """
+        All travellers whose *field_name* ("gender" or "city") equals *value*.
+        A deterministic column (config.DETERMINISTIC_COLUMNS) is filtered by
+        SQLite through its index; otherwise every value is decrypted.
+        """
+        if not value or field_name not in FILTER_FIELDS:
+            return []
+
+        conn = self._get_connection()
+        cur = conn.cursor()
+        results = []
+        try:
+            if is_deterministic("Traveller", field_name):
+                tokens = deterministic_tokens(value)
+                placeholders = ','.join(['?'] * len(tokens))
+                cur.execute(f'''
+                    SELECT {_ROW_COLUMNS} FROM Traveller
+                    WHERE {field_name} IN ({placeholders})
+                    ORDER BY traveller_id
+                ''', tokens)
+                results = self._from_rows(cur.fetchall())
+            else:
+                index = 4 if field_name == "gender" else 8
+                cur.execute(f'SELECT {_ROW_COLUMNS} FROM Traveller ORDER BY traveller_id')
+                while rows := cur.fetchmany(SCAN_BATCH_SIZE):
+                    travellers = self._from_rows(rows)
+                    values, _errors = decrypt_many([row[index] for row in rows],
+                                                   data_keys=[t.data_key for t in travellers])
+                    results.extend(t for t, decrypted in zip(travellers, values) if decrypted == value)
+        except Exception as e:
+            print(f"Error listing travellers by {field_name}: {e}")
         finally:
             conn.close()
 
         return results
 
+    def count_travellers_by(self, field_name: str) -> dict[str, int]:
+        """Number of travellers per value of *field_name* ("gender" or "city")."""
+        if field_name not in FILTER_FIELDS:
+            return {}
+
+        conn = self._get_connection()
+        cur = conn.cursor()
+        counts = Counter()
+        try:
+            if is_deterministic("Traveller", field_name):
+                # One group per ciphertext: only the distinct values get decrypted
+                cur.execute(f'SELECT {field_name}, COUNT(*) FROM Traveller GROUP BY {field_name}')
+                groups = cur.fetchall()
+                values, _errors = decrypt_many([token for token, _count in groups])
+                for decrypted, (_token, count) in zip(values, groups):
+                    counts[decrypted] += count     # a value has one group per key id in use
+            else:
+                cur.execute(f'SELECT {field_name}, data_key_ref FROM Traveller')
+                while rows := cur.fetchmany(SCAN_BATCH_SIZE):
+                    keys = load_data_keys(row[1] for row in rows)
+                    values, _errors = decrypt_many([row[0] for row in rows],
+                                                   data_keys=[keys.get(row[1]) for row in rows])
+                    counts.update(values)
+        except Exception as e:
+            print(f"Error counting travellers by {field_name}: {e}")
+        finally:
+            conn.close()
+
+        counts.pop(None, None)                     # rows that could not be decrypted
+        return dict(counts)
+
 
 # Singleton instance
 traveller_service = TravellerService(DB_FILE)
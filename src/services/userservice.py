@@ -1,25 +1,46 @@
 import sqlite3
-from utils.crypto_utils import hash_password, decrypt, check_password, encrypt
+from utils.crypto_utils import (
+    hash_password, decrypt, decrypt_many, check_password, encrypt, encrypt_field, blind_index,
+    is_deterministic, deterministic_tokens
+)
 from models.user import User
+from models.principal import Principal, SUPER_ADMIN
 from utils.validation import validate_username, validate_password, validate_first_name, validate_last_name
 from utils.validation import USERNAME_PATTERN, PASSWORD_PATTERN
 import re
 from typing import Tuple
 import random
 import string
+import threading
+from collections import Counter
 from datetime import datetime, timedelta
 from config import DB_FILE
+from dbcontext.connection import get_connection
 
 class UserService:
     def __init__(self, db_path: str):
         self.db_path = db_path
+        # Principal cache for permission checks: user_id -> Principal
+        self._principals: dict[int, Principal] = {}
+        self._principals_version = 0       # bumped on every invalidation
+        self._principals_lock = threading.Lock()
 
     def _get_connection(self) -> sqlite3.Connection:
-        try:
-            conn = sqlite3.connect(self.db_path)
-            return conn
-        except Exception as e:
-            raise
+        """Pooled connection (close() returns it to the pool)."""
+        return get_connection(self.db_path)
+
+    @staticmethod
+    def _username_bidx(username: str) -> str:
+        """Blind index of a username (case-insensitive, like the uniqueness rule)."""
+        return blind_index(username.lower(), "username")
+
+    def _username_taken(self, username: str, exclude_user_id=None) -> bool:
+        """Check username uniqueness with one indexed lookup instead of decrypting every row."""
+        with self._get_connection() as conn:
+            c = conn.cursor()
+            c.execute('SELECT user_id FROM User WHERE username_bidx = ?', (self._username_bidx(username),))
+            row = c.fetchone()
+        return row is not None and row[0] != exclude_user_id
 
 #-------------------------------------------------
 #                   Add User
@@ -52,16 +73,6 @@ class UserService:
                 if not valid:
                     return False, msg
 
-                # Check if username already exists by comparing decrypted usernames
-                conn = self._get_connection()
-                c = conn.cursor()
-                c.execute('SELECT username FROM User')
-                rows = c.fetchall()
-                conn.close()
-                for row in rows:
-                    if decrypt(row[0]).lower() == username.lower():
-                        return False, "Username already exists. Please choose a different one."
-
                 # Create User object
                 user = User(
                     username=username,
@@ -71,25 +82,32 @@ class UserService:
                     last_name=last_name
                 )
 
+            # Check if username already exists via the blind index
+            username_bidx = self._username_bidx(user.username_plain)
+            if self._username_taken(user.username_plain):
+                return False, "Username already exists. Please choose a different one."
+
             # Add to database
-            conn = self._get_connection()
-            c = conn.cursor()
-            c.execute('''
-                INSERT INTO User (username, password_hash, first_name, last_name, registration_date, role)
-                VALUES (?, ?, ?, ?, datetime('now'), ?)
-            ''', (
-                user.username,
-                user.password_hash,
-                user.first_name,
-                user.last_name,
-                user.role
-            ))
-            conn.commit()
-            conn.close()
+            with self._get_connection() as conn:
+                c = conn.cursor()
+                c.execute('''
+                    INSERT INTO User (username, password_hash, first_name, last_name, registration_date, role, username_bidx)
+                    VALUES (?, ?, ?, ?, datetime('now'), ?, ?)
+                ''', (
+                    user.username,
+                    user.password_hash,
+                    user.first_name,
+                    user.last_name,
+                    user.role,
+                    username_bidx
+                ))
+                conn.commit()
             success = True
             message = "User added successfully"
         except ValueError as e:
             message = str(e)
+        except sqlite3.IntegrityError:
+            message = "Username already exists. Please choose a different one."
         
         return success, message
 
@@ -128,51 +146,47 @@ class UserService:
             if new_username == current_user.username_plain.lower():
                 return False, "New username must be different from current username"
 
-            # Then check if the new username exists for any other user by comparing decrypted usernames
-            conn = self._get_connection()
-            c = conn.cursor()
-            c.execute('SELECT user_id, username FROM User')
-            rows = c.fetchall()
-            conn.close()
-            for row in rows:
-                if row[0] != user_id and decrypt(row[1]).lower() == new_username:
-                    return False, "Username already exists. Please choose a different one."
+            # Then check if the new username exists for any other user via the blind index
+            if self._username_taken(new_username, exclude_user_id=user_id):
+                return False, "Username already exists. Please choose a different one."
 
         # Update database directly instead of creating a User object
-        conn = self._get_connection()
-        c = conn.cursor()
-
-        # Build update query dynamically based on provided fields
-        update_fields = []
-        update_values = []
-
-        if "username" in updates:
-            update_fields.append("username = ?")
-            update_values.append(encrypt(updates["username"].lower()))
-        if "first_name" in updates:
-            update_fields.append("first_name = ?")
-            update_values.append(encrypt(updates["first_name"]))
-        if "last_name" in updates:
-            update_fields.append("last_name = ?")
-            update_values.append(encrypt(updates["last_name"]))
-        if "role" in updates:
-            update_fields.append("role = ?")
-            update_values.append(encrypt(updates["role"]))
-        if "password" in updates:
-            update_fields.append("password_hash = ?")
-            update_values.append(hash_password(updates["password"]))
-
-        if not update_fields:
-            return False, "No valid fields to update"
-
-        # Add user_id to values for WHERE clause
-        update_values.append(user_id)
+        with self._get_connection() as conn:
+            c = conn.cursor()
 
-        # Execute update
-        query = f"UPDATE User SET {', '.join(update_fields)} WHERE user_id = ?"
-        c.execute(query, update_values)
-        conn.commit()
-        conn.close()
+            # Build update query dynamically based on provided fields
+            update_fields = []
+            update_values = []
+
+            if "username" in updates:
+                update_fields.append("username = ?")
+                update_values.append(encrypt(updates["username"].lower()))
+                update_fields.append("username_bidx = ?")
+                update_values.append(self._username_bidx(updates["username"]))
+            if "first_name" in updates:
+                update_fields.append("first_name = ?")
+                update_values.append(encrypt(updates["first_name"]))
+            if "last_name" in updates:
+                update_fields.append("last_name = ?")
+                update_values.append(encrypt(updates["last_name"]))
+            if "role" in updates:
+                update_fields.append("role = ?")
+                update_values.append(encrypt_field("User", "role", updates["role"]))
+            if "password" in updates:
+                update_fields.append("password_hash = ?")
+                update_values.append(hash_password(updates["password"]))
+
+            if not update_fields:
+                return False, "No valid fields to update"
+
+            # Add user_id to values for WHERE clause
+            update_values.append(user_id)
+
+            # Execute update
+            query = f"UPDATE User SET {', '.join(update_fields)} WHERE user_id = ?"
+            c.execute(query, update_values)
+            conn.commit()
+        self.invalidate_principal(user_id)
 
         success = True
         message = "User updated successfully"
@@ -183,35 +197,64 @@ class UserService:
 #-------------------------------------------------
     def list_users(self) -> list[User]:
         """List all users in the system."""
-        conn = self._get_connection()
-        c = conn.cursor()
-        c.execute('SELECT user_id, username, first_name, last_name, role, registration_date, password_hash FROM User')
-        rows = c.fetchall()
-        conn.close()
+        with self._get_connection() as conn:
+            c = conn.cursor()
+            c.execute('SELECT user_id, username, first_name, last_name, role, registration_date, password_hash FROM User')
+            rows = c.fetchall()
 
         users = []
         for row in rows:
             try:
-                # Handle NULL password_hash by providing a default empty string
-                password_hash = row[6] if row[6] is not None else b''
-
-                user = User(
-                    user_id=row[0],
-                    username=decrypt(row[1]),
-                    first_name=decrypt(row[2]),
-                    last_name=decrypt(row[3]),
-                    role=decrypt(row[4]),
-                    password_hash=password_hash  # Use the stored password hash or empty bytes if NULL
-                )
-                # Set the registration_date from database if it exists
-                if row[5]:
-                    user.registration_date = row[5]
+                # Stored rows are trusted, fields are decrypted on access
+                user = User.from_row(row)
                 users.append(user)
             except Exception as e:
                 print(f"Error processing user row {row[0]}: {e}")
                 continue
         return users
 
+    def list_users_by_role(self, role: str) -> list[User]:
+        """
+        List the users with one role. With User.role in config.DETERMINISTIC_COLUMNS
+        SQLite filters through idx_user_role; otherwise every role is decrypted.
+        """
+        with self._get_connection() as conn:
+            c = conn.cursor()
+            if is_deterministic("User", "role"):
+                tokens = deterministic_tokens(role)
+                placeholders = ','.join(['?'] * len(tokens))
+                c.execute(f'SELECT user_id, username, first_name, last_name, role, registration_date, password_hash '
+                          f'FROM User WHERE role IN ({placeholders})', tokens)
+                rows = c.fetchall()
+            else:
+                c.execute('SELECT user_id, username, first_name, last_name, role, registration_date, password_hash FROM User')
+                rows = c.fetchall()
+                roles, _errors = decrypt_many([row[4] for row in rows])
+                rows = [row for row, row_role in zip(rows, roles) if row_role == role]
+
+        # Stored rows are trusted, fields are decrypted on access
+        return [User.from_row(row) for row in rows]
+
+    def count_users_by_role(self) -> dict[str, int]:
+        """Number of users per role (the hard-coded super admin is not a stored user)."""
+        with self._get_connection() as conn:
+            c = conn.cursor()
+            counts = Counter()
+            if is_deterministic("User", "role"):
+                # One group per ciphertext, so only the distinct roles are decrypted
+                c.execute('SELECT role, COUNT(*) FROM User GROUP BY role')
+                groups = c.fetchall()
+                roles, _errors = decrypt_many([token for token, _count in groups])
+                for role, (_token, count) in zip(roles, groups):
+                    counts[role] += count
+            else:
+                c.execute('SELECT role FROM User')
+                roles, _errors = decrypt_many([row[0] for row in c.fetchall()])
+                counts.update(roles)
+
+        counts.pop(None, None)
+        return dict(counts)
+
 #-------------------------------------------------
 #                   Delete User
 #-------------------------------------------------
@@ -221,12 +264,12 @@ class UserService:
         message = "Failed to delete user"
 
         try:
-            conn = self._get_connection()
-            c = conn.cursor()
-            c.execute('DELETE FROM User WHERE user_id=?', (user_id,))
-            c.execute('DELETE FROM User WHERE username=?', (username,))
-            conn.commit()
-            conn.close()
+            with self._get_connection() as conn:
+                c = conn.cursor()
+                # The username blind index lives on the row, so it goes with it
+                c.execute('DELETE FROM User WHERE user_id=?', (user_id,))
+                conn.commit()
+            self.invalidate_principal(user_id)
 
             success = True
             message = "User deleted successfully"
@@ -241,28 +284,15 @@ class UserService:
     def get_user_by_id(self, user_id) -> User:
         """Get user details by user_id."""
 
-        conn = self._get_connection()
-        c = conn.cursor()
-        c.execute('SELECT user_id, username, first_name, last_name, role, registration_date, password_hash FROM User WHERE user_id=?', (user_id,))
-        row = c.fetchone()
-        conn.close()
+        with self._get_connection() as conn:
+            c = conn.cursor()
+            c.execute('SELECT user_id, username, first_name, last_name, role, registration_date, password_hash FROM User WHERE user_id=?', (user_id,))
+            row = c.fetchone()
 
         if row:
             try:
-                # Handle NULL password_hash by providing a default empty string
-                password_hash = row[6] if row[6] is not None else b''
-
-                user = User(
-                    user_id=row[0],
-                    username=decrypt(row[1]),
-                    first_name=decrypt(row[2]),
-                    last_name=decrypt(row[3]),
-                    role=decrypt(row[4]),
-                    password_hash=password_hash  # Use the stored password hash or empty bytes if NULL
-                )
-                # Set the registration_date from database if it exists
-                if row[5]:
-                    user.registration_date = row[5]
+                # Stored rows are trusted, fields are decrypted on access
+                user = User.from_row(row)
                 return user
             except Exception as e:
                 # Optionally log the error here
@@ -270,44 +300,76 @@ class UserService:
         else:
             return None
 
+#-------------------------------------------------
+#                   Principal (permission checks)
+#-------------------------------------------------
+    def get_principal(self, user_id) -> Principal:
+        """
+        Id, username and role of a user, for permission checks. Cached until the
+        user is updated or deleted; a miss reads and decrypts two columns, it
+        never builds a User. User id 0 is the hard-coded super admin.
+        """
+        if user_id == 0:
+            return SUPER_ADMIN
+        principal = self._principals.get(user_id)
+        if principal is not None:
+            return principal
+
+        version = self._principals_version
+        with self._get_connection() as conn:
+            c = conn.cursor()
+            c.execute('SELECT username, role FROM User WHERE user_id=?', (user_id,))
+            row = c.fetchone()
+        if not row:
+            return None
+        try:
+            principal = Principal(user_id, decrypt(row[0]), decrypt(row[1]))
+        except Exception as e:
+            print(f"Error decrypting user data: {e}")
+            return None
+
+        with self._principals_lock:
+            # Not if the user was changed while it was read
+            if version == self._principals_version:
+                self._principals[user_id] = principal
+        return principal
+
+    def invalidate_principal(self, user_id=None) -> None:
+        """Forget the cached principal of `user_id`, or of every user (None)."""
+        with self._principals_lock:
+            self._principals_version += 1
+            if user_id is None:
+                self._principals.clear()
+            else:
+                self._principals.pop(user_id, None)
+
 #-------------------------------------------------
 #                   Get User by Username
 #-------------------------------------------------
     def get_user_by_username(self, username) -> User:
-        """Get user details by username."""
-        conn = self._get_connection()
-        c = conn.cursor()
-        c.execute('SELECT user_id, username, first_name, last_name, role, registration_date, password_hash FROM User')
-        users = c.fetchall()
-        conn.close()
+        """Get user details by username (one indexed lookup via the blind index)."""
+        if not username:
+            return None
 
-        # Normalize input username to lowercase for comparison
-        username_lower = username
+        with self._get_connection() as conn:
+            c = conn.cursor()
+            c.execute('SELECT user_id, username, first_name, last_name, role, registration_date, password_hash FROM User WHERE username_bidx=?',
+                      (self._username_bidx(username),))
+            row = c.fetchone()
 
-        for row in users:
-            try:
-                decrypted_username = decrypt(row[1])
-                if decrypted_username== username_lower:
-                    # Handle NULL password_hash by providing a default empty string
-                    password_hash = row[6] if row[6] is not None else b''
-
-                    user = User(
-                        user_id=row[0],
-                        username=decrypt(row[1]),
-                        first_name=decrypt(row[2]),
-                        last_name=decrypt(row[3]),
-                        role=decrypt(row[4]),
-                        password_hash=password_hash  # Use the stored password hash or empty bytes if NULL
-                    )
-                    # Set the registration_date from database if it exists
-                    if row[5]:
-                        user.registration_date = row[5]
-                    return user
-            except Exception as e:
-                # Optionally log the error here
-                print(f"Error decrypting user data: {e}")
-                continue
-        return None
+        if not row:
+            return None
+
+        try:
+            user = User.from_row(row)
+            # The index is case-insensitive, the lookup itself stays exact
+            if user.username_plain != username:
+                return None
+            return user
+        except Exception as e:
+            # Optionally log the error here
+            print(f"Error decrypting user data: {e}")
+            return None
 
 #-------------------------------------------------
 #                   Verify User Password
@@ -315,11 +377,10 @@ class UserService:
     def verify_user_password(self, user_id, password) -> bool:
         success = False  # Whitelist: default to False
 
-        conn = self._get_connection()
-        c = conn.cursor()
-        c.execute('SELECT password_hash FROM User WHERE user_id=?', (user_id,))
-        row = c.fetchone()
-        conn.close()
+        with self._get_connection() as conn:
+            c = conn.cursor()
+            c.execute('SELECT password_hash FROM User WHERE user_id=?', (user_id,))
+            row = c.fetchone()
         if row:
             success = check_password(password, row[0])
         return success
@@ -328,12 +389,11 @@ class UserService:
 #                   Update Password
 #-------------------------------------------------
     def update_password(self, user_id, new_password) -> None:
-        conn = self._get_connection()
-        c = conn.cursor()
-        hashed = hash_password(new_password)
-        c.execute('UPDATE User SET password_hash = ? WHERE user_id = ?', (hashed, user_id))
-        conn.commit()
-        conn.close()
+        with self._get_connection() as conn:
+            c = conn.cursor()
+            hashed = hash_password(new_password)
+            c.execute('UPDATE User SET password_hash = ? WHERE user_id = ?', (hashed, user_id))
+            conn.commit()
 
     def change_password(self, user_id: int, current_password: str, new_password: str) -> Tuple[bool, str]:
         """
@@ -378,25 +438,22 @@ class UserService:
         success = False  # Whitelist: default to False
         message = "Failed to generate temporary code"
 
-        # Special-case for hardcoded super admin
-        if admin_id == 0:
-            admin_role = 'super'
-        else:
-            admin = self.get_user_by_id(admin_id)
-            if not admin:
-                return False, "Admin user not found"
-            admin_role = admin.role_plain
+        # The principal of user id 0 is the hard-coded super admin
+        admin = self.get_principal(admin_id)
+        if not admin:
+            return False, "Admin user not found"
+        admin_role = admin.role
 
-        target = self.get_user_by_id(target_user_id)
+        target = self.get_principal(target_user_id)
         if not target:
             return False, "Target user not found"
 
         # Check permissions
         if admin_role == "system_admin":
-            if target.role_plain != "service_engineer":
+            if target.role != "service_engineer":
                 return False, "System admin can only reset service engineer passwords"
         elif admin_role == "super":
-            if target.role_plain not in ("system_admin", "service_engineer"):
+            if target.role not in ("system_admin", "service_engineer"):
                 return False, "Super admin can only reset system admin or service engineer passwords"
         else:
             return False, "Only system admin or super admin can reset passwords"
@@ -479,16 +536,15 @@ class UserService:
             return False, msg
 
         # Update password
-        conn = self._get_connection()
-        c = conn.cursor()
-        c.execute('UPDATE User SET password_hash = ? WHERE user_id = ?',
-                 (hash_password(new_password), user_id))
-        conn.commit()
+        with self._get_connection() as conn:
+            c = conn.cursor()
+            c.execute('UPDATE User SET password_hash = ? WHERE user_id = ?',
+                     (hash_password(new_password), user_id))
+            conn.commit()
 
-        # Remove used code
-        c.execute('DELETE FROM TempCodes WHERE user_id = ?', (user_id,))
-        conn.commit()
-        conn.close()
+            # Remove used code
+            c.execute('DELETE FROM TempCodes WHERE user_id = ?', (user_id,))
+            conn.commit()
 
         success = True
         message = "Password reset successfully"
@@ -498,11 +554,10 @@ class UserService:
         """Check if user has a pending password reset."""
         success = False  # Whitelist: default to False
 
-        conn = self._get_connection()
-        c = conn.cursor()
-        c.execute('SELECT 1 FROM TempCodes WHERE user_id = ?', (user_id,))
-        has_reset = c.fetchone() is not None
-        conn.close()
+        with self._get_connection() as conn:
+            c = conn.cursor()
+            c.execute('SELECT 1 FROM TempCodes WHERE user_id = ?', (user_id,))
+            has_reset = c.fetchone() is not None
 
         success = has_reset
         return success
@@ -0,0 +1,50 @@
+# tests/conftest.py
+"""
+Shared test setup. Every file path of config.py is pointed into a temporary
+directory (with a fresh secret.key there) before any application module is
+imported, so the tests never touch the real database, keys, log or backups.
+
+Run from src/:  python -m pytest tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+SRC_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SRC_FOLDER)
+
+import pytest
+from cryptography.fernet import Fernet
+import config
+
+_TEST_DIR = tempfile.mkdtemp(prefix="urban-mobility-tests-")
+for _name in ("DB_FILE", "LOG_FILE", "LOG_HEAD_FILE", "BACKUP_DIR", "KEYRING_FILE",
+              "DATA_KEYS_FILE", "TRAVELLER_INDEX_FILE", "BLIND_INDEX_KEY_FILE"):
+    setattr(config, _name, os.path.join(_TEST_DIR, os.path.basename(getattr(config, _name))))
+os.chdir(_TEST_DIR)                 # crypto_utils reads secret.key from the working directory
+with open("secret.key", "wb") as _f:
+    _f.write(Fernet.generate_key())
+
+
+def pytest_sessionfinish(session, exitstatus):
+    os.chdir(SRC_FOLDER)
+    shutil.rmtree(_TEST_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    """The migrated application database (config.DB_FILE), as um_members.py sets it up."""
+    from dbcontext.dbcontext import create_db
+    from services.traveller_service import traveller_service
+    create_db()
+    traveller_service.rebuild_search_index(progress=lambda _: None)
+    return config.DB_FILE
+
+
+@pytest.fixture
+def traveller_fields():
+    """Valid add_traveller() arguments."""
+    return dict(first_name="Jane", last_name="Doe", birthday="1990-05-17", gender="female",
+                street_name="Main", house_number="12", zip_code="3011AB", city="Rotterdam",
+                email="jane@example.com", mobile_phone="+31-6-12345678", driving_license_no="AB1234567")
@@ -0,0 +1,103 @@
+# tests/test_connection.py
+"""Pooled connections: nested checkouts, pausing the pool and online snapshots."""
+import sqlite3
+import threading
+import time
+import pytest
+from dbcontext.connection import get_connection, get_pool, pause_connections, resume_connections, snapshot
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "pool.db")
+    with get_connection(path) as conn:
+        conn.execute('CREATE TABLE t (x INTEGER)')
+    return path
+
+
+def _values(path):
+    with get_connection(path) as conn:
+        return [row[0] for row in conn.execute('SELECT x FROM t ORDER BY x')]
+
+
+def test_nested_checkout_does_not_end_the_outer_transaction(db_path):
+    outer = get_connection(db_path)
+    outer.execute('INSERT INTO t VALUES (1)')
+    inner = get_connection(db_path)                 # same thread: shares the connection
+    inner.execute('INSERT INTO t VALUES (2)')
+    inner.commit()                                  # releases its savepoint only
+    inner.execute('INSERT INTO t VALUES (3)')
+    inner.rollback()
+    inner.execute('INSERT INTO t VALUES (4)')
+    inner.close()                                   # uncommitted 4 goes, like a real close
+    assert outer.in_transaction
+    with get_connection(db_path) as block:
+        block.execute('INSERT INTO t VALUES (5)')
+    with pytest.raises(ValueError):
+        with get_connection(db_path) as block:
+            block.execute('INSERT INTO t VALUES (6)')
+            raise ValueError
+    outer.commit()
+    outer.close()
+    assert _values(db_path) == [1, 2, 5]
+
+
+def test_outer_rollback_discards_nested_work(db_path):
+    with get_connection(db_path) as outer:
+        outer.execute('INSERT INTO t VALUES (1)')
+        with get_connection(db_path) as inner:
+            inner.execute('INSERT INTO t VALUES (2)')
+        outer.rollback()
+    assert _values(db_path) == []
+    assert getattr(get_pool(db_path)._local, "depth", 0) == 0
+
+
+def test_pause_waits_for_checked_out_connections(db_path):
+    events = []
+    held = threading.Event()
+
+    def holder():
+        with get_connection(db_path) as conn:
+            conn.execute('SELECT 1').fetchone()
+            held.set()
+            time.sleep(0.3)
+            events.append("holder done")
+
+    def late():
+        with get_connection(db_path):
+            events.append("late checkout")
+
+    thread = threading.Thread(target=holder)
+    thread.start()
+    held.wait()
+    pause_connections(db_path)
+    events.append("paused")
+    late_thread = threading.Thread(target=late)
+    late_thread.start()
+    time.sleep(0.2)
+    events.append("resume")
+    resume_connections(db_path)
+    thread.join()
+    late_thread.join()
+    assert events == ["holder done", "paused", "resume", "late checkout"]
+
+
+def test_pause_refuses_while_holding_a_connection(db_path):
+    with get_connection(db_path):
+        with pytest.raises(sqlite3.ProgrammingError):
+            pause_connections(db_path)
+
+
+def test_snapshot_inside_an_open_transaction(db_path, tmp_path):
+    dest = str(tmp_path / "copy.db")
+    with get_connection(db_path) as conn:
+        conn.execute('INSERT INTO t VALUES (1)')
+        conn.commit()
+        conn.execute('INSERT INTO t VALUES (2)')      # open, uncommitted
+        pages, _seconds = snapshot(dest, db_path, pages=1, pause_ms=1)
+    assert pages > 0
+    copy = sqlite3.connect(dest)
+    try:
+        assert copy.execute('SELECT x FROM t').fetchall() == [(1,)]
+    finally:
+        copy.close()
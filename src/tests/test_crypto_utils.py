@@ -0,0 +1,78 @@
+# tests/test_crypto_utils.py
+"""Round trips of every stored ciphertext format."""
+import pytest
+from cryptography.fernet import InvalidToken
+from utils import crypto_utils
+from utils.crypto_utils import (
+    encrypt, decrypt, decrypt_many, encrypt_deterministic, deterministic_tokens,
+    encrypt_with_data_key, generate_data_key, wrap_key, unwrap_key, reencrypt, is_current,
+    configure_decrypt_cache
+)
+
+VALUE = "Jäne O'Doe-Smith 42"
+
+
+@pytest.mark.parametrize("cipher", ["aesgcm", "fernet"])
+@pytest.mark.parametrize("storage", ["binary", "text"])
+def test_round_trip(monkeypatch, cipher, storage):
+    monkeypatch.setattr(crypto_utils, "FIELD_CIPHER", cipher)
+    monkeypatch.setattr(crypto_utils, "CIPHERTEXT_STORAGE", storage)
+    token = encrypt(VALUE)
+    assert isinstance(token, bytes)
+    assert decrypt(token) == VALUE
+    assert decrypt(token.decode() if storage == "text" else token) == VALUE
+
+
+def test_every_format_stays_readable(monkeypatch):
+    tokens = []
+    for cipher in ("aesgcm", "fernet"):
+        for storage in ("binary", "text"):
+            monkeypatch.setattr(crypto_utils, "FIELD_CIPHER", cipher)
+            monkeypatch.setattr(crypto_utils, "CIPHERTEXT_STORAGE", storage)
+            tokens.append(encrypt(VALUE))
+    monkeypatch.undo()
+    assert [decrypt(token) for token in tokens] == [VALUE] * len(tokens)
+    # reencrypt() brings each of them to the current format without changing the value
+    for token in tokens:
+        current = reencrypt(token) or token
+        assert is_current(current) and decrypt(current) == VALUE
+
+
+def test_deterministic_tokens_are_equal():
+    token = encrypt_deterministic("Rotterdam")
+    assert token == encrypt_deterministic("Rotterdam")
+    assert token != encrypt_deterministic("Utrecht")
+    assert token in deterministic_tokens("Rotterdam")
+    assert decrypt(token) == "Rotterdam"
+
+
+def test_row_key_needs_its_data_key():
+    data_key = generate_data_key()
+    token = encrypt_with_data_key(data_key, VALUE)
+    assert decrypt(token, data_key) == VALUE
+    with pytest.raises(InvalidToken):
+        decrypt(token)
+    with pytest.raises(InvalidToken):
+        decrypt(token, generate_data_key())
+    assert unwrap_key(wrap_key(data_key)) == data_key
+
+
+def test_decrypt_cache_does_not_hand_out_row_key_plaintext():
+    data_key = generate_data_key()
+    token = encrypt_with_data_key(data_key, VALUE)
+    configure_decrypt_cache(enabled=True)
+    try:
+        assert decrypt(token, data_key) == VALUE
+        with pytest.raises(InvalidToken):
+            decrypt(token)
+        values, errors = decrypt_many([token, token], data_keys=[data_key, None])
+        assert values == [VALUE, None] and list(errors) == [1]
+    finally:
+        configure_decrypt_cache(enabled=False)
+
+
+def test_decrypt_many_reports_bad_tokens_by_index():
+    tokens = [encrypt("a"), None, b"not a token", encrypt("b")]
+    values, errors = decrypt_many(tokens)
+    assert values == ["a", None, None, "b"]
+    assert list(errors) == [2]
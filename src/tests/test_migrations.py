@@ -0,0 +1,46 @@
+# tests/test_migrations.py
+"""Schema migrations on a fresh database and on one with duplicate usernames."""
+from dbcontext.connection import get_connection
+from dbcontext.migrations import migrate, get_schema_version, SCHEMA_VERSION, _free_username
+from utils.crypto_utils import encrypt, decrypt
+from utils.validation import validate_username
+
+
+def test_fresh_database_reaches_the_current_version(tmp_path):
+    with get_connection(str(tmp_path / "fresh.db")) as conn:
+        assert migrate(conn, progress=lambda _: None) == SCHEMA_VERSION
+        assert get_schema_version(conn) == SCHEMA_VERSION
+        output = []
+        assert migrate(conn, progress=output.append) == SCHEMA_VERSION
+        assert output == []         # a current database only reads the version
+
+
+def test_duplicate_usernames_are_renamed_before_the_unique_index(tmp_path):
+    path = str(tmp_path / "old.db")
+    with get_connection(path) as conn:
+        migrate(conn, progress=lambda _: None)
+        # An older database: usernames that differ only by case, no unique index yet
+        conn.execute('DROP INDEX idx_user_username_bidx')
+        for name in ("Johnny_Doe", "JOHNNY_DOE", "johnny_doe", "Johnny_4"):
+            conn.execute("INSERT INTO User (username, password_hash, first_name, last_name, registration_date, role) "
+                         "VALUES (?, 'x', ?, ?, '2024-01-01', ?)",
+                         (encrypt(name), encrypt("a"), encrypt("b"), encrypt("service_engineer")))
+        conn.execute('UPDATE User SET username_bidx = NULL')
+        conn.execute('PRAGMA user_version = 1')
+        conn.commit()
+
+    with get_connection(path) as conn:
+        assert migrate(conn, progress=lambda _: None) == SCHEMA_VERSION
+        names = [decrypt(row[0]) for row in conn.execute('SELECT username FROM User ORDER BY user_id')]
+        assert conn.execute('SELECT COUNT(*) FROM User WHERE username_bidx IS NULL').fetchone()[0] == 0
+    assert names[0] == "Johnny_Doe" and names[3] == "Johnny_4"      # the oldest keeps its name
+    assert len({name.lower() for name in names}) == len(names)
+    assert all(validate_username(name)[0] for name in names)
+
+
+def test_free_username_fits_the_username_rule():
+    taken = {"johnny_doe", "johnny_d_2"}
+    for old, user_id in (("JOHNNY_DOE", 2), ("JOHNNY_DOE", 123456789), ("ab", 5), ("x y-z!!long", 7)):
+        new = _free_username(old, user_id, taken)
+        assert validate_username(new)[0], new
+        assert new.lower() not in taken
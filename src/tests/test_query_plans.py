@@ -0,0 +1,19 @@
+# tests/test_query_plans.py
+"""The hot queries of benchmarks/check_query_plans.py must not scan whole tables."""
+import sqlite3
+import pytest
+from benchmarks.check_query_plans import HOT_QUERIES, full_scans
+from dbcontext.migrations import migrate
+
+
+@pytest.fixture(scope="module")
+def plan_db(tmp_path_factory):
+    conn = sqlite3.connect(str(tmp_path_factory.mktemp("plans") / "plans.db"))
+    migrate(conn, progress=lambda _: None)
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize("label, query, params, full_listing", HOT_QUERIES, ids=[q[0] for q in HOT_QUERIES])
+def test_hot_query_uses_an_index(plan_db, label, query, params, full_listing):
+    assert full_scans(plan_db, query, params, full_listing) == []
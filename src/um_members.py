@@ -1,5 +1,8 @@
 # um_members.py
 from dbcontext.dbcontext import create_db
+from dbcontext.key_rotation import resume_rotation
+from dbcontext import traveller_index
+from services.traveller_service import traveller_service
 from services.userservice import user_service
 from controllers.usercontroller import UserController
 from controllers.session_controller import session_controller
@@ -12,6 +15,11 @@ import sys
 def main():
     print("Urban Mobility System Starting...")
     create_db()
+    if not traveller_index.is_built():
+        print("Building the traveller search index...")
+        traveller_service.rebuild_search_index()
+    if resume_rotation():
+        print("Resuming an unfinished encryption key rotation in the background.")
     
     while True:
         # Login loop
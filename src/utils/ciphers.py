@@ -0,0 +1,157 @@
+# utils/ciphers.py
+"""
+Field cipher providers and the versioned ciphertext format.
+
+Raw layouts (stored raw or as base64url text, see config.CIPHERTEXT_STORAGE):
+  Fernet (legacy)  0x80 | timestamp(8) | iv(16) | AES-128-CBC ciphertext | HMAC-SHA256(32)
+  AES-GCM          header | nonce(12) | AES-256-GCM ciphertext | tag(16)
+  AES-SIV          header | synthetic iv(16) | AES-256-SIV ciphertext
+  Row key          0xA0 | nonce(12) | AES-256-GCM ciphertext | tag(16)
+
+The header byte is FORMAT_<cipher> << 4 | key_id, so the first byte alone
+tells which provider and which key decrypt a value. The header is
+authenticated as associated data, so it cannot be swapped. No first byte is
+a base64 character, which is how raw and text values are told apart.
+
+"Row key" values are AES-GCM under a record's own data key (envelope
+encryption, see dbcontext/data_keys.py) instead of a key ring key; the
+caller supplies that key, so the header carries no key id.
+
+AES-SIV is deterministic: under one key, equal plaintexts give equal
+ciphertexts. That is what lets SQLite compare, group and index a column, and
+also all it reveals, so it is only meant for low-cardinality columns
+(config.DETERMINISTIC_COLUMNS) where the set of values is public anyway.
+"""
+import base64
+import os
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, AESSIV
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives import hashes
+
+FERNET_VERSION = 0x80
+FORMAT_AESGCM = 0x1
+FORMAT_AESSIV = 0x9                  # 0x2-0x7 would make some headers base64 characters
+FORMAT_ROWKEY = 0xA
+MAX_KEY_ID = 0x0F
+NONCE_SIZE = 12
+ROW_KEY = "rowkey"                   # header_of() name of values under a record's data key
+_FERNET_TEXT_PREFIX = b"gA"          # base64url of the 0x80 version byte
+
+
+class CipherProvider:
+    """Encrypts and decrypts raw bytes in one of the layouts above."""
+    name = ""
+
+    def encrypt(self, plaintext: bytes) -> bytes:
+        raise NotImplementedError
+
+    def decrypt(self, raw: bytes) -> bytes:
+        """Raises cryptography.fernet.InvalidToken for a wrong key or tampered value."""
+        raise NotImplementedError
+
+
+class FernetCipher(CipherProvider):
+    """The original format; kept so existing values keep decrypting."""
+    name = "fernet"
+
+    def __init__(self, key: bytes):
+        self._fernet = Fernet(key)
+
+    def encrypt(self, plaintext: bytes) -> bytes:
+        return base64.urlsafe_b64decode(self._fernet.encrypt(plaintext))
+
+    def decrypt(self, raw: bytes) -> bytes:
+        return self._fernet.decrypt(base64.urlsafe_b64encode(raw))
+
+    def decrypt_text(self, token: bytes) -> bytes:
+        """Decrypt a base64url Fernet token without decoding it first."""
+        return self._fernet.decrypt(token)
+
+
+class AesGcmCipher(CipherProvider):
+    """AES-256-GCM with a random 96-bit nonce and a one-byte version/key-id header."""
+    name = "aesgcm"
+
+    def __init__(self, key: bytes, key_id: int = 0, fmt: int = FORMAT_AESGCM):
+        if not 0 <= key_id <= MAX_KEY_ID:
+            raise ValueError(f"key_id must be 0-{MAX_KEY_ID}")
+        self.key_id = key_id
+        self.header = bytes([fmt << 4 | key_id])
+        self._aead = AESGCM(key)
+
+    def encrypt(self, plaintext: bytes) -> bytes:
+        nonce = os.urandom(NONCE_SIZE)
+        return self.header + nonce + self._aead.encrypt(nonce, plaintext, self.header)
+
+    def decrypt(self, raw: bytes) -> bytes:
+        try:
+            return self._aead.decrypt(raw[1:1 + NONCE_SIZE], raw[1 + NONCE_SIZE:], raw[:1])
+        except InvalidTag:
+            raise InvalidToken
+
+
+class AesSivCipher(CipherProvider):
+    """Deterministic AES-256-SIV (RFC 5297) with the same one-byte header."""
+    name = "aessiv"
+
+    def __init__(self, key: bytes, key_id: int = 0):
+        if not 0 <= key_id <= MAX_KEY_ID:
+            raise ValueError(f"key_id must be 0-{MAX_KEY_ID}")
+        self.key_id = key_id
+        self.header = bytes([FORMAT_AESSIV << 4 | key_id])
+        self._aead = AESSIV(key)          # 64-byte key: two AES-256 keys
+
+    def encrypt(self, plaintext: bytes) -> bytes:
+        return self.header + self._aead.encrypt(plaintext, [self.header])
+
+    def decrypt(self, raw: bytes) -> bytes:
+        try:
+            return self._aead.decrypt(raw[1:], [raw[:1]])
+        except InvalidTag:
+            raise InvalidToken
+
+
+def row_key_cipher(data_key: bytes) -> AesGcmCipher:
+    """The provider of the values encrypted with one record's data key."""
+    return AesGcmCipher(data_key, fmt=FORMAT_ROWKEY)
+
+
+def derive_key(master_key: bytes, purpose: str, length: int = 32) -> bytes:
+    """A subkey (256 bits by default) of `master_key` for one purpose (HKDF-SHA256)."""
+    return HKDF(algorithm=hashes.SHA256(), length=length, salt=None,
+                info=f"urban-mobility:{purpose}".encode()).derive(master_key)
+
+
+def is_raw(token: bytes) -> bool:
+    """True for raw ciphertext, False for its base64url text form."""
+    return token[0] == FERNET_VERSION or token[0] >> 4 in (FORMAT_AESGCM, FORMAT_AESSIV, FORMAT_ROWKEY)
+
+
+def is_fernet_text(token: bytes) -> bool:
+    return token.startswith(_FERNET_TEXT_PREFIX)
+
+
+def to_raw(token) -> bytes:
+    """Raw ciphertext of a stored value, which may be raw bytes or base64url text."""
+    if isinstance(token, str):
+        token = token.encode()
+    return token if is_raw(token) else base64.urlsafe_b64decode(token)
+
+
+def to_text(raw: bytes) -> bytes:
+    return base64.urlsafe_b64encode(raw)
+
+
+def header_of(raw: bytes) -> tuple[str, int | None]:
+    """(provider name, key id) of a raw value; key id is None for Fernet."""
+    if raw[0] == FERNET_VERSION:
+        return FernetCipher.name, None
+    if raw[0] >> 4 == FORMAT_AESGCM:
+        return AesGcmCipher.name, raw[0] & MAX_KEY_ID
+    if raw[0] >> 4 == FORMAT_AESSIV:
+        return AesSivCipher.name, raw[0] & MAX_KEY_ID
+    if raw[0] == FORMAT_ROWKEY << 4:
+        return ROW_KEY, None
+    raise InvalidToken
@@ -1,27 +1,537 @@
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, InvalidToken
 import bcrypt
+import hashlib
+import hmac
+import atexit
+import base64
+import binascii
+import json
 import os
+import secrets
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from config import (
+    BLIND_INDEX_KEY_FILE, DECRYPT_CACHE_ENABLED, DECRYPT_CACHE_MAX_ENTRIES, DECRYPT_CACHE_MAX_BYTES,
+    CRYPTO_WORKERS, CRYPTO_EXECUTOR, CRYPTO_CHUNK_SIZE, FIELD_CIPHER, KEYRING_FILE, CIPHERTEXT_STORAGE,
+    DETERMINISTIC_COLUMNS
+)
+from utils.ciphers import (
+    CipherProvider, FernetCipher, AesGcmCipher, AesSivCipher, derive_key, header_of, is_fernet_text, is_raw, to_raw, to_text,
+    row_key_cipher, MAX_KEY_ID, ROW_KEY
+)
 
-# Singleton pattern for Fernet instance
+# Singleton pattern for the keys and the cipher providers built from them
 _fernet = None
+_fernet_key = None
+_keyring: dict | None = None   # {"active": key id, "keys": {key id: key}}, see _load_keyring()
+_ciphers: dict | None = None   # (provider name, key id or None) -> CipherProvider
+# Separate HMAC key for blind indexes (never the Fernet key)
+_blind_index_key = None
 
 def get_fernet():
-    global _fernet
+    global _fernet, _fernet_key
     if _fernet is None:
         with open("secret.key", "rb") as key_file:
             key = key_file.read()
         _fernet = Fernet(key)
+        _fernet_key = key
     return _fernet
 
+def _load_keyring() -> dict:
+    global _keyring
+    if _keyring is None:
+        keyring = {"active": 0, "keys": {}}
+        if os.path.exists(KEYRING_FILE):
+            with open(KEYRING_FILE, "r") as f:
+                stored = json.load(f)
+            keyring = {
+                "active": int(stored["active"]),
+                "keys": {int(key_id): base64.b64decode(key) for key_id, key in stored["keys"].items()},
+            }
+        _keyring = keyring
+    return _keyring
+
+def _save_keyring(keyring: dict) -> None:
+    """Atomically replace the key ring file (write temp file, then rename)."""
+    tmp_path = KEYRING_FILE + ".tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump({
+            "active": keyring["active"],
+            "keys": {str(key_id): base64.b64encode(key).decode() for key_id, key in keyring["keys"].items()},
+        }, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, KEYRING_FILE)
+
+def _get_ciphers() -> dict:
+    global _ciphers
+    if _ciphers is None:
+        get_fernet()
+        ciphers = {(FernetCipher.name, None): FernetCipher(_fernet_key)}
+        # Key id 0 is derived from secret.key, so no extra key file is needed
+        keys = {0: derive_key(_fernet_key, "field-cipher:aesgcm"), **_load_keyring()["keys"]}
+        for key_id, key in keys.items():
+            ciphers[(AesGcmCipher.name, key_id)] = AesGcmCipher(key, key_id=key_id)
+            ciphers[(AesSivCipher.name, key_id)] = AesSivCipher(
+                derive_key(key, "field-cipher:aessiv", length=64), key_id=key_id)
+        _ciphers = ciphers
+    return _ciphers
+
+def get_cipher() -> CipherProvider:
+    """The provider new values are encrypted with (FIELD_CIPHER, with the active key)."""
+    ciphers = _get_ciphers()
+    if FIELD_CIPHER == FernetCipher.name:
+        return ciphers[(FernetCipher.name, None)]
+    if FIELD_CIPHER == AesGcmCipher.name:
+        return ciphers[(AesGcmCipher.name, active_key_id())]
+    raise ValueError(f"Unknown field cipher: {FIELD_CIPHER}")
+
+def get_deterministic_cipher() -> AesSivCipher:
+    """The provider of the deterministic columns, with the active key."""
+    return _get_ciphers()[(AesSivCipher.name, active_key_id())]
+
+def is_deterministic(table: str, column: str) -> bool:
+    """True if `table`.`column` is stored with deterministic encryption (config.DETERMINISTIC_COLUMNS)."""
+    return column in DETERMINISTIC_COLUMNS.get(table, ())
+
+def active_key_id() -> int:
+    """Id of the AES-GCM key new values are written with."""
+    return _load_keyring()["active"]
+
+def key_ids() -> list[int]:
+    """Every AES-GCM key id that can still be decrypted (0 is always present)."""
+    return sorted(key_id for name, key_id in _get_ciphers() if name == AesGcmCipher.name)
+
+def rotate_key() -> int:
+    """
+    Add a fresh random AES-GCM key to the key ring and make it the active one.
+    New values use it at once; existing ones keep their key until they are
+    re-encrypted (see dbcontext/key_rotation.py). Returns the new key id.
+    """
+    keyring = _load_keyring()
+    free = [key_id for key_id in range(1, MAX_KEY_ID + 1) if key_id not in keyring["keys"]]
+    if not free:
+        raise ValueError("The key ring is full, retire an old key first.")
+    new_keyring = {"active": free[0], "keys": {**keyring["keys"], free[0]: secrets.token_bytes(32)}}
+    _save_keyring(new_keyring)
+    reload_key()
+    return free[0]
+
+def retire_key(key_id: int) -> None:
+    """
+    Remove a key from the key ring. Only safe once no stored value (including
+    those in old backups that may still be restored) is encrypted with it.
+    """
+    keyring = _load_keyring()
+    if key_id == keyring["active"]:
+        raise ValueError("The active key cannot be retired.")
+    if key_id not in keyring["keys"]:
+        raise ValueError(f"Key {key_id} is not in the key ring.")
+    keys = {k: v for k, v in keyring["keys"].items() if k != key_id}
+    _save_keyring({"active": keyring["active"], "keys": keys})
+    reload_key()
+
+def is_current(token, deterministic: bool = False) -> bool:
+    """True if `token` is already in the format (and key) new values are written with."""
+    cipher = get_deterministic_cipher() if deterministic else get_cipher()
+    name, key_id = header_of(to_raw(token))
+    return name == cipher.name and key_id == getattr(cipher, "key_id", None)
+
+def _stored(raw: bytes, text: bool = False) -> bytes:
+    """Raw ciphertext in the form it is stored in (CIPHERTEXT_STORAGE, or text for line-based files)."""
+    if text or CIPHERTEXT_STORAGE == "text":
+        return to_text(raw)
+    if CIPHERTEXT_STORAGE == "binary":
+        return raw
+    raise ValueError(f"Unknown ciphertext storage: {CIPHERTEXT_STORAGE}")
+
+def to_storage(token, text: bool = False):
+    """
+    `token` re-encoded into the form new values are stored in, or None when it
+    already has that form. Only the encoding changes, nothing is decrypted.
+    """
+    if token is None:
+        return None
+    if isinstance(token, str):
+        token = token.encode()    # TEXT values written by older versions
+    elif is_raw(token) == (not text and CIPHERTEXT_STORAGE == "binary"):
+        return None
+    return _stored(to_raw(token), text)
+
+def reencrypt(token, text: bool = False, deterministic: bool = False):
+    """
+    `token` re-encrypted with the current cipher (and in the current storage
+    form), or None when it already is current. Pass text=True for values kept
+    in line-based files, which always use the text form, and deterministic=True
+    for the columns of config.DETERMINISTIC_COLUMNS.
+    """
+    if token is None:
+        return None
+    if is_current(token, deterministic) or header_of(to_raw(token))[0] == ROW_KEY:
+        # A value under a record's data key does not depend on the key ring
+        # (rotation rewraps the data key instead, see dbcontext/data_keys.py)
+        return to_storage(token, text)
+    cipher = get_deterministic_cipher() if deterministic else get_cipher()
+    return _stored(cipher.encrypt(_decrypt_token(token).encode()), text)
+
+def reload_key():
+    """Forget the loaded keys (and every plaintext cached under them)."""
+    global _fernet, _fernet_key, _keyring, _ciphers
+    _fernet = None
+    _fernet_key = None
+    _keyring = None
+    _ciphers = None
+    clear_decrypt_cache()
+    shutdown_crypto_workers()  # worker processes hold the old key
+
 def encrypt(data: str) -> bytes:
     if data is None:
         return None
-    return get_fernet().encrypt(data.encode())
+    return _stored(get_cipher().encrypt(data.encode()))
+
+def encrypt_deterministic(data: str) -> bytes:
+    """
+    Encrypt so that equal values give equal ciphertext (AES-SIV), for the
+    low-cardinality columns of config.DETERMINISTIC_COLUMNS. Query them with
+    deterministic_tokens().
+    """
+    if data is None:
+        return None
+    return _stored(get_deterministic_cipher().encrypt(data.encode()))
+
+def encrypt_field(table: str, column: str, data: str, data_key: bytes = None) -> bytes:
+    """
+    Encrypt a value for `table`.`column`: deterministically if the column is
+    configured so, otherwise with the record's data key when it has one.
+    """
+    if is_deterministic(table, column):
+        return encrypt_deterministic(data)
+    if data_key is not None:
+        return encrypt_with_data_key(data_key, data)
+    return encrypt(data)
+
+def encrypt_with_data_key(data_key: bytes, data: str) -> bytes:
+    """Encrypt with one record's own data key (envelope encryption)."""
+    if data is None:
+        return None
+    return _stored(row_key_cipher(data_key).encrypt(data.encode()))
+
+def generate_data_key() -> bytes:
+    """A fresh random 256-bit data key for one record."""
+    return secrets.token_bytes(32)
+
+def wrap_key(data_key: bytes) -> bytes:
+    """`data_key` encrypted (raw AES-GCM) with the active key ring key."""
+    return _get_ciphers()[(AesGcmCipher.name, active_key_id())].encrypt(data_key)
+
+def unwrap_key(wrapped: bytes) -> bytes:
+    """The data key inside a wrap_key() value; InvalidToken for an unknown or retired key."""
+    name, key_id = header_of(wrapped)
+    cipher = _get_ciphers().get((name, key_id)) if name == AesGcmCipher.name else None
+    if cipher is None:
+        raise InvalidToken
+    return cipher.decrypt(wrapped)
+
+def rewrap_key(wrapped: bytes):
+    """`wrapped` rewrapped with the active key, or None when it already uses it."""
+    if header_of(wrapped)[1] == active_key_id():
+        return None
+    return wrap_key(unwrap_key(wrapped))
+
+def deterministic_tokens(data: str) -> list[bytes]:
+    """
+    Every stored form of `data` in a deterministic column: one per key id, since
+    rows keep their older key until a key rotation has re-encrypted them.
+    Use as `WHERE column IN (...)`.
+    """
+    return [_stored(cipher.encrypt(data.encode()))
+            for (name, _key_id), cipher in _get_ciphers().items() if name == AesSivCipher.name]
+
+def encrypt_text(data: str) -> bytes:
+    """Like encrypt(), but always base64url text (for line-based files such as the log)."""
+    if data is None:
+        return None
+    return to_text(get_cipher().encrypt(data.encode()))
+
+def _decrypt_token(token, data_key: bytes = None) -> str:
+    """Decrypt a stored value of any supported format (`data_key`: the record's own key, if any)."""
+    if isinstance(token, str):
+        token = token.encode()
+    ciphers = _get_ciphers()
+    if is_fernet_text(token):
+        return ciphers[(FernetCipher.name, None)].decrypt_text(token).decode()
+    try:
+        raw = to_raw(token)
+    except (binascii.Error, IndexError, ValueError):
+        raise InvalidToken
+    header = header_of(raw)
+    if header[0] == ROW_KEY:
+        if data_key is None:
+            raise InvalidToken        # the record's data key is missing (erased)
+        return row_key_cipher(data_key).decrypt(raw).decode()
+    cipher = ciphers.get(header)
+    if cipher is None:
+        raise InvalidToken            # encrypted with a retired or unknown key
+    return cipher.decrypt(raw).decode()
 
-def decrypt(token: bytes) -> str:
+def decrypt(token: bytes, data_key: bytes = None) -> str:
     if token is None:
         return None
-    return get_fernet().decrypt(token).decode()
+    if not _decrypt_cache.enabled:
+        return _decrypt_token(token, data_key)
+    key = _decrypt_cache.key(token, data_key)
+    value = _decrypt_cache.get(key)
+    if value is None:
+        value = _decrypt_token(token, data_key)
+        _decrypt_cache.put(key, value)
+    return value
+
+
+class _DecryptCache:
+    """
+    Bounded LRU map of token digest -> plaintext. Keyed by a digest so the
+    (long) tokens themselves are not kept; a Fernet token is never reused,
+    so equal digests mean the same ciphertext. The digest of a token read
+    with a record data key is keyed with that data key, so the plaintext of
+    a row-key token is only found again by a caller holding its key.
+    """
+    _ENTRY_OVERHEAD = 100  # bytes per entry for the key, the node and the dict slot
+
+    def __init__(self, enabled: bool, max_entries: int, max_bytes: int):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[bytes, str] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    @staticmethod
+    def key(token, data_key: bytes = None) -> bytes:
+        if isinstance(token, str):
+            token = token.encode()
+        return hashlib.blake2b(token, digest_size=16, key=data_key or b"").digest()
+
+    def _size(self, value: str) -> int:
+        return sys.getsizeof(value) + self._ENTRY_OVERHEAD
+
+    def get(self, key: bytes):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: bytes, value: str) -> None:
+        size = self._size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= self._size(old)
+            self._entries[key] = value
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= self._size(evicted)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_decrypt_cache = _DecryptCache(DECRYPT_CACHE_ENABLED, DECRYPT_CACHE_MAX_ENTRIES, DECRYPT_CACHE_MAX_BYTES)
+
+def configure_decrypt_cache(enabled: bool = None, max_entries: int = None, max_bytes: int = None):
+    """Change the decrypt cache settings at runtime (the cache is emptied)."""
+    if enabled is not None:
+        _decrypt_cache.enabled = enabled
+    if max_entries is not None:
+        _decrypt_cache.max_entries = max_entries
+    if max_bytes is not None:
+        _decrypt_cache.max_bytes = max_bytes
+    clear_decrypt_cache()
+
+def clear_decrypt_cache():
+    """Drop every cached plaintext (counters are kept)."""
+    _decrypt_cache.clear()
+
+def decrypt_cache_stats() -> dict:
+    """Size, limits, hit/miss/eviction counters and hit rate of the decrypt cache."""
+    return _decrypt_cache.stats()
+
+
+# ------------------------------------------------------------------
+#   Batch API: decrypt_many / encrypt_many
+# ------------------------------------------------------------------
+_executors: dict[tuple[str, int], object] = {}
+_executors_lock = threading.Lock()
+
+def _init_worker(key: bytes, keyring: dict):
+    """Process pool initializer: use the parent's keys instead of re-reading the key files."""
+    global _fernet, _fernet_key, _keyring, _ciphers
+    _fernet = Fernet(key)
+    _fernet_key = key
+    _keyring = keyring
+    _ciphers = None
+
+def _decrypt_chunk(items: list) -> list[tuple]:
+    """(plaintext, error) per (token, data key); runs inline, on a thread or in a worker process."""
+    results = []
+    for token, data_key in items:
+        if token is None:
+            results.append((None, None))
+            continue
+        try:
+            results.append((_decrypt_token(token, data_key), None))
+        except Exception as e:
+            results.append((None, e))
+    return results
+
+def _encrypt_chunk(values: list) -> list[tuple]:
+    cipher = get_cipher()
+    results = []
+    for value in values:
+        if value is None:
+            results.append((None, None))
+            continue
+        try:
+            results.append((_stored(cipher.encrypt(value.encode())), None))
+        except Exception as e:
+            results.append((None, e))
+    return results
+
+def _get_executor(kind: str, workers: int):
+    if kind not in ("process", "thread"):
+        raise ValueError(f"Unknown crypto executor: {kind}")
+    with _executors_lock:
+        executor = _executors.get((kind, workers))
+        if executor is None:
+            if kind == "process":
+                get_fernet()
+                executor = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(_fernet_key, _load_keyring()))
+            else:
+                executor = ThreadPoolExecutor(workers, thread_name_prefix="crypto")
+            _executors[(kind, workers)] = executor
+    return executor
+
+def shutdown_crypto_workers():
+    """Stop the worker pools of the batch API (they are recreated on demand)."""
+    with _executors_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=True)
+
+atexit.register(shutdown_crypto_workers)
+
+def _run_chunked(fn, items: list, workers: int, executor: str, chunk_size: int) -> list[tuple]:
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    if workers <= 1 or len(chunks) <= 1:
+        return [result for chunk in chunks for result in fn(chunk)]
+    # map() keeps the input order
+    pool = _get_executor(executor, workers)
+    return [result for chunk_results in pool.map(fn, chunks) for result in chunk_results]
+
+def _split(results: list[tuple]) -> tuple[list, dict]:
+    values, errors = [], {}
+    for index, (value, error) in enumerate(results):
+        values.append(value)
+        if error is not None:
+            errors[index] = error
+    return values, errors
+
+def decrypt_many(tokens, workers: int = CRYPTO_WORKERS, executor: str = CRYPTO_EXECUTOR,
+                 chunk_size: int = CRYPTO_CHUNK_SIZE, data_keys=None) -> tuple[list, dict]:
+    """
+    Decrypt a batch of tokens, in chunks spread over `workers` processes or threads.
+    `data_keys`, if given, holds the record data key (or None) of each token.
+
+    Returns (values, errors): values[i] is the plaintext of tokens[i] (None for
+    a None token or a failed one) and errors maps the index of every token that
+    could not be decrypted to its exception, so one corrupted row does not stop
+    the batch. Uses and fills the decrypt cache when it is enabled.
+    """
+    tokens = list(tokens)
+    items = list(zip(tokens, data_keys if data_keys is not None else [None] * len(tokens)))
+    if not _decrypt_cache.enabled:
+        return _split(_run_chunked(_decrypt_chunk, items, workers, executor, chunk_size))
+
+    values: list = [None] * len(tokens)
+    keys: list = [None] * len(tokens)
+    pending = []                          # indexes that still need decrypting
+    for index, token in enumerate(tokens):
+        if token is None:
+            continue
+        keys[index] = _decrypt_cache.key(token, items[index][1])
+        value = _decrypt_cache.get(keys[index])
+        if value is None:
+            pending.append(index)
+        else:
+            values[index] = value
+    results = _run_chunked(_decrypt_chunk, [items[i] for i in pending], workers, executor, chunk_size)
+    errors = {}
+    for index, (value, error) in zip(pending, results):
+        if error is None:
+            values[index] = value
+            _decrypt_cache.put(keys[index], value)
+        else:
+            errors[index] = error
+    return values, errors
+
+def encrypt_many(values, workers: int = CRYPTO_WORKERS, executor: str = CRYPTO_EXECUTOR,
+                 chunk_size: int = CRYPTO_CHUNK_SIZE) -> tuple[list, dict]:
+    """Encrypt a batch of strings, like decrypt_many. Returns (tokens, errors by index)."""
+    return _split(_run_chunked(_encrypt_chunk, list(values), workers, executor, chunk_size))
+
+def get_blind_index_key() -> bytes:
+    """Load the blind index key, creating it on first use."""
+    global _blind_index_key
+    if _blind_index_key is None:
+        if not os.path.exists(BLIND_INDEX_KEY_FILE):
+            try:
+                with open(BLIND_INDEX_KEY_FILE, "xb") as key_file:
+                    key_file.write(secrets.token_bytes(32))
+            except FileExistsError:
+                pass  # Created concurrently, just read it
+        with open(BLIND_INDEX_KEY_FILE, "rb") as key_file:
+            _blind_index_key = key_file.read()
+    return _blind_index_key
+
+def blind_index(value: str, purpose: str) -> str:
+    """
+    Deterministic keyed hash of a plaintext value, used to look up encrypted
+    columns by equality without decrypting them. `purpose` separates the
+    hashes of different columns so equal values do not link across tables.
+    """
+    if value is None:
+        return None
+    message = f"{purpose}:{value}".encode()
+    return hmac.new(get_blind_index_key(), message, hashlib.sha256).hexdigest()
 
 def hash_password(password: str) -> bytes:
     return bcrypt.hashpw(password.encode(), bcrypt.gensalt())
@@ -36,11 +36,12 @@ def require_role(*required_roles):
             
             # Import user_service here to avoid circular imports
             from services.userservice import user_service
-            user = user_service.get_user_by_id(user_id)
-            if not user:
+            # Cached principal: no User object, no decryption after the first check
+            principal = user_service.get_principal(user_id)
+            if not principal:
                 return False, "User not found."
             
-            user_role = user.role_plain
+            user_role = principal.role
             # Exact match: only listed roles can access
             if user_role in required_roles:
                 return func(user_id, *args, **kwargs)
@@ -0,0 +1,111 @@
+# utils/search_index.py
+"""
+Keyed trigram index for substring search over encrypted columns.
+
+Every searchable value is split into trigrams and each trigram is stored as a
+truncated HMAC (see crypto_utils.blind_index), so no plaintext reaches disk.
+A search only decrypts the rows whose tokens contain all trigrams of the
+search term; the caller still verifies the plaintext, so results stay exact.
+
+The functions work on a cursor of whichever file holds a table's tokens:
+the database for Scooter, the separate store of dbcontext/traveller_index.py
+for Traveller, which keeps them out of backups.
+"""
+from utils.crypto_utils import blind_index
+
+# table -> (id column, searchable encrypted columns)
+INDEXED_FIELDS = {
+    "Scooter": ("scooter_id", ("brand", "model", "serial_number")),
+    "Traveller": ("traveller_id", (
+        "first_name", "last_name", "birthday", "gender", "street_name",
+        "house_number", "zip_code", "city", "email", "mobile_phone",
+        "driving_license_no",
+    )),
+}
+
+GRAM_SIZE = 3
+TOKEN_LENGTH = 16  # hex chars kept from the HMAC (64 bits, false positives are filtered anyway)
+_ID_CHUNK = 500    # stay well below SQLite's bound-variable limit
+SCAN_BATCH_SIZE = 1000  # rows fetched (and decrypted together) per step of a scan
+
+
+def trigrams(value: str) -> set[str]:
+    """All distinct substrings of length GRAM_SIZE (case-sensitive, like the search)."""
+    if not value or len(value) < GRAM_SIZE:
+        return set()
+    return {value[i:i + GRAM_SIZE] for i in range(len(value) - GRAM_SIZE + 1)}
+
+
+def _token(table: str, field: str, gram: str) -> str:
+    return blind_index(gram, f"trigram:{table}.{field}")[:TOKEN_LENGTH]
+
+
+def index_row(cursor, table: str, row_id: int, fields: dict) -> None:
+    """(Re)index the given plaintext fields of one row."""
+    for field, value in fields.items():
+        cursor.execute(
+            'DELETE FROM SearchIndex WHERE table_name = ? AND row_id = ? AND field = ?',
+            (table, row_id, field)
+        )
+        cursor.executemany(
+            'INSERT OR IGNORE INTO SearchIndex (table_name, field, token, row_id) VALUES (?, ?, ?, ?)',
+            [(table, field, _token(table, field, gram), row_id) for gram in trigrams(value)]
+        )
+
+
+def remove_row(cursor, table: str, row_id: int) -> None:
+    """Drop every token of a deleted row."""
+    cursor.execute('DELETE FROM SearchIndex WHERE table_name = ? AND row_id = ?', (table, row_id))
+
+
+def candidate_ids(cursor, table: str, field: str, term: str):
+    """
+    Ids of rows whose field may contain `term`, in id order.
+    Returns None when the term is too short to use the index.
+    """
+    grams = trigrams(term)
+    if not grams:
+        return None
+    tokens = [_token(table, field, gram) for gram in grams]
+    placeholders = ','.join(['?'] * len(tokens))
+    cursor.execute(f'''
+        SELECT row_id FROM SearchIndex
+        WHERE table_name = ? AND field = ? AND token IN ({placeholders})
+        GROUP BY row_id
+        HAVING COUNT(*) = ?
+        ORDER BY row_id
+    ''', (table, field, *tokens, len(tokens)))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def iter_candidate_batches(cursor, table: str, field: str, term: str, batch_size: int = SCAN_BATCH_SIZE,
+                           extra_columns: tuple = (), index_cursor=None):
+    """
+    Yield lists of (id, encrypted value, *extra_columns) rows that may match `term`, in id order.
+    Uses the index when possible and falls back to a full column scan otherwise;
+    rows are streamed with fetchmany, so a scan never holds the whole column.
+    Pass `index_cursor` when the tokens are not in the database of `cursor`.
+    """
+    id_column, fields = INDEXED_FIELDS[table]
+    if field not in fields:
+        raise ValueError(f"{table}.{field} is not indexed")
+
+    columns = ", ".join((id_column, field, *extra_columns))
+    ids = candidate_ids(index_cursor or cursor, table, field, term)
+    if ids is None:
+        cursor.execute(f'SELECT {columns} FROM {table} WHERE {field} IS NOT NULL ORDER BY {id_column}')
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield rows
+
+    for start in range(0, len(ids), _ID_CHUNK):
+        chunk = ids[start:start + _ID_CHUNK]
+        placeholders = ','.join(['?'] * len(chunk))
+        cursor.execute(f'''
+            SELECT {columns} FROM {table}
+            WHERE {id_column} IN ({placeholders}) AND {field} IS NOT NULL
+            ORDER BY {id_column}
+        ''', chunk)
+        yield cursor.fetchall()